@@ -1,31 +1,78 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import os
 from dotenv import load_dotenv
+import cache
+import database
 
 load_dotenv()
 
 SECRET_KEY = os.getenv("SECRET_KEY", "niagataergtujxekam")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Raising BCRYPT_ROUNDS makes existing hashes get rehashed on the next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Hash jobs allowed to run or wait at once; beyond that requests get 503
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# For endpoints that also serve anonymous visitors
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
+# Upper bound on how long another worker may keep honouring a ban/unban or admin change
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+
+# bcrypt releases the GIL, so a thread pool keeps it off the event loop
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+hash_stats = {"pending": 0, "completed": 0, "failed": 0, "rejected": 0}
+
+
+async def _run_hash_job(func, *args):
+    if hash_stats["pending"] >= PASSWORD_HASH_MAX_PENDING:
+        hash_stats["rejected"] += 1
+        raise HTTPException(status_code=503, detail="服务器繁忙，请稍后重试", headers={"Retry-After": "5"})
+    hash_stats["pending"] += 1
+    try:
+        result = await asyncio.get_running_loop().run_in_executor(_hash_executor, func, *args)
+    except Exception:
+        hash_stats["failed"] += 1
+        raise
+    finally:
+        hash_stats["pending"] -= 1
+    hash_stats["completed"] += 1
+    return result
+
+
+def get_hash_stats() -> dict:
+    return {
+        **hash_stats,
+        "workers": PASSWORD_HASH_WORKERS,
+        "max_pending": PASSWORD_HASH_MAX_PENDING,
+        "bcrypt_rounds": BCRYPT_ROUNDS
+    }
 
 # 验证
 
 
-def verify_password(plain_password, hashed_password) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password, hashed_password) -> tuple[bool, str | None]:
+    """Return (valid, new_hash); new_hash is set when the stored hash uses outdated parameters."""
+    return await _run_hash_job(pwd_context.verify_and_update, plain_password, hashed_password)
 
 # 加密
 
 
-def get_hashed_password(plain_password) -> str:
-    return pwd_context.hash(plain_password)
+async def get_hashed_password(plain_password) -> str:
+    return await _run_hash_job(pwd_context.hash, plain_password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -39,7 +86,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+def decode_access_token(token: str) -> str:
+    """Return the user email in the token, or raise 401."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -52,4 +100,54 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    return email
\ No newline at end of file
+    return email
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    return decode_access_token(token)
+
+
+async def get_optional_user(token: str | None = Depends(optional_oauth2_scheme)) -> str | None:
+    """The current user's email, or None when no token was sent."""
+    return decode_access_token(token) if token else None
+
+
+@dataclass(frozen=True)
+class Principal:
+    """The flags of the current user that permission checks need."""
+    user_email: str
+    user_name: str
+    is_admin: bool
+    is_banned: bool
+
+
+principal_cache = cache.TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+
+
+async def get_current_principal(
+    current_user_email: str = Depends(get_current_user),
+    db: AsyncSession = Depends(database.get_read_db)
+) -> Principal:
+    return await load_principal(db, current_user_email)
+
+
+async def load_principal(db: AsyncSession, current_user_email: str) -> Principal:
+    """
+    Resolve the user's flags, cached for PRINCIPAL_CACHE_TTL seconds.
+    Writes in this worker call invalidate_principal; other workers see them
+    once their cached entry expires.
+    """
+    principal = principal_cache.get(current_user_email)
+    if principal is None:
+        row = (await db.execute(select(
+            database.User.user_name, database.User.is_admin, database.User.is_banned
+        ).where(database.User.user_email == current_user_email))).first()
+        if row is None:
+            raise HTTPException(status_code=400, detail="User not found")
+        principal = Principal(current_user_email, row.user_name, bool(row.is_admin), bool(row.is_banned))
+        principal_cache.set(current_user_email, principal)
+    return principal
+
+
+def invalidate_principal(user_email: str):
+    principal_cache.pop(user_email)
@@ -0,0 +1,42 @@
+"""
+Periodic background jobs run inside each worker's event loop.
+main.lifespan starts them through start_periodic and calls shutdown on exit.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+_jobs: list[tuple[asyncio.Task, Callable[[], Awaitable[None]], bool]] = []
+
+
+async def _run(interval: float, job: Callable[[], Awaitable[None]]):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await job()
+        except Exception:
+            logger.exception("Background job %s failed", job.__qualname__)
+
+
+def start_periodic(interval: float, job: Callable[[], Awaitable[None]], run_on_shutdown: bool = False):
+    """Run job every interval seconds; run_on_shutdown runs it once more when the worker stops."""
+    task = asyncio.create_task(_run(interval, job))
+    _jobs.append((task, job, run_on_shutdown))
+
+
+async def shutdown():
+    for task, _, _ in _jobs:
+        task.cancel()
+    for task, job, run_on_shutdown in _jobs:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        if run_on_shutdown:
+            try:
+                await job()
+            except Exception:
+                logger.exception("Background job %s failed on shutdown", job.__qualname__)
+    _jobs.clear()
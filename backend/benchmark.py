@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Load benchmarks against the HTTP API.
+
+    python benchmark.py reads                        # seeded temporary SQLite database, 1 worker
+    python benchmark.py reads --workers 2 --concurrency 64 --requests 4000
+    python benchmark.py reads --url http://127.0.0.1:8000
+    VOTE_WRITE_BEHIND=1 python benchmark.py votes
+    SQLITE_WAL=0 python benchmark.py mixed --workers 2
+    python benchmark.py stream --workers 2 --streams 2000
+
+Without --url the script starts uvicorn on a free port with DATABASE_URL
+pointing at a new temporary SQLite file, seeds it through the API and stops
+the server afterwards. Other settings (VOTE_WRITE_BEHIND, SQLITE_WAL, ...)
+are taken from the environment, so two configurations are compared by
+running the script twice. --url targets a server that is already running,
+e.g. an older checkout, which must be seeded empty or by an earlier run.
+
+Scenarios:
+    reads   feed pages, post details and keyword searches; concurrent
+            requests per worker, the number the async database layer raised
+    votes   vote toggles by many users on one hot post; run with
+            VOTE_WRITE_BEHIND=0 and =1 to compare direct and buffered votes/sec
+    mixed   60% reads, 30% votes and 10% new comments; run with SQLITE_WAL=0
+            and =1 to compare throughput and "database is locked" 5xx errors
+    stream  --streams idle /notifications/stream connections per worker plus
+            --over-cap more, held for --hold seconds; the started server gets
+            NOTIFICATION_STREAM_MAX_CONNECTIONS=--streams and a --heartbeat
+            interval. Reports server memory per stream (Linux, started server
+            only), streams that missed a heartbeat and how many were refused
+            with 503
+
+Prints throughput, latency percentiles and the count of each status code.
+Only the standard library is used on the client side.
+"""
+import argparse
+import asyncio
+import glob
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+PASSWORD = "bench123"
+VOTERS = 20
+
+
+class Api:
+    """Minimal JSON client with one keep-alive connection per thread."""
+
+    def __init__(self, base_url: str, timeout: float = 30):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        if getattr(self.local, "conn", None) is None:
+            self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return self.local.conn
+
+    def request(self, method: str, path: str, body=None, token: str | None = None, form: dict | None = None):
+        headers = {}
+        payload = None
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        if form is not None:
+            payload = urllib.parse.urlencode(form)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        elif body is not None:
+            payload = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                response = conn.getresponse()
+                raw = response.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # The server closed an idle keep-alive connection: reconnect once
+                conn.close()
+                self.local.conn = None
+                if attempt:
+                    raise
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                self.local.conn = None
+                raise
+        data = None
+        if raw and response.getheader("Content-Type", "").startswith("application/json"):
+            data = json.loads(raw)
+        return response.status, data
+
+    def user(self, index: int) -> str:
+        """Register bench<index>@example.com if needed and return a token."""
+        email = f"bench{index}@example.com"
+        self.request("POST", "/register", {"user_name": f"压测{index}", "user_email": email, "password": PASSWORD})
+        status, data = self.request("POST", "/token", form={"username": email, "password": PASSWORD})
+        if status != 200:
+            raise SystemExit(f"login of {email} failed with {status}: {data}")
+        return data["access_token"]
+
+
+# --- Server ---
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers: int, env: dict | None = None) -> tuple[subprocess.Popen, str, str]:
+    """Start uvicorn on a fresh SQLite database; returns the process, base URL and database path."""
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    port = _free_port()
+    server_env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "AUTO_MIGRATE": "1",
+        **(env or {}),
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=server_env
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("uvicorn exited during startup")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                break
+        except OSError:
+            time.sleep(0.2)
+    else:
+        process.terminate()
+        raise SystemExit("uvicorn did not start within 60s")
+    return process, base_url, db_path
+
+
+def stop_server(process: subprocess.Popen):
+    """Stop uvicorn gracefully, so shutdown jobs such as buffer flushes run."""
+    process.terminate()
+    try:
+        process.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+# --- Load ---
+
+def run_load(api: Api, job, requests: int, concurrency: int) -> dict:
+    """Call job(api, i) for i in range(requests) from concurrency threads; job returns the HTTP status."""
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def timed(i: int):
+        started = time.perf_counter()
+        try:
+            status = job(api, i)
+        except (http.client.HTTPException, OSError) as error:
+            status = type(error).__name__
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, range(requests)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    def percentile(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+    return {
+        "requests": requests,
+        "seconds": elapsed,
+        "per_second": requests / elapsed,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "statuses": dict(statuses),
+    }
+
+
+def report(name: str, result: dict):
+    print(f"{name}: {result['requests']} requests in {result['seconds']:.2f}s "
+          f"= {result['per_second']:.0f}/s, p50 {result['p50_ms']:.1f}ms, "
+          f"p95 {result['p95_ms']:.1f}ms, p99 {result['p99_ms']:.1f}ms, statuses {result['statuses']}")
+
+
+# --- Scenarios ---
+
+def seed_posts(api: Api, token: str, count: int) -> list[int]:
+    status, data = api.request("GET", "/posts/?page_size=100")
+    existing = [post["id"] for post in (data or {}).get("posts", [])] if status == 200 else []
+    post_ids = list(existing)
+    for i in range(len(existing), count):
+        status, data = api.request("POST", "/posts/", {
+            "title": f"压测帖子 {i}", "content": f"压测内容 {i} 校园 活动", "tag": random.choice(["学习", "生活", "活动"])
+        }, token=token)
+        if status != 200:
+            raise SystemExit(f"creating a post failed with {status}: {data}")
+        post_ids.append(data["post_id"])
+    return post_ids
+
+
+def scenario_reads(api: Api, args) -> dict:
+    token = api.user(0)
+    post_ids = seed_posts(api, token, args.posts)
+    keywords = ["校园", "活动", "压测", "学习"]
+
+    def job(api: Api, i: int):
+        kind = i % 3
+        if kind == 0:
+            return api.request("GET", f"/posts/?page={i % 5 + 1}&page_size=20")[0]
+        if kind == 1:
+            return api.request("GET", f"/posts/{random.choice(post_ids)}")[0]
+        keyword = urllib.parse.quote(random.choice(keywords))
+        return api.request("GET", f"/posts/?keyword={keyword}")[0]
+
+    return run_load(api, job, args.requests, args.concurrency)
+
+
+def scenario_votes(api: Api, args) -> dict:
+    tokens = [api.user(i) for i in range(VOTERS)]
+    post_id = seed_posts(api, tokens[0], 1)[0]
+
+    def job(api: Api, i: int):
+        vote_type = random.choice(["upvote", "downvote"])
+        return api.request("POST", f"/posts/{post_id}/vote", {"vote_type": vote_type}, token=tokens[i % VOTERS])[0]
+
+    return run_load(api, job, args.requests, args.concurrency)
+
+
+def scenario_mixed(api: Api, args) -> dict:
+    tokens = [api.user(i) for i in range(VOTERS)]
+    post_ids = seed_posts(api, tokens[0], args.posts)
+
+    def job(api: Api, i: int):
+        kind = i % 10
+        token = tokens[i % VOTERS]
+        post_id = random.choice(post_ids)
+        if kind < 3:
+            return api.request("GET", f"/posts/?page={i % 5 + 1}&page_size=20")[0]
+        if kind < 6:
+            return api.request("GET", f"/posts/{post_id}/view")[0]
+        if kind < 9:
+            vote_type = random.choice(["upvote", "downvote"])
+            return api.request("POST", f"/posts/{post_id}/vote", {"vote_type": vote_type}, token=token)[0]
+        return api.request("POST", f"/posts/{post_id}/comments", {"content": f"压测评论 {i}"}, token=token)[0]
+
+    return run_load(api, job, args.requests, args.concurrency)
+
+
+def server_rss_kb(pid: int) -> int | None:
+    """Resident memory of pid and its children (the uvicorn workers); None without /proc."""
+    total = 0
+    pending = [pid]
+    try:
+        while pending:
+            current = pending.pop()
+            with open(f"/proc/{current}/status") as status:
+                total += next(int(line.split()[1]) for line in status if line.startswith("VmRSS:"))
+            for path in glob.glob(f"/proc/{current}/task/*/children"):
+                with open(path) as children:
+                    pending.extend(int(child) for child in children.read().split())
+    except (OSError, StopIteration):
+        return None
+    return total
+
+
+async def _open_stream(host: str, port: int, token: str, timeout: float):
+    """Open one SSE stream; returns (status, reader, writer), the streams only for a 200."""
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    writer.write((f"GET /notifications/stream?token={token} HTTP/1.1\r\n"
+                  f"Host: {host}\r\nAccept: text/event-stream\r\n\r\n").encode())
+    status = int((await asyncio.wait_for(reader.readline(), timeout)).split()[1])
+    while (await asyncio.wait_for(reader.readline(), timeout)) not in (b"\r\n", b""):
+        pass
+    if status != 200:
+        writer.close()
+        return status, None, None
+    return status, reader, writer
+
+
+async def _hold_streams(api: Api, tokens: list[str], args) -> dict:
+    total = args.streams * args.workers + args.over_cap
+    semaphore = asyncio.Semaphore(args.concurrency)
+    statuses = Counter()
+    streams = []
+    connect_times = []
+
+    async def connect(i: int):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                status, reader, writer = await _open_stream(api.host, api.port, tokens[i % len(tokens)], args.timeout)
+            except (OSError, asyncio.TimeoutError, ValueError, IndexError) as error:
+                statuses[type(error).__name__] += 1
+                return
+            statuses[status] += 1
+            if reader:
+                connect_times.append(time.perf_counter() - started)
+                streams.append((reader, writer))
+
+    await asyncio.gather(*(connect(i) for i in range(total)))
+    rss_open = server_rss_kb(args.server.pid) if args.server else None
+
+    async def listen(reader) -> int:
+        """Heartbeats received during the hold; the first event (unread count) is skipped."""
+        pings = 0
+        deadline = time.monotonic() + args.hold
+        try:
+            while (remaining := deadline - time.monotonic()) > 0:
+                line = await asyncio.wait_for(reader.readline(), remaining)
+                if not line:
+                    break
+                if line == b": ping\n":
+                    pings += 1
+        except asyncio.TimeoutError:
+            pass
+        return pings
+
+    pings = await asyncio.gather(*(listen(reader) for reader, _ in streams))
+    rss_held = server_rss_kb(args.server.pid) if args.server else None
+    for _, writer in streams:
+        writer.close()
+    connect_times.sort()
+    return {
+        "attempted": total,
+        "opened": len(streams),
+        "statuses": dict(statuses),
+        "connect_p95_ms": connect_times[int(0.95 * (len(connect_times) - 1))] * 1000 if connect_times else 0,
+        "missed_heartbeat": sum(1 for count in pings if count == 0),
+        "min_heartbeats": min(pings, default=0),
+        "rss_open_kb": rss_open,
+        "rss_held_kb": rss_held,
+    }
+
+
+def scenario_stream(api: Api, args):
+    tokens = [api.user(i) for i in range(VOTERS)]
+    rss_idle = server_rss_kb(args.server.pid) if args.server else None
+    result = asyncio.run(_hold_streams(api, tokens, args))
+
+    capacity = args.streams * args.workers
+    print(f"stream: {result['opened']} of {result['attempted']} streams open (cap {capacity}), "
+          f"connect p95 {result['connect_p95_ms']:.1f}ms, statuses {result['statuses']}")
+    print(f"    heartbeats every {args.heartbeat:g}s over {args.hold:g}s: "
+          f"{result['missed_heartbeat']} streams got none, fewest per stream {result['min_heartbeats']}")
+    if rss_idle is not None and result["rss_held_kb"] is not None and result["opened"]:
+        grown = result["rss_held_kb"] - rss_idle
+        print(f"    server memory {rss_idle / 1024:.0f} MiB idle, {result['rss_held_kb'] / 1024:.0f} MiB holding, "
+              f"{grown / result['opened']:.1f} KiB per stream")
+    refused = result["statuses"].get(503, 0)
+    expected = max(0, result["attempted"] - capacity)
+    print(f"    503 refusals: {refused} (at least {expected} expected once every worker is at its cap)")
+
+
+SCENARIOS = {
+    "reads": scenario_reads,
+    "votes": scenario_votes,
+    "mixed": scenario_mixed,
+    "stream": scenario_stream,
+}
+
+
+def raise_open_file_limit():
+    """Thousands of streams need as many sockets on both sides; the server inherits the limit."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenario", choices=SCENARIOS)
+    parser.add_argument("--url", help="benchmark a running server instead of starting one")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers to start")
+    parser.add_argument("--concurrency", type=int, default=32, help="parallel client connections")
+    parser.add_argument("--requests", type=int, default=2000, help="requests to send")
+    parser.add_argument("--posts", type=int, default=100, help="posts to seed")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds before a request counts as failed")
+    parser.add_argument("--streams", type=int, default=1000, help="stream: idle streams per worker, also its cap")
+    parser.add_argument("--over-cap", type=int, default=100, help="stream: extra streams beyond every worker's cap")
+    parser.add_argument("--heartbeat", type=float, default=5, help="stream: server heartbeat interval in seconds")
+    parser.add_argument("--hold", type=float, help="stream: seconds to hold the streams (default 2 heartbeats + 1)")
+    args = parser.parse_args()
+    if args.hold is None:
+        args.hold = 2 * args.heartbeat + 1
+
+    raise_open_file_limit()
+    process = None
+    base_url = args.url
+    if not base_url:
+        env = None
+        if args.scenario == "stream":
+            env = {"NOTIFICATION_STREAM_MAX_CONNECTIONS": str(args.streams),
+                   "NOTIFICATION_STREAM_HEARTBEAT": str(args.heartbeat)}
+        process, base_url, _ = start_server(args.workers, env)
+    args.server = process
+    try:
+        result = SCENARIOS[args.scenario](Api(base_url, args.timeout), args)
+        if result is not None:
+            report(args.scenario, result)
+    finally:
+        if process:
+            stop_server(process)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Home page snapshot for /bootstrap.
+
+The home page needs the boards, the trending searches, the tags and the first
+page of the feed. The snapshot keeps each of these parts as serialized JSON
+together with the key it was built for, and a request rebuilds only the parts
+whose key changed:
+
+- boards: the board list, keyed by the "boards" version and the post counts
+  of feed.board_post_counts, like the ETag of /boards
+- tags: keyed by "post_set", so votes and comments do not rerun SELECT DISTINCT tag
+- feed: the same body as /posts/?page=1&page_size=20, keyed by "posts" and "boards"
+- trending: the top searches already kept in memory by trending.searches
+
+Each part is built by the same feed.py function as its endpoint.
+
+The assembled body and its ETag are kept until a key changes, so an unchanged
+home page costs one version lookup (see http_cache for why versions live in
+the database), a board count query once per BOARD_COUNTS_TTL and no
+serialization.
+"""
+import asyncio
+import hashlib
+from sqlalchemy.ext.asyncio import AsyncSession
+import cache
+import feed
+import http_cache
+import trending
+
+TRENDING_SIZE = 10
+
+
+class HomeSnapshot:
+    def __init__(self):
+        # part name -> (key, serialized JSON)
+        self.parts: dict[str, tuple[object, bytes]] = {}
+        self.keys: dict[str, object] | None = None
+        self.etag = ""
+        self.body = b""
+        self.lock = asyncio.Lock()
+
+    async def get(self, db: AsyncSession) -> tuple[str, bytes]:
+        """The current ETag and body, rebuilding the parts that changed."""
+        versions = await cache.get_versions(db, ["posts", "post_set", "boards"])
+        post_counts = await feed.board_post_counts(db)
+        keys = {
+            "boards": (versions["boards"], tuple(sorted(post_counts.items()))),
+            "tags": versions["post_set"],
+            # local_generation covers votes still waiting in the vote buffer
+            "feed": (versions["posts"], versions["boards"], http_cache.local_generation),
+            "trending": tuple(trending.searches.top(TRENDING_SIZE)),
+        }
+        if keys == self.keys:
+            return self.etag, self.body
+
+        async with self.lock:
+            if keys != self.keys:
+                for name, key in keys.items():
+                    part = self.parts.get(name)
+                    if part is None or part[0] != key:
+                        self.parts[name] = (key, http_cache.render(await self._build(db, name, key)))
+                self.body = b"{" + b",".join(
+                    b'"%s":%s' % (name.encode(), self.parts[name][1]) for name in keys
+                ) + b"}"
+                self.etag = '"' + hashlib.sha1(repr(sorted(keys.items())).encode()).hexdigest()[:20] + '"'
+                self.keys = keys
+            return self.etag, self.body
+
+    @staticmethod
+    async def _build(db: AsyncSession, name: str, key) -> dict:
+        if name == "boards":
+            return await feed.build_boards(db, dict(key[1]))
+        if name == "tags":
+            return await feed.build_tags(db)
+        if name == "feed":
+            return await feed.build_feed_page(db, feed.visible_posts())
+        return {"trending": list(key)}
+
+
+snapshot = HomeSnapshot()
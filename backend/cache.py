@@ -0,0 +1,90 @@
+"""
+In-process cache helpers.
+
+Workers keep caches in memory and use the cache_versions table to learn
+about writes made by other workers: a writer bumps the version of a cache
+name, a reader compares it with the version its copy was built from.
+"""
+import os
+import time
+from collections import OrderedDict
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+import database
+
+BOARD_COUNTS_TTL = float(os.getenv("BOARD_COUNTS_TTL", "30"))
+
+
+class TTLCache:
+    """Small LRU cache whose entries also expire ttl seconds after being set."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Visible post count per board id for the home page sidebar.
+# Cleared locally on post writes; other workers catch up within BOARD_COUNTS_TTL.
+board_post_counts = TTLCache(maxsize=1, ttl=BOARD_COUNTS_TTL)
+
+
+async def get_version(db: AsyncSession, name: str) -> int:
+    version = await db.scalar(select(database.CacheVersion.version).where(database.CacheVersion.name == name))
+    return version or 0
+
+
+async def get_versions(db: AsyncSession, names: list[str]) -> dict[str, int]:
+    """Versions of several cache names in one query; missing names are 0."""
+    rows = await db.execute(
+        select(database.CacheVersion.name, database.CacheVersion.version)
+        .where(database.CacheVersion.name.in_(names))
+    )
+    versions = dict(rows.all())
+    return {name: versions.get(name, 0) for name in names}
+
+
+async def bump_version(db: AsyncSession, name: str):
+    """Increment the version of a cache name. The caller commits the transaction."""
+    # Upsert, so concurrent first bumps of a new name do not collide on the primary key
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(database.CacheVersion).values(name=name, version=1).on_conflict_do_update(
+            index_elements=["name"], set_={"version": database.CacheVersion.version + 1}
+        )
+    else:
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(database.CacheVersion).values(name=name, version=1).on_duplicate_key_update(
+            version=database.CacheVersion.version + 1
+        )
+    await db.execute(stmt)
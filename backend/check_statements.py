@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Check how many SQL statements the read endpoints run per request.
+
+Calls the app in-process on a seeded temporary SQLite database, counts the
+statements of each request with a before_cursor_execute listener and exits
+with status 1 if an endpoint runs more statements than its budget, or more
+for a long page than for a short one (a query per row, e.g. a lazy-loaded
+post.author). A lazy load inside an async session fails outright with
+MissingGreenlet, which shows up here as a 500.
+
+    python check_statements.py
+    python check_statements.py -v        # print every statement
+
+Response caches are cleared before each request, so the counts are those of
+a cache miss.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/statements.db"
+
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.engine import Engine  # noqa: E402
+import auth  # noqa: E402
+import cache  # noqa: E402
+import database  # noqa: E402
+import http_cache  # noqa: E402
+import migrations  # noqa: E402
+from main import app  # noqa: E402
+
+AUTHORS = 40
+EMAIL = "reader@example.com"
+
+# (name, path with {n} for the page size, most statements allowed); each path
+# is called for SHORT_PAGE and LONG_PAGE rows, which must run as many statements
+SHORT_PAGE = 2
+LONG_PAGE = 30
+ENDPOINTS = [
+    ("feed page", "/posts/?page_size={n}", 3),
+    ("feed cursor", "/posts/?pagination=cursor&page_size={n}", 2),
+    ("feed by tag", "/posts/?tag=学习&page_size={n}", 3),
+    ("hot feed", "/posts/?sort=hot&page_size={n}", 3),
+    ("post view", "/posts/1/view?comment_limit={n}", 5),
+    ("comments of post", "/posts/1/comments?limit={n}", 3),
+    ("my posts", "/users/me/posts", 3),
+    ("my favorites", "/users/me/favorites?page_size={n}", 3),
+    ("notifications page", "/notifications?limit={n}", 2),
+]
+
+statements: list[str] = []
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count(conn, cursor, statement, parameters, context, executemany):
+    statements.append(statement)
+
+
+def seed():
+    start = datetime.now() - timedelta(days=30)
+    users = [f"author{i}@example.com" for i in range(AUTHORS)]
+    with database.engine.begin() as conn:
+        conn.execute(database.Board.__table__.insert(), [
+            {"name": f"板块{i}", "description": "", "sort_order": i} for i in range(5)
+        ])
+        conn.execute(database.User.__table__.insert(), [
+            {"user_email": email, "user_name": f"用户{i}", "hashed_password": "x", "is_admin": False,
+             "is_banned": False, "unread_notifications": 0}
+            for i, email in enumerate([EMAIL, *users])
+        ])
+        # One post per author and board, so lazy loads cannot be served from the identity map
+        conn.execute(database.Post.__table__.insert(), [
+            {"title": f"帖子 {i}", "content": "内容", "tag": "学习", "release_time": start + timedelta(hours=i),
+             "user_email": email if i else EMAIL, "upvotes": i, "downvotes": 0, "is_hidden": False,
+             "board_id": i % 5 + 1, "comment_count": AUTHORS if i == 0 else 0, "hot_score": i}
+            for i, email in enumerate(users)
+        ])
+        conn.execute(database.Post.__table__.insert(), [
+            {"title": f"我的帖子 {i}", "content": "内容", "tag": "生活", "release_time": start + timedelta(minutes=i),
+             "user_email": EMAIL, "upvotes": 0, "downvotes": 0, "is_hidden": False,
+             "board_id": i % 5 + 1, "comment_count": 0, "hot_score": 0}
+            for i in range(AUTHORS)
+        ])
+        conn.execute(database.Comment.__table__.insert(), [
+            {"post_id": 1, "content": "评论", "release_time": start + timedelta(hours=i),
+             "user_email": email, "upvotes": 0, "downvotes": 0}
+            for i, email in enumerate(users)
+        ])
+        conn.execute(database.Favorite.__table__.insert(), [
+            {"post_id": post_id, "user_email": EMAIL} for post_id in range(1, AUTHORS + 1)
+        ])
+        conn.execute(database.Notification.__table__.insert(), [
+            {"user_email": EMAIL, "message": "通知", "notification_type": "reply", "is_read": False,
+             "release_time": start + timedelta(hours=i), "actor_count": 1}
+            for i in range(AUTHORS)
+        ])
+
+
+async def call(path: str, token: str) -> tuple[int, dict | list]:
+    """Run one GET through the ASGI app and return its status and JSON body."""
+    raw_path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": raw_path, "raw_path": raw_path.encode(),
+        "query_string": query.encode(), "root_path": "",
+        "headers": [(b"host", b"testserver"), (b"authorization", f"Bearer {token}".encode())],
+        "client": ("127.0.0.1", 50000), "server": ("testserver", 80),
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    try:
+        await app(scope, receive, send)
+    except Exception as error:
+        # ServerErrorMiddleware re-raises after sending the 500
+        return 500, {"detail": repr(error)}
+    status = messages[0]["status"]
+    body = b"".join(m.get("body", b"") for m in messages if m["type"] == "http.response.body")
+    return status, json.loads(body) if body else None
+
+
+async def count(path: str, token: str) -> list[str]:
+    http_cache.bodies.clear()
+    cache.board_post_counts.clear()
+    status, body = await call(path, token)
+    if status != 200:
+        raise SystemExit(f"GET {path} returned {status}: {body}")
+    del statements[:]
+    http_cache.bodies.clear()
+    cache.board_post_counts.clear()
+    # The first call warmed per-process caches such as the principal; count the second
+    await call(path, token)
+    return list(statements)
+
+
+async def check(verbose: bool) -> list[str]:
+    try:
+        return await _check(verbose)
+    finally:
+        # aiosqlite connection threads would keep the process alive
+        await database.async_engine.dispose()
+        await database.read_async_engine.dispose()
+
+
+async def _check(verbose: bool) -> list[str]:
+    token = auth.create_access_token({"sub": EMAIL})
+    failures = []
+    for name, path, budget in ENDPOINTS:
+        counts = []
+        for size in (SHORT_PAGE, LONG_PAGE):
+            run = await count(path.format(n=size), token)
+            counts.append(len(run))
+            if verbose:
+                for statement in run:
+                    print(f"    {' '.join(statement.split())[:160]}")
+        short, long = counts
+        if long > short:
+            status = "PER ROW"
+        elif long > budget:
+            status = "OVER BUDGET"
+        else:
+            status = "ok"
+        if status != "ok":
+            failures.append(name)
+        print(f"[{status}] {name}: {short} statements for {SHORT_PAGE} rows, {long} for {LONG_PAGE} (budget {budget})")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-v", "--verbose", action="store_true", help="print the statements of each request")
+    args = parser.parse_args()
+
+    migrations.migrate(database.engine)
+    seed()
+    failures = asyncio.run(check(args.verbose))
+    if failures:
+        print(f"\n❌ {len(failures)} endpoints run too many statements: {', '.join(failures)}")
+        sys.exit(1)
+    print("\n✅ Statement counts do not grow with the page size")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Stress test of the vote counters.
+
+Starts uvicorn on a temporary SQLite database, has many users toggle votes
+on one post and its comments in parallel, stops the server (which flushes
+the vote buffer) and checks that upvotes/downvotes of every post and comment
+equal the number of matching rows in votes. Runs once with direct votes and
+once with VOTE_WRITE_BEHIND=1, and exits with status 1 on any mismatch.
+
+    python check_votes.py
+    python check_votes.py --workers 4 --toggles 5000 --concurrency 64
+    python check_votes.py --modes write-behind
+"""
+import argparse
+import random
+import sqlite3
+import sys
+from benchmark import Api, report, run_load, start_server, stop_server
+
+MODES = {
+    "direct": {"VOTE_WRITE_BEHIND": "0"},
+    "write-behind": {"VOTE_WRITE_BEHIND": "1", "VOTE_FLUSH_INTERVAL": "0.2"},
+}
+# 409 is apply_vote giving up on a vote row that kept changing under it
+ACCEPTED_STATUSES = {200, 409}
+COUNT_VOTES = """
+    SELECT t.id, t.upvotes, t.downvotes,
+        (SELECT COUNT(*) FROM votes v
+         WHERE v.entity_type = :entity_type AND v.entity_id = t.id AND v.vote_type = 'upvote'),
+        (SELECT COUNT(*) FROM votes v
+         WHERE v.entity_type = :entity_type AND v.entity_id = t.id AND v.vote_type = 'downvote')
+    FROM {table} t
+"""
+
+
+def mismatches(db_path: str) -> list[str]:
+    """Posts and comments whose counters differ from their votes rows."""
+    found = []
+    conn = sqlite3.connect(db_path)
+    try:
+        for entity_type, table in (("post", "posts"), ("comment", "comments")):
+            rows = conn.execute(COUNT_VOTES.format(table=table), {"entity_type": entity_type}).fetchall()
+            for entity_id, upvotes, downvotes, up_rows, down_rows in rows:
+                if (upvotes, downvotes) != (up_rows, down_rows):
+                    found.append(f"{entity_type} {entity_id}: counters {upvotes}/{downvotes}, "
+                                 f"votes rows {up_rows}/{down_rows}")
+    finally:
+        conn.close()
+    return found
+
+
+def run_mode(mode: str, args) -> list[str]:
+    process, base_url, db_path = start_server(args.workers, {**MODES[mode], "BCRYPT_ROUNDS": "4"})
+    try:
+        api = Api(base_url, args.timeout)
+        tokens = [api.user(i) for i in range(args.users)]
+        status, data = api.request("POST", "/posts/", {"title": "投票压测", "content": "投票压测", "tag": "生活"},
+                                   token=tokens[0])
+        if status != 200:
+            raise SystemExit(f"creating the post failed with {status}: {data}")
+        post_id = data["post_id"]
+        for i in range(args.comments):
+            status, data = api.request("POST", f"/posts/{post_id}/comments", {"content": f"评论 {i}"},
+                                       token=tokens[i % len(tokens)])
+            if status != 200:
+                raise SystemExit(f"creating a comment failed with {status}: {data}")
+        _, data = api.request("GET", f"/posts/{post_id}/comments?limit=100")
+        targets = [f"/posts/{post_id}/vote"] + [f"/comments/{c['id']}/vote" for c in data["comments"]]
+
+        def job(api: Api, i: int):
+            vote_type = random.choice(["upvote", "downvote"])
+            return api.request("POST", random.choice(targets), {"vote_type": vote_type},
+                               token=random.choice(tokens))[0]
+
+        result = run_load(api, job, args.toggles, args.concurrency)
+    finally:
+        stop_server(process)
+
+    report(f"{mode} votes", result)
+    problems = [f"{count} requests answered {status}" for status, count in result["statuses"].items()
+                if status not in ACCEPTED_STATUSES]
+    return problems + mismatches(db_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--workers", type=int, default=2, help="uvicorn workers to start")
+    parser.add_argument("--users", type=int, default=20, help="voting users")
+    parser.add_argument("--comments", type=int, default=5, help="comments to vote on besides the post")
+    parser.add_argument("--toggles", type=int, default=2000, help="vote requests to send")
+    parser.add_argument("--concurrency", type=int, default=32, help="parallel client connections")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds before a request counts as failed")
+    args = parser.parse_args()
+
+    failed = False
+    for mode in args.modes:
+        problems = run_mode(mode, args)
+        for problem in problems:
+            print(f"    {problem}")
+        failed = failed or bool(problems)
+    if failed:
+        print("\n❌ Vote counters do not match the votes table")
+        sys.exit(1)
+    print("\n✅ Vote counters match the votes table")
+
+
+if __name__ == "__main__":
+    main()
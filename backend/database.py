@@ -1,8 +1,10 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Boolean, UniqueConstraint, inspect, text
+from sqlalchemy import create_engine, event, Column, Integer, String, Text, DateTime, Double, ForeignKey, Boolean, UniqueConstraint, Index
+from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
 import os
+import db_pool
 
 # Database URL - can be configured via environment variable
 # Supports both MySQL and SQLite
@@ -10,17 +12,114 @@ import os
 # SQLite: sqlite:///./campus_forum.db
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./campus_forum.db")
 
+# SQLite tuning, applied to every connection of a file database (see configure_sqlite)
+SQLITE_WAL = os.getenv("SQLITE_WAL", "1") == "1"
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))  # milliseconds
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # negative: KiB, i.e. 64 MiB
+SQLITE_READ_POOL_SIZE = int(os.getenv("SQLITE_READ_POOL_SIZE", "8"))
+SQLITE_WRITE_TIMEOUT = float(os.getenv("SQLITE_WRITE_TIMEOUT", "30"))  # seconds to wait for the writer
+
+
+def is_sqlite_file(url: str) -> bool:
+    return url.startswith("sqlite") and ":memory:" not in url and not url.rstrip("/").endswith(":")
+
+
+def configure_sqlite(engine, read_only: bool = False, immediate: bool = False):
+    """
+    Set the pragmas on each new connection of engine.
+    read_only connections reject writes (query_only); immediate ones take the
+    write lock when their transaction begins instead of failing with
+    "database is locked" when a read transaction later tries to write.
+    """
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        if immediate:
+            # Let SQLAlchemy's "begin" event below emit BEGIN instead of the driver
+            dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT}")
+        if SQLITE_WAL:
+            cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size = {SQLITE_CACHE_SIZE}")
+        if read_only:
+            cursor.execute("PRAGMA query_only = 1")
+        cursor.close()
+
+    if immediate:
+        @event.listens_for(engine, "begin")
+        def begin_immediate(conn):
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
 # Create engine with appropriate settings
 if DATABASE_URL.startswith("sqlite"):
     engine = create_engine(DATABASE_URL, echo=False, connect_args={"check_same_thread": False})
+    if is_sqlite_file(DATABASE_URL):
+        configure_sqlite(engine)
 else:
-    engine = create_engine(DATABASE_URL, echo=False, pool_pre_ping=True)
+    engine = create_engine(DATABASE_URL, echo=False, poolclass=db_pool.TimedQueuePool, **db_pool.POOL_OPTIONS)
+    if not db_pool.POOL_PRE_PING:
+        db_pool.ping_idle_connections(engine)
 
 # Create sessionmaker
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def get_async_database_url(url: str) -> str:
+    """Map a sync driver URL onto the matching asyncio driver."""
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith("mysql+pymysql:"):
+        return url.replace("mysql+pymysql:", "mysql+aiomysql:", 1)
+    if url.startswith("mysql:"):
+        return url.replace("mysql:", "mysql+aiomysql:", 1)
+    return url
+
+
+# Async engine used by the request handlers so queries do not block the event loop.
+# The sync engine above is kept for migrations and other scripts.
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", get_async_database_url(DATABASE_URL))
+
+if is_sqlite_file(ASYNC_DATABASE_URL):
+    # SQLite allows one writer at a time. All writing sessions share a single
+    # connection, so writes queue in the pool instead of failing with
+    # "database is locked"; with WAL the read-only pool keeps serving GETs
+    # while a write is in progress.
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL, echo=False, poolclass=db_pool.TimedAsyncQueuePool,
+        pool_size=1, max_overflow=0, pool_timeout=SQLITE_WRITE_TIMEOUT
+    )
+    configure_sqlite(async_engine.sync_engine, immediate=True)
+    read_async_engine = create_async_engine(
+        ASYNC_DATABASE_URL, echo=False, poolclass=db_pool.TimedAsyncQueuePool, pool_size=SQLITE_READ_POOL_SIZE
+    )
+    configure_sqlite(read_async_engine.sync_engine, read_only=True)
+elif ASYNC_DATABASE_URL.startswith("sqlite"):
+    async_engine = read_async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=False)
+else:
+    async_engine = read_async_engine = create_async_engine(
+        ASYNC_DATABASE_URL, echo=False, poolclass=db_pool.TimedAsyncQueuePool, **db_pool.POOL_OPTIONS
+    )
+    if not db_pool.POOL_PRE_PING:
+        db_pool.ping_idle_connections(async_engine.sync_engine)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+# Sessions for handlers and jobs that never write
+ReadSessionLocal = async_sessionmaker(read_async_engine, autoflush=False, expire_on_commit=False)
+
+
+def async_engines() -> dict:
+    """The request-path engines by role, for metrics."""
+    if read_async_engine is async_engine:
+        return {"default": async_engine}
+    return {"write": async_engine, "read": read_async_engine}
+
 # Create base class for models
-Base = declarative_base()
+Base = declarative_base(cls=AsyncAttrs)
 
 # Database Models
 class User(Base):
@@ -34,6 +133,8 @@ class User(Base):
     preferred_tags = Column(Text, default="")
     is_admin = Column(Boolean, default=False)
     is_banned = Column(Boolean, default=False)
+    # Maintained on notification insert/read/read-all so the badge never needs a COUNT
+    unread_notifications = Column(Integer, default=0)
     
     posts = relationship("Post", back_populates="author", cascade="all, delete-orphan")
     comments = relationship("Comment", back_populates="author", cascade="all, delete-orphan")
@@ -55,10 +156,22 @@ class Post(Base):
     upvotes = Column(Integer, default=0)
     downvotes = Column(Integer, default=0)
     is_hidden = Column(Boolean, default=False)
+    comment_count = Column(Integer, default=0)  # kept in step by comment writes
+    hot_score = Column(Double, default=0)  # see ranking.py
     
     author = relationship("User", back_populates="posts")
     comments = relationship("Comment", back_populates="post", cascade="all, delete-orphan")
     favorites = relationship("Favorite", back_populates="post", cascade="all, delete-orphan")
+    __table_args__ = (
+        # Keyset pagination of the feed: WHERE is_hidden = 0 ORDER BY release_time DESC, id DESC
+        Index("ix_posts_feed", "is_hidden", "release_time", "id"),
+        # sort=hot and sort=top
+        Index("ix_posts_hot", "is_hidden", "hot_score", "id"),
+        Index("ix_posts_top", "is_hidden", "upvotes", "id"),
+        # Tag filtered feed and "my posts"; the board feed index follows board_id below
+        Index("ix_posts_tag_feed", "tag", "is_hidden", "release_time"),
+        Index("ix_posts_user_time", "user_email", "release_time"),
+    )
 
 
 class Comment(Base):
@@ -75,6 +188,11 @@ class Comment(Base):
     
     post = relationship("Post", back_populates="comments")
     author = relationship("User", back_populates="comments")
+    __table_args__ = (
+        Index("ix_comments_post_time", "post_id", "release_time"),
+        # sort=top: WHERE post_id = ? ORDER BY upvotes DESC, id DESC
+        Index("ix_comments_post_top", "post_id", "upvotes", "id"),
+    )
 
 
 class Vote(Base):
@@ -89,6 +207,8 @@ class Vote(Base):
     user = relationship("User", back_populates="votes")
     __table_args__ = (
         UniqueConstraint('entity_type', 'entity_id', 'user_email', name='uq_vote'),
+        # A user's votes on a page of comments, answered from the index alone
+        Index("ix_votes_user_entity", "user_email", "entity_type", "entity_id", "vote_type"),
     )
 
 
@@ -103,6 +223,7 @@ class Favorite(Base):
     post = relationship("Post", back_populates="favorites")
     __table_args__ = (
         UniqueConstraint('post_id', 'user_email', name='uq_favorite'),
+        Index("ix_favorites_user", "user_email", "post_id"),
     )
 
 
@@ -115,8 +236,20 @@ class Notification(Base):
     notification_type = Column(String(20), nullable=False)  # "reply" / "vote"
     is_read = Column(Boolean, default=False)
     release_time = Column(DateTime, default=datetime.now)
+    # Coalesced vote notifications: one unread row per recipient and group_key ("post:12:upvote")
+    group_key = Column(String(100), nullable=True)
+    actor_count = Column(Integer, default=1)
+    # Distinct actors of a coalesced row as JSON {email: name}, latest last
+    actors = Column(Text, nullable=True)
 
     user = relationship("User", back_populates="notifications")
+    __table_args__ = (
+        Index("ix_notifications_group", "user_email", "group_key"),
+        Index("ix_notifications_user_read_time", "user_email", "is_read", "release_time"),
+        Index("ix_notifications_user_time", "user_email", "release_time", "id"),
+        # notification_hub's database backend polls rows created or re-coalesced since its last poll
+        Index("ix_notifications_release_time", "release_time"),
+    )
 
 
 class SearchHistory(Base):
@@ -127,6 +260,11 @@ class SearchHistory(Base):
     count = Column(Integer, default=1)
     last_searched = Column(DateTime, default=datetime.now)
 
+    __table_args__ = (
+        # trending seeds its summary from the most recently searched keywords at startup
+        Index("ix_search_history_last_searched", "last_searched"),
+    )
+
 
 class SensitiveWord(Base):
     __tablename__ = "sensitive_words"
@@ -149,6 +287,10 @@ class Report(Base):
     created_at = Column(DateTime, default=datetime.now)
     
     reporter = relationship("User")
+    __table_args__ = (
+        Index("ix_reports_status_time", "status", "created_at"),
+        Index("ix_reports_reporter_time", "reporter_email", "created_at"),
+    )
 
 
 class Feedback(Base):
@@ -163,6 +305,10 @@ class Feedback(Base):
     created_at = Column(DateTime, default=datetime.now)
     
     user = relationship("User")
+    __table_args__ = (
+        Index("ix_feedback_status_time", "status", "created_at"),
+        Index("ix_feedback_user_time", "user_email", "created_at"),
+    )
 
 
 class Board(Base):
@@ -175,36 +321,46 @@ class Board(Base):
     created_at = Column(DateTime, default=datetime.now)
 
 
+class NotificationResync(Base):
+    """Streams of user_email must reload the unread count; polled by notification_hub's database backend."""
+    __tablename__ = "notification_resyncs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_email = Column(String(255), nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.now, index=True)
+
+
+class CacheVersion(Base):
+    """Version stamps bumped on writes so every worker can tell when its in-process cache is stale."""
+    __tablename__ = "cache_versions"
+
+    name = Column(String(100), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class SchemaMigration(Base):
+    """Applied versions from migrations.py."""
+    __tablename__ = "schema_migrations"
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String(100), nullable=False)
+    applied_at = Column(DateTime, default=datetime.now)
+
+
 # Add board_id to Post
 Post.board_id = Column(Integer, ForeignKey("boards.id"), nullable=True)
 Post.board = relationship("Board", lazy="joined")
+# Board filtered feed and the per-board post counts
+Index("ix_posts_board_feed", Post.board_id, Post.is_hidden, Post.release_time)
 
 
 # Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# Dependency for read-only handlers (GET endpoints)
+async def get_read_db():
+    async with ReadSessionLocal() as db:
         yield db
-    finally:
-        db.close()
-
-
-# Function to initialize database
-def init_db():
-    """Create all tables in the database"""
-    Base.metadata.create_all(bind=engine)
-    with engine.begin() as conn:
-        columns = {col["name"] for col in inspect(conn).get_columns("users")}
-        if "is_admin" not in columns:
-            conn.execute(text("ALTER TABLE users ADD COLUMN is_admin BOOLEAN DEFAULT 0"))
-        if "is_banned" not in columns:
-            conn.execute(text("ALTER TABLE users ADD COLUMN is_banned BOOLEAN DEFAULT 0"))
-        post_columns = {col["name"] for col in inspect(conn).get_columns("posts")}
-        if "is_hidden" not in post_columns:
-            conn.execute(text("ALTER TABLE posts ADD COLUMN is_hidden BOOLEAN DEFAULT 0"))
-    print("Database tables created successfully!")
-
-
-if __name__ == "__main__":
-    # Run this script to create tables
-    init_db()
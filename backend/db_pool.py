@@ -0,0 +1,119 @@
+"""
+Connection pool settings and statistics.
+
+Pool sizes come from the DB_POOL_* variables. The Timed* pool classes record
+how long each checkout took and how often it had to wait for a connection
+because the pool and its overflow were all in use; metrics.py publishes these
+on /metrics together with the in-use and idle gauges.
+
+Instead of pool_pre_ping, which costs a round trip on every checkout,
+ping_idle_connections pings a connection only when it has been idle in the
+pool for more than DB_POOL_PING_IDLE seconds. A connection that was just
+returned is assumed alive; if one still turns out dead, SQLAlchemy detects
+the disconnect on first use and discards the pool.
+"""
+import os
+import time
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # keep below MySQL's wait_timeout
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "0") == "1"
+POOL_PING_IDLE = float(os.getenv("DB_POOL_PING_IDLE", "30"))
+
+POOL_OPTIONS = {
+    "pool_size": POOL_SIZE,
+    "max_overflow": MAX_OVERFLOW,
+    "pool_timeout": POOL_TIMEOUT,
+    "pool_recycle": POOL_RECYCLE,
+    "pool_pre_ping": POOL_PRE_PING,
+}
+
+
+class PoolStats:
+    def __init__(self):
+        self.checkouts = 0
+        self.checkout_seconds = 0.0
+        self.max_checkout_seconds = 0.0
+        self.waits = 0
+        self.timeouts = 0
+
+    def record(self, seconds: float, waited: bool):
+        self.checkouts += 1
+        self.checkout_seconds += seconds
+        self.max_checkout_seconds = max(self.max_checkout_seconds, seconds)
+        if waited:
+            self.waits += 1
+
+
+class _TimedPool:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        waited = self.checkedin() == 0 and 0 <= self._max_overflow <= self.overflow()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.stats.timeouts += 1
+            raise
+        finally:
+            self.stats.record(time.perf_counter() - started, waited)
+
+    def recreate(self):
+        # dispose() and disconnect handling replace the pool; keep the counters
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+class TimedQueuePool(_TimedPool, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedPool, AsyncAdaptedQueuePool):
+    pass
+
+
+def ping_idle_connections(engine: Engine):
+    """Ping connections idle for more than POOL_PING_IDLE seconds when they are checked out."""
+    @event.listens_for(engine, "checkin")
+    def remember_checkin(dbapi_connection, connection_record):
+        connection_record.info["checked_in_at"] = time.monotonic()
+
+    @event.listens_for(engine, "checkout")
+    def ping_if_idle(dbapi_connection, connection_record, connection_proxy):
+        checked_in_at = connection_record.info.get("checked_in_at")
+        if checked_in_at is None or time.monotonic() - checked_in_at < POOL_PING_IDLE:
+            return
+        try:
+            alive = engine.dialect.do_ping(dbapi_connection)
+        except Exception:
+            alive = False
+        if not alive:
+            # The pool retries the checkout with a fresh connection
+            raise exc.DisconnectionError()
+
+
+def pool_status(engine: Engine) -> dict | None:
+    """Gauges and counters of engine's pool, or None for pools without them (e.g. NullPool)."""
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return None
+    status = {
+        "size": pool.size(),
+        "in_use": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": pool._max_overflow,
+    }
+    stats = getattr(pool, "stats", None)
+    if stats:
+        status.update(vars(stats))
+    return status
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Check the query plans of the routers' queries.
+
+Runs EXPLAIN on every list/lookup query the routers and background jobs
+issue, built by the same statement functions they call, and exits with
+status 1 if any of them scans a whole table.
+
+    python explain_queries.py                 # seeded temporary SQLite database
+    python explain_queries.py --scale 0.1     # smaller seed
+    DATABASE_URL=mysql+pymysql://... python explain_queries.py [--seed]
+
+With DATABASE_URL set, the configured database is used as is. Pass --seed to
+insert the synthetic dataset into it, but never do that on production data.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/explain.db"
+    USING_TEMP_DB = True
+else:
+    USING_TEMP_DB = False
+
+from sqlalchemy import text  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+import database  # noqa: E402
+import feed  # noqa: E402
+import migrations  # noqa: E402
+import notification_digest  # noqa: E402
+import notification_hub  # noqa: E402
+import ranking  # noqa: E402
+import search  # noqa: E402
+import trending  # noqa: E402
+from routers import admin_moderation, feedback, notifications, posts, reports, users, votes  # noqa: E402
+from utils import (  # noqa: E402
+    comment_page_statement, encode_cursor, encode_score_cursor, favorite_statement, vote_type_statement
+)
+
+# Rows per table at --scale 1
+SEED_ROWS = {
+    "users": 2000,
+    "posts": 50000,
+    "comments": 100000,
+    "votes": 100000,
+    "favorites": 20000,
+    "notifications": 100000,
+    "reports": 5000,
+    "feedback": 2000,
+    "search_history": 5000,
+}
+TAGS = ["学习", "生活", "求助", "二手", "活动", "失物招领"]
+
+# Small tables that are fine to scan
+ALLOWED_SCANS = {"boards list", "sensitive words list", "first admin check"}
+
+
+def seed(scale: float):
+    rows = {name: max(1, int(count * scale)) for name, count in SEED_ROWS.items()}
+    rng = random.Random(42)
+    start = datetime.now() - timedelta(days=365)
+
+    def when():
+        return start + timedelta(seconds=rng.randrange(365 * 86400))
+
+    users = [f"user{i}@example.com" for i in range(rows["users"])]
+    with database.engine.begin() as conn:
+        conn.execute(database.Board.__table__.insert(), [
+            {"name": f"板块{i}", "description": "", "sort_order": i} for i in range(10)
+        ])
+        conn.execute(database.User.__table__.insert(), [
+            {"user_email": email, "user_name": f"用户{i}", "hashed_password": "x", "is_admin": i == 0,
+             "is_banned": False, "unread_notifications": 0}
+            for i, email in enumerate(users)
+        ])
+        conn.execute(database.Post.__table__.insert(), [
+            {"title": f"帖子 {i}", "content": "内容", "tag": rng.choice(TAGS), "release_time": when(),
+             "user_email": rng.choice(users), "upvotes": 0, "downvotes": 0, "is_hidden": rng.random() < 0.02,
+             "board_id": rng.choice([None, *range(1, 11)])}
+            for i in range(rows["posts"])
+        ])
+        conn.execute(database.Comment.__table__.insert(), [
+            {"post_id": rng.randrange(1, rows["posts"] + 1), "content": "评论", "release_time": when(),
+             "user_email": rng.choice(users), "upvotes": 0, "downvotes": 0}
+            for _ in range(rows["comments"])
+        ])
+        votes = {(rng.choice(["post", "comment"]), rng.randrange(1, rows["posts"] + 1), rng.choice(users))
+                 for _ in range(rows["votes"])}
+        conn.execute(database.Vote.__table__.insert(), [
+            {"entity_type": entity_type, "entity_id": entity_id, "user_email": email,
+             "vote_type": rng.choice(["upvote", "downvote"])}
+            for entity_type, entity_id, email in votes
+        ])
+        favorites = {(rng.randrange(1, rows["posts"] + 1), rng.choice(users)) for _ in range(rows["favorites"])}
+        conn.execute(database.Favorite.__table__.insert(), [
+            {"post_id": post_id, "user_email": email} for post_id, email in favorites
+        ])
+        conn.execute(database.Notification.__table__.insert(), [
+            {"user_email": rng.choice(users), "message": "通知", "notification_type": "reply",
+             "is_read": rng.random() < 0.7, "release_time": when(), "actor_count": 1}
+            for _ in range(rows["notifications"])
+        ])
+        conn.execute(database.Report.__table__.insert(), [
+            {"reporter_email": rng.choice(users), "target_type": "post",
+             "target_id": rng.randrange(1, rows["posts"] + 1), "reason": "spam",
+             "status": rng.choice(["pending", "resolved", "rejected"]), "created_at": when()}
+            for _ in range(rows["reports"])
+        ])
+        conn.execute(database.Feedback.__table__.insert(), [
+            {"user_email": rng.choice(users), "content": "反馈", "status": rng.choice(["pending", "resolved"]),
+             "created_at": when()}
+            for _ in range(rows["feedback"])
+        ])
+        conn.execute(database.SearchHistory.__table__.insert(), [
+            {"keyword": f"关键词{i}", "count": rng.randrange(1, 50), "last_searched": when()}
+            for i in range(rows["search_history"])
+        ])
+        if conn.dialect.name == "sqlite":
+            conn.execute(text("ANALYZE"))
+
+
+def router_queries(session: Session) -> dict:
+    """
+    The statements the routers and background jobs run, built by their own
+    statement functions and keyed by a readable name. session is only used
+    by builders that depend on the dialect, such as the keyword search.
+    """
+    Post = database.Post
+    email = "user1@example.com"
+    now = datetime.now()
+    cursor = encode_cursor(now, 100)
+    visible = feed.visible_posts()
+    keyword_query, rank = search.apply_keyword_filter(session, visible, Post, "校园活动")
+    return {
+        # feed.py: /posts/, /boards, /tags and /bootstrap
+        "feed page": feed.feed_page_statement(visible),
+        "feed cursor": feed.feed_page_statement(visible, pagination="cursor", cursor=cursor),
+        "hot feed": feed.feed_page_statement(visible, sort="hot"),
+        "hot feed cursor": feed.feed_page_statement(
+            visible, sort="hot", pagination="cursor", cursor=encode_score_cursor(12.5, 100)
+        ),
+        "top feed": feed.feed_page_statement(visible, sort="top"),
+        "feed total": feed.feed_total_statement(visible),
+        "feed by tag": feed.feed_page_statement(visible.where(Post.tag == "学习")),
+        "feed by board": feed.feed_page_statement(visible.where(Post.board_id == 3)),
+        "keyword search": feed.feed_page_statement(keyword_query, rank=rank),
+        "keyword search total": feed.feed_total_statement(keyword_query),
+        "tags": feed.tags_statement(),
+        "board post counts": feed.board_counts_statement(),
+        "boards list": feed.boards_statement(),
+        # posts.py / comments.py / votes.py
+        "comments of post": comment_page_statement(10, None, 20),
+        "comments of post cursor": comment_page_statement(10, cursor, 20),
+        "top comments of post": comment_page_statement(10, None, 20, sort="top"),
+        "viewer votes": posts.viewer_votes_statement(email, 10, [1, 2, 3]),
+        "vote status": vote_type_statement("post", 10, email),
+        "comment votes of page": votes.comment_votes_statement(email, 10, [1, 2, 3]),
+        # favorites.py / users.py
+        "favorite status": favorite_statement(10, email),
+        "my favorites": users.my_favorites_statement(email, 1, 20),
+        "my posts": users.my_posts_statement(email),
+        "first admin check": users.first_admin_statement(),
+        # notifications.py / notification_digest.py / notification_hub.py
+        "notifications page": notifications.notifications_page_statement(email, 20),
+        "notifications cursor": notifications.notifications_page_statement(email, 20, cursor=cursor),
+        "notifications since": notifications.notifications_page_statement(email, 20, since=cursor),
+        "unread notifications": notifications.notifications_page_statement(email, 20, unread_only=True),
+        "digest group lookup": notification_digest.group_row_statement(email, "post:1:upvote"),
+        "stream poll": notification_hub.poll_statement(now - timedelta(seconds=notification_hub.POLL_INTERVAL)),
+        "stream poll start": notification_hub.last_id_statement(),
+        "stream poll resyncs": notification_hub.resync_poll_statement(
+            now - timedelta(seconds=notification_hub.POLL_INTERVAL)
+        ),
+        # reports.py / feedback.py / admin_moderation.py
+        "pending report check": reports.pending_report_statement(email, "post", 10),
+        "my reports": reports.my_reports_statement(email),
+        "admin reports": admin_moderation.admin_page_statement(
+            admin_moderation.reports_statement("pending"), database.Report.created_at, 1, 20
+        ),
+        "my feedback": feedback.my_feedback_statement(email),
+        "admin feedback": admin_moderation.admin_page_statement(
+            admin_moderation.feedback_statement("pending"), database.Feedback.created_at, 1, 20
+        ),
+        "sensitive words list": admin_moderation.sensitive_words_statement(),
+        # trending.py / ranking.py background jobs
+        "trending load": trending.load_statement(),
+        "hot score recompute batch": ranking.score_batch_statement(100, ranking.HOT_RECOMPUTE_BATCH),
+    }
+
+
+def explain(conn, stmt) -> tuple[list[str], bool]:
+    """Return the plan lines and whether the plan contains a full table scan."""
+    compiled = stmt.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.params
+    args = tuple(params[name] for name in compiled.positiontup) if compiled.positional else params
+    if conn.dialect.name == "sqlite":
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", args).all()
+        lines = [row[3] for row in rows]
+        # "SCAN posts" reads the table; "SCAN posts USING [COVERING] INDEX ..." walks an index
+        return lines, any(re.fullmatch(r"SCAN \S+( AS \S+)?", line) for line in lines)
+    if conn.dialect.name == "mysql":
+        rows = conn.exec_driver_sql(f"EXPLAIN {compiled}", args).mappings().all()
+        lines = [f"{row['table']}: type={row['type']} key={row['key']} rows={row['rows']}" for row in rows]
+        return lines, any(row["type"] == "ALL" for row in rows)
+    raise SystemExit(f"EXPLAIN is not supported for {conn.dialect.name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", action="store_true", help="insert the synthetic dataset into DATABASE_URL")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier for the seeded row counts")
+    args = parser.parse_args()
+
+    migrations.migrate(database.engine)
+    if USING_TEMP_DB or args.seed:
+        print("Seeding...")
+        seed(args.scale)
+
+    failures = []
+    with database.engine.connect() as conn:
+        search.detect_search_index(conn)
+        for name, stmt in router_queries(Session(bind=conn)).items():
+            lines, full_scan = explain(conn, stmt)
+            if full_scan and name not in ALLOWED_SCANS:
+                failures.append(name)
+                status = "FULL SCAN"
+            else:
+                status = "ok"
+            print(f"[{status}] {name}")
+            for line in lines:
+                print(f"    {line}")
+
+    if failures:
+        print(f"\n❌ {len(failures)} queries scan a whole table: {', '.join(failures)}")
+        sys.exit(1)
+    print("\n✅ No full table scans")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Builders of the list responses shared by /posts/, /boards, /tags and /bootstrap.
+
+The statement functions return the SELECTs the builders run, so
+explain_queries.py checks the plans of exactly these queries.
+"""
+import math
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+import cache
+import database
+import vote_buffer
+from utils import decode_cursor, decode_score_cursor, encode_cursor, encode_score_cursor, serialize_post_summary
+
+FEED_PAGE_SIZE = 20
+
+# Orders other than sort=new, each backed by an (is_hidden, column, id) index
+SORT_COLUMNS = {"hot": database.Post.hot_score, "top": database.Post.upvotes}
+
+
+# --- Boards and tags ---
+
+def board_counts_statement():
+    return (
+        select(database.Post.board_id, func.count())
+        .where(database.Post.board_id.is_not(None), database.Post.is_hidden.is_(False))
+        .group_by(database.Post.board_id)
+    )
+
+
+def boards_statement():
+    return select(database.Board).order_by(database.Board.sort_order.asc())
+
+
+def tags_statement():
+    return select(database.Post.tag).distinct()
+
+
+async def board_post_counts(db: AsyncSession) -> dict[int, int]:
+    """Visible posts per board, kept in cache.board_post_counts for BOARD_COUNTS_TTL."""
+    post_counts = cache.board_post_counts.get("counts")
+    if post_counts is None:
+        post_counts = dict((await db.execute(board_counts_statement())).all())
+        cache.board_post_counts.set("counts", post_counts)
+    return post_counts
+
+
+async def build_boards(db: AsyncSession, post_counts: dict[int, int]) -> dict:
+    boards = (await db.scalars(boards_statement())).all()
+    return {"boards": [
+        {"id": board.id, "name": board.name, "description": board.description,
+         "post_count": post_counts.get(board.id, 0)}
+        for board in boards
+    ]}
+
+
+async def build_tags(db: AsyncSession) -> dict:
+    tags = (await db.scalars(tags_statement())).all()
+    return {"tags": sorted([t for t in tags if t])}
+
+
+# --- Feed ---
+
+def visible_posts():
+    return select(database.Post).where(database.Post.is_hidden.is_(False))
+
+
+def feed_total_statement(query):
+    return select(func.count()).select_from(query.subquery())
+
+
+def feed_page_statement(
+    query,
+    sort: str = "new",
+    pagination: str = "page",
+    page: int = 1,
+    page_size: int = FEED_PAGE_SIZE,
+    cursor: str | None = None,
+    rank=None
+):
+    """
+    The SELECT of one page of query. Cursor pages fetch one extra row to tell
+    whether there is a next page; keyword rank only orders sort=new page mode.
+    """
+    column = SORT_COLUMNS.get(sort)
+    if pagination == "cursor":
+        if column is not None:
+            if cursor:
+                cursor_score, cursor_id = decode_score_cursor(cursor)
+                query = query.where(or_(
+                    column < cursor_score,
+                    and_(column == cursor_score, database.Post.id < cursor_id)
+                ))
+            order_by = [column.desc(), database.Post.id.desc()]
+        else:
+            if cursor:
+                cursor_time, cursor_id = decode_cursor(cursor)
+                query = query.where(or_(
+                    database.Post.release_time < cursor_time,
+                    and_(database.Post.release_time == cursor_time, database.Post.id < cursor_id)
+                ))
+            order_by = [database.Post.release_time.desc(), database.Post.id.desc()]
+        return query.options(joinedload(database.Post.author)).order_by(*order_by).limit(page_size + 1)
+
+    if column is not None:
+        order_by = [column.desc(), database.Post.id.desc()]
+    else:
+        order_by = [database.Post.release_time.desc()]
+        if rank is not None:
+            order_by.insert(0, rank.asc())
+    return (
+        query.options(joinedload(database.Post.author))
+        .order_by(*order_by).offset((page - 1) * page_size).limit(page_size)
+    )
+
+
+async def build_feed_page(
+    db: AsyncSession,
+    query,
+    sort: str = "new",
+    pagination: str = "page",
+    page: int = 1,
+    page_size: int = FEED_PAGE_SIZE,
+    cursor: str | None = None,
+    with_total: bool = False,
+    rank=None
+) -> dict:
+    """A /posts/ response body for query, a visible_posts() select with the request's filters."""
+    total = None
+    if pagination == "page" or with_total:
+        total = await db.scalar(feed_total_statement(query))
+
+    posts = (await db.scalars(
+        feed_page_statement(query, sort, pagination, page, page_size, cursor, rank)
+    )).all()
+    result = [vote_buffer.buffer.overlay("post", serialize_post_summary(post)) for post in posts[:page_size]]
+
+    if pagination == "cursor":
+        next_cursor = None
+        if len(posts) > page_size:
+            last = posts[page_size - 1]
+            column = SORT_COLUMNS.get(sort)
+            if column is not None:
+                next_cursor = encode_score_cursor(getattr(last, column.key), last.id)
+            else:
+                next_cursor = encode_cursor(last.release_time, last.id)
+        response = {"posts": result, "next_cursor": next_cursor, "page_size": page_size}
+        if total is not None:
+            response["total"] = total
+        return response
+
+    return {
+        "posts": result,
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "total_pages": math.ceil(total / page_size) if total > 0 else 1
+    }
@@ -0,0 +1,166 @@
+"""
+Conditional GET for the public read endpoints.
+
+A response's ETag is derived from the request URL and the versions (see
+cache.get_versions) of the data it depends on:
+
+- "posts": anything shown in post lists, bumped by post, comment and vote writes
+  (for comments and votes at most every HTTP_CACHE_LIST_INTERVAL seconds, see below)
+- "post:<id>": one post's detail page and comments
+- "post_set": which posts are visible and their tags and boards, bumped when
+  posts are created, edited, deleted, hidden or unhidden (not by votes or comments)
+- "boards": the board list
+
+Writers bump the versions in the same transaction as their change (see
+invalidate_posts / invalidate_boards), so every worker sees the new ETag once it
+commits. Votes and comments are the exception for "posts": bumping that one
+row in every vote transaction would serialize all votes on it (a row lock on
+MySQL) and expire every list's ETag on each vote. They bump only their post's
+version and mark the lists stale; refresh_lists bumps "posts" in its own
+transaction every HTTP_CACHE_LIST_INTERVAL seconds, so list counters may lag
+by that long. A request with a matching If-None-Match gets a 304 after a single
+version lookup. Otherwise the serialized body is served from an in-process LRU
+keyed by ETag, or built and stored there.
+"""
+import hashlib
+import json
+import os
+from typing import Awaitable, Callable
+from fastapi import Request, Response
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+import cache
+import database
+
+HTTP_CACHE_SIZE = int(os.getenv("HTTP_CACHE_SIZE", "512"))
+CACHE_CONTROL = "no-cache"  # clients may store responses but must revalidate
+LIST_REFRESH_INTERVAL = float(os.getenv("HTTP_CACHE_LIST_INTERVAL", "5"))
+
+bodies = cache.TTLCache(maxsize=HTTP_CACHE_SIZE, ttl=float(os.getenv("HTTP_CACHE_TTL", "600")))
+# Changes visible only in this worker (buffered votes); stays 0 otherwise
+local_generation = 0
+# A committed vote or comment changed counters shown in post lists
+lists_stale = False
+
+
+def post_version(post_id: int) -> str:
+    return f"post:{post_id}"
+
+
+async def invalidate_posts(db: AsyncSession, *post_ids: int):
+    """Call inside the writing transaction when posts, their comments or their votes change."""
+    await cache.bump_version(db, "posts")
+    for post_id in post_ids:
+        await cache.bump_version(db, post_version(post_id))
+
+
+async def invalidate_post_counters(db: AsyncSession, *post_ids: int):
+    """
+    Call inside the writing transaction when votes or comments change post
+    counters; post lists follow within LIST_REFRESH_INTERVAL (see refresh_lists).
+    """
+    for post_id in post_ids:
+        await cache.bump_version(db, post_version(post_id))
+    db.info["stale_lists"] = True
+
+
+async def refresh_lists():
+    """Background job: bump "posts" once for all votes and comments committed since the last run."""
+    global lists_stale
+    if not lists_stale:
+        return
+    lists_stale = False
+    try:
+        async with database.AsyncSessionLocal() as db:
+            await cache.bump_version(db, "posts")
+            await db.commit()
+    except Exception:
+        lists_stale = True
+        raise
+
+
+@event.listens_for(Session, "after_commit")
+def _mark_lists_stale(session: Session):
+    global lists_stale
+    if session.info.pop("stale_lists", False):
+        lists_stale = True
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_stale_lists(session: Session):
+    session.info.pop("stale_lists", None)
+
+
+async def invalidate_post_set(db: AsyncSession):
+    """Call together with invalidate_posts when posts appear, disappear or change tag or board."""
+    await cache.bump_version(db, "post_set")
+
+
+async def invalidate_comments(db: AsyncSession, post_id: int):
+    """Comments only appear under their post, so post lists stay valid."""
+    await cache.bump_version(db, post_version(post_id))
+
+
+async def invalidate_boards(db: AsyncSession):
+    await cache.bump_version(db, "boards")
+
+
+def invalidate_local():
+    """Invalidate this worker's responses for changes not yet written to the database."""
+    global local_generation
+    local_generation += 1
+
+
+def render(content) -> bytes:
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    tags = [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]
+    return etag in tags or "*" in tags
+
+
+def _response(etag: str, body: bytes | None) -> Response:
+    """The full response, or a 304 when body is None."""
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if body is None:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+async def respond(
+    request: Request,
+    db: AsyncSession,
+    versions: list[str],
+    build: Callable[[], Awaitable[object]],
+    extra: str = ""
+) -> Response:
+    """
+    Serve build()'s result with an ETag derived from versions.
+    extra is folded into the ETag for inputs that have no stored version,
+    e.g. the board counts snapshot.
+    """
+    current = await cache.get_versions(db, versions)
+    tag_source = [str(request.url.path), str(request.url.query), sorted(current.items()), extra, local_generation]
+    etag = '"' + hashlib.sha1(repr(tag_source).encode()).hexdigest()[:20] + '"'
+
+    if _not_modified(request, etag):
+        return _response(etag, None)
+    body = bodies.get(etag)
+    if body is None:
+        body = render(await build())
+        bodies.set(etag, body)
+    return _response(etag, body)
+
+
+def respond_prebuilt(request: Request, etag: str, body: bytes) -> Response:
+    """Serve a body the caller serialized and versioned itself (see bootstrap)."""
+    return _response(etag, None if _not_modified(request, etag) else body)
+
+
+def respond_unversioned(request: Request, content) -> Response:
+    """ETag from the body itself, for endpoints without a version; only saves bandwidth."""
+    body = render(content)
+    etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+    return _response(etag, None if _not_modified(request, etag) else body)
@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 """
 Database initialization script for Campus Forum
-This script creates all necessary database tables
+This script creates all necessary database tables and applies pending
+schema migrations (see migrations.py)
 """
 
 import sys
@@ -10,31 +11,15 @@ import os
 # Add the backend directory to the Python path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from database import init_db, engine, Base, inspect, text
+from database import engine
+import migrations
 
 if __name__ == "__main__":
     print("Initializing database...")
-    print("Creating tables...")
+    print("Creating tables and applying migrations...")
     
     try:
-        # Create all tables (including new ones)
-        Base.metadata.create_all(bind=engine)
-        
-        # Handle schema migrations for existing tables
-        with engine.begin() as conn:
-            # Users table migrations
-            user_columns = {col["name"] for col in inspect(conn).get_columns("users")}
-            if "is_admin" not in user_columns:
-                conn.execute(text("ALTER TABLE users ADD COLUMN is_admin BOOLEAN DEFAULT 0"))
-            if "is_banned" not in user_columns:
-                conn.execute(text("ALTER TABLE users ADD COLUMN is_banned BOOLEAN DEFAULT 0"))
-            
-            # Posts table migrations
-            post_columns = {col["name"] for col in inspect(conn).get_columns("posts")}
-            if "is_hidden" not in post_columns:
-                conn.execute(text("ALTER TABLE posts ADD COLUMN is_hidden BOOLEAN DEFAULT 0"))
-            if "board_id" not in post_columns:
-                conn.execute(text("ALTER TABLE posts ADD COLUMN board_id INTEGER REFERENCES boards(id)"))
+        migrations.migrate(engine)
         
         print("Database tables created successfully!")
         print("\n✅ Database initialization completed successfully!")
@@ -50,6 +35,9 @@ if __name__ == "__main__":
         print("  - reports")
         print("  - feedback")
         print("  - boards")
+        print("  - cache_versions")
+        print("  - schema_migrations")
+        print("  - posts_fts (SQLite full-text index)")
         print("\nYou can now start the server with: uvicorn main:app --reload")
     except Exception as e:
         print(f"\n❌ Error initializing database: {e}")
@@ -3,14 +3,45 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
+import background
 import database
+import http_cache
+import metrics
+import migrations
+import notification_digest
+import notification_hub
+import ranking
+import trending
+import vote_buffer
 from routers import users, posts, comments, votes, favorites, notifications, upload, admin_moderation, reports, feedback, boards
+from routers import bootstrap as bootstrap_router
+from routers import metrics as metrics_router
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    database.init_db()
+    if migrations.AUTO_MIGRATE:
+        migrations.migrate(database.engine)
+    migrations.check_schema(database.engine)
+    background.start_periodic(
+        notification_digest.DIGEST_INTERVAL, notification_digest.digest.flush, run_on_shutdown=True
+    )
+    await trending.searches.load()
+    background.start_periodic(trending.SEARCH_FLUSH_INTERVAL, trending.searches.flush, run_on_shutdown=True)
+    if notification_hub.BACKEND == "database":
+        background.start_periodic(notification_hub.POLL_INTERVAL, notification_hub.hub.poll)
+    if vote_buffer.ENABLED:
+        background.start_periodic(vote_buffer.FLUSH_INTERVAL, vote_buffer.buffer.flush, run_on_shutdown=True)
+    if ranking.HOT_RECOMPUTE_INTERVAL > 0:
+        background.start_periodic(ranking.HOT_RECOMPUTE_INTERVAL, ranking.recompute_hot_scores)
+    # After the vote buffer, so its last flush on shutdown reaches the lists
+    background.start_periodic(http_cache.LIST_REFRESH_INTERVAL, http_cache.refresh_lists, run_on_shutdown=True)
+    if metrics.METRICS_DIR:
+        background.start_periodic(metrics.METRICS_FLUSH_INTERVAL, metrics.flush, run_on_shutdown=True)
     yield
+    await background.shutdown()
+    await database.async_engine.dispose()
+    await database.read_async_engine.dispose()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -21,6 +52,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
 
 # Create uploads directory if it doesn't exist
 Path("uploads").mkdir(exist_ok=True)
@@ -40,6 +72,8 @@ app.include_router(admin_moderation.router)
 app.include_router(reports.router)
 app.include_router(feedback.router)
 app.include_router(boards.router)
+app.include_router(bootstrap_router.router)
+app.include_router(metrics_router.router)
 
 
 @app.get("/")
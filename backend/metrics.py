@@ -0,0 +1,280 @@
+"""
+Metrics for /metrics in the Prometheus text format.
+
+MetricsMiddleware counts requests and records their latency per route
+template (/posts/{post_id}, not the raw path), and SQLAlchemy cursor events
+count the statements each request runs and the time they take. Recording is
+a few dict updates per request and statement, cheap enough to stay on.
+
+Each worker keeps its own values. With METRICS_DIR set, every worker writes a
+snapshot there every METRICS_FLUSH_INTERVAL seconds and /metrics adds up the
+snapshots of all workers, so any worker can answer a scrape. Counters of
+workers that have exited stay in the total; clear the directory when
+deploying. Gauges only come from snapshots written recently.
+"""
+import bisect
+import contextvars
+import json
+import os
+import time
+from collections import defaultdict
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import auth
+import database
+import db_pool
+
+PREFIX = "forum_"
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# name -> (type, help, how gauges of several workers combine)
+FAMILIES = {
+    "http_requests_total": ("counter", "HTTP requests by route template and status", "sum"),
+    "http_request_errors_total": ("counter", "HTTP requests that failed with a 5xx status", "sum"),
+    "http_request_duration_seconds": ("histogram", "HTTP request latency", "sum"),
+    "http_request_sql_statements": ("histogram", "SQL statements run per request", "sum"),
+    "sql_statements_total": ("counter", "SQL statements by route template, <background> outside requests", "sum"),
+    "sql_seconds_total": ("counter", "Time spent executing SQL statements", "sum"),
+    "db_pool_size": ("gauge", "Connections the pool keeps open", "sum"),
+    "db_pool_max_overflow": ("gauge", "Connections the pool may open beyond its size", "sum"),
+    "db_pool_in_use": ("gauge", "Connections checked out of the pool", "sum"),
+    "db_pool_idle": ("gauge", "Open connections waiting in the pool", "sum"),
+    "db_pool_overflow": ("gauge", "Connections open beyond the pool size", "sum"),
+    "db_pool_checkouts_total": ("counter", "Connection checkouts", "sum"),
+    "db_pool_checkout_seconds_total": ("counter", "Time spent checking out connections", "sum"),
+    "db_pool_checkout_seconds_max": ("gauge", "Slowest connection checkout", "max"),
+    "db_pool_waits_total": ("counter", "Checkouts that waited because every connection was in use", "sum"),
+    "db_pool_timeouts_total": ("counter", "Checkouts that gave up after DB_POOL_TIMEOUT", "sum"),
+    "password_hash_pending": ("gauge", "Password hashes queued or running", "sum"),
+    "password_hash_completed_total": ("counter", "Password hashes finished", "sum"),
+    "password_hash_failed_total": ("counter", "Password hash jobs that raised", "sum"),
+    "password_hash_rejected_total": ("counter", "Password hashes refused with 503", "sum"),
+}
+POOL_FIELDS = {
+    "db_pool_size": "size",
+    "db_pool_max_overflow": "max_overflow",
+    "db_pool_in_use": "in_use",
+    "db_pool_idle": "idle",
+    "db_pool_overflow": "overflow",
+    "db_pool_checkouts_total": "checkouts",
+    "db_pool_checkout_seconds_total": "checkout_seconds",
+    "db_pool_checkout_seconds_max": "max_checkout_seconds",
+    "db_pool_waits_total": "waits",
+    "db_pool_timeouts_total": "timeouts",
+}
+
+# (name, labels) -> value; labels are tuples of (key, value) pairs
+counters: dict[tuple[str, tuple], float] = defaultdict(float)
+# (name, labels) -> [per-bucket counts..., +Inf count, sum]
+histograms: dict[tuple[str, tuple], list] = {}
+BUCKETS = {
+    "http_request_duration_seconds": LATENCY_BUCKETS,
+    "http_request_sql_statements": STATEMENT_BUCKETS,
+}
+
+
+def observe(name: str, labels: tuple, value: float):
+    buckets = BUCKETS[name]
+    series = histograms.get((name, labels))
+    if series is None:
+        series = histograms[(name, labels)] = [0] * (len(buckets) + 1) + [0.0]
+    series[bisect.bisect_left(buckets, value)] += 1
+    series[-1] += value
+
+
+# --- SQL statements ---
+
+class SqlUsage:
+    __slots__ = ("statements", "seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+
+
+_request_sql: contextvars.ContextVar[SqlUsage | None] = contextvars.ContextVar("request_sql", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["metrics_started"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["metrics_started"]
+    usage = _request_sql.get()
+    if usage is None:
+        counters[("sql_statements_total", (("route", "<background>"),))] += 1
+        counters[("sql_seconds_total", (("route", "<background>"),))] += elapsed
+    else:
+        usage.statements += 1
+        usage.seconds += elapsed
+
+
+# --- Requests ---
+
+class MetricsMiddleware:
+    """Plain ASGI middleware, so streaming responses pass through untouched."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        usage = SqlUsage()
+        token = _request_sql.set(usage)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _request_sql.reset(token)
+            _record_request(scope, status, time.perf_counter() - started, usage)
+
+
+def _record_request(scope, status: int, elapsed: float, usage: SqlUsage):
+    route = scope.get("route")
+    # Unmatched paths share one label so random URLs cannot grow the series
+    template = getattr(route, "path", None) or "<unmatched>"
+    labels = (("method", scope["method"]), ("route", template))
+    counters[("http_requests_total", labels + (("status", str(status)),))] += 1
+    if status >= 500:
+        counters[("http_request_errors_total", labels)] += 1
+    observe("http_request_duration_seconds", labels, elapsed)
+    observe("http_request_sql_statements", labels, usage.statements)
+    route_labels = (("route", template),)
+    counters[("sql_statements_total", route_labels)] += usage.statements
+    counters[("sql_seconds_total", route_labels)] += usage.seconds
+
+
+# --- Snapshots ---
+
+def snapshot() -> dict:
+    """This worker's values, in a JSON-friendly form."""
+    own_counters = [[name, labels, value] for (name, labels), value in counters.items()]
+    gauges = []
+    for role, engine in database.async_engines().items():
+        status = db_pool.pool_status(engine.sync_engine)
+        if status is None:
+            continue
+        for name, field in POOL_FIELDS.items():
+            if field in status:
+                target = gauges if FAMILIES[name][0] == "gauge" else own_counters
+                target.append([name, [["pool", role]], status[field]])
+    stats = auth.get_hash_stats()
+    gauges.append(["password_hash_pending", [], stats["pending"]])
+    own_counters.append(["password_hash_completed_total", [], stats["completed"]])
+    own_counters.append(["password_hash_failed_total", [], stats["failed"]])
+    own_counters.append(["password_hash_rejected_total", [], stats["rejected"]])
+    return {
+        "written_at": time.time(),
+        "counters": own_counters,
+        "gauges": gauges,
+        "histograms": [[name, labels, series] for (name, labels), series in histograms.items()],
+    }
+
+
+def write_snapshot():
+    path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+    with open(f"{path}.tmp", "w") as file:
+        json.dump(snapshot(), file)
+    os.replace(f"{path}.tmp", path)
+
+
+async def flush():
+    """Background job: publish this worker's snapshot for the other workers' /metrics."""
+    if METRICS_DIR:
+        write_snapshot()
+
+
+def _snapshots() -> list[dict]:
+    if not METRICS_DIR:
+        return [snapshot()]
+    write_snapshot()
+    snapshots = []
+    for file_name in os.listdir(METRICS_DIR):
+        if not file_name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, file_name)) as file:
+                snapshots.append(json.load(file))
+        except (OSError, ValueError):
+            continue  # being replaced, or removed by a deploy
+    return snapshots
+
+
+# --- Exposition ---
+
+def _key(labels) -> tuple:
+    return tuple(tuple(pair) for pair in labels)
+
+
+def _labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escape = str.maketrans({"\\": "\\\\", '"': '\\"', "\n": "\\n"})
+    return "{" + ",".join(f'{key}="{str(value).translate(escape)}"' for key, value in pairs) + "}"
+
+
+def _format(value: float) -> str:
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+def render() -> str:
+    snapshots = _snapshots()
+    fresh_after = time.time() - 3 * METRICS_FLUSH_INTERVAL
+    merged: dict[str, dict[tuple, object]] = defaultdict(dict)
+    for snap in snapshots:
+        for name, labels, value in snap["counters"]:
+            series = merged[name]
+            series[_key(labels)] = series.get(_key(labels), 0) + value
+        if snap["written_at"] >= fresh_after:
+            for name, labels, value in snap["gauges"]:
+                series = merged[name]
+                previous = series.get(_key(labels))
+                if previous is None:
+                    series[_key(labels)] = value
+                elif FAMILIES[name][2] == "max":
+                    series[_key(labels)] = max(previous, value)
+                else:
+                    series[_key(labels)] = previous + value
+        for name, labels, values in snap["histograms"]:
+            series = merged[name]
+            previous = series.get(_key(labels))
+            series[_key(labels)] = values if previous is None else [a + b for a, b in zip(previous, values)]
+
+    lines = []
+    for name, (kind, help_text, _) in FAMILIES.items():
+        if not merged.get(name):
+            continue
+        lines.append(f"# HELP {PREFIX}{name} {help_text}")
+        lines.append(f"# TYPE {PREFIX}{name} {kind}")
+        for labels, value in sorted(merged[name].items()):
+            if kind != "histogram":
+                lines.append(f"{PREFIX}{name}{_labels(labels)} {_format(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip((*BUCKETS[name], "+Inf"), value[:-1]):
+                cumulative += count
+                lines.append(f"{PREFIX}{name}_bucket{_labels(labels, (('le', bound),))} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {_format(value[-1])}")
+            lines.append(f"{PREFIX}{name}_count{_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
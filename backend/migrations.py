@@ -0,0 +1,284 @@
+"""
+Versioned schema migrations.
+
+    python migrations.py          # apply pending migrations (init_db.py does the same)
+    python migrations.py status   # show the current and latest version
+
+Each migration has an increasing version number. Its DDL step runs in one
+transaction. An optional backfill then runs in batches of
+MIGRATION_BATCH_SIZE rows, one short transaction each, so large tables are
+never locked for the whole update. The version is recorded in
+schema_migrations only after both have finished. Steps and backfills
+must be idempotent: create_all may already have created what they add, and
+an interrupted migration is simply run again.
+
+migrate() holds a database-wide lock while it runs, so when several workers
+start at once only one of them migrates. The API itself only verifies the
+version at startup (check_schema) unless AUTO_MIGRATE=1.
+"""
+import os
+import sys
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+import database
+import ranking
+import search
+
+try:
+    import fcntl
+except ImportError:  # Windows: no file locking for SQLite, run one worker while migrating
+    fcntl = None
+
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "0") == "1"
+BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "1000"))
+LOCK_NAME = "campus_forum_migrations"
+LOCK_TIMEOUT = 600  # seconds to wait for another worker's migration
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    apply: Callable[[Connection], None]
+    backfill: Callable[[Engine], None] | None = None
+
+
+MIGRATIONS: list[Migration] = []
+
+
+def migration(version: int, name: str, backfill: Callable[[Engine], None] | None = None):
+    def register(apply: Callable[[Connection], None]):
+        MIGRATIONS.append(Migration(version, name, apply, backfill))
+        return apply
+    return register
+
+
+def add_column(conn: Connection, table: str, column: str, ddl: str):
+    """ALTER TABLE ... ADD COLUMN unless the column already exists."""
+    if column not in {col["name"] for col in inspect(conn).get_columns(table)}:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def create_indexes(conn: Connection, names: list[str]):
+    indexes = {index.name: index for table in database.Base.metadata.sorted_tables for index in table.indexes}
+    for name in names:
+        indexes[name].create(conn, checkfirst=True)
+
+
+# --- Migrations ---
+
+@migration(1, "moderation, board and notification grouping columns")
+def add_baseline_columns(conn: Connection):
+    """Columns that used to be added by ad-hoc ALTERs at startup."""
+    add_column(conn, "users", "is_admin", "BOOLEAN DEFAULT 0")
+    add_column(conn, "users", "is_banned", "BOOLEAN DEFAULT 0")
+    add_column(conn, "posts", "is_hidden", "BOOLEAN DEFAULT 0")
+    add_column(conn, "posts", "board_id", "INTEGER REFERENCES boards(id)")
+    add_column(conn, "notifications", "group_key", "VARCHAR(100)")
+    add_column(conn, "notifications", "actor_count", "INTEGER DEFAULT 1")
+
+
+def backfill_unread_notifications(engine: Engine):
+    last_email = ""
+    while True:
+        with engine.begin() as conn:
+            emails = conn.scalars(
+                select(database.User.user_email)
+                .where(database.User.user_email > last_email)
+                .order_by(database.User.user_email)
+                .limit(BATCH_SIZE)
+            ).all()
+            if not emails:
+                return
+            unread = (
+                select(func.count())
+                .where(database.Notification.user_email == database.User.user_email,
+                       database.Notification.is_read.is_(False))
+                .scalar_subquery()
+            )
+            conn.execute(
+                database.User.__table__.update()
+                .where(database.User.user_email.in_(emails))
+                .values(unread_notifications=unread)
+            )
+        last_email = emails[-1]
+
+
+@migration(2, "unread notification counter", backfill=backfill_unread_notifications)
+def add_unread_notifications(conn: Connection):
+    add_column(conn, "users", "unread_notifications", "INTEGER DEFAULT 0")
+
+
+@migration(3, "query indexes")
+def add_query_indexes(conn: Connection):
+    """Indexes for the filters and sort orders the routers use (see explain_queries.py)."""
+    create_indexes(conn, [
+        "ix_posts_feed",
+        "ix_posts_tag_feed",
+        "ix_posts_board_feed",
+        "ix_posts_user_time",
+        "ix_comments_post_time",
+        "ix_favorites_user",
+        "ix_notifications_group",
+        "ix_notifications_user_read_time",
+        "ix_notifications_user_time",
+        "ix_reports_status_time",
+        "ix_reports_reporter_time",
+        "ix_feedback_status_time",
+        "ix_feedback_user_time",
+    ])
+
+
+@migration(4, "full-text search index", backfill=lambda engine: search.backfill_search_index(engine, BATCH_SIZE))
+def add_search_index(conn: Connection):
+    search.create_search_index(conn)
+
+
+def backfill_comment_counts(engine: Engine):
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            post_ids = conn.scalars(
+                select(database.Post.id)
+                .where(database.Post.id > last_id)
+                .order_by(database.Post.id)
+                .limit(BATCH_SIZE)
+            ).all()
+            if not post_ids:
+                return
+            count = (
+                select(func.count())
+                .where(database.Comment.post_id == database.Post.id)
+                .scalar_subquery()
+            )
+            conn.execute(
+                database.Post.__table__.update()
+                .where(database.Post.id.in_(post_ids))
+                .values(comment_count=count)
+            )
+        last_id = post_ids[-1]
+
+
+@migration(5, "comment counts and top comments index", backfill=backfill_comment_counts)
+def add_comment_counts(conn: Connection):
+    add_column(conn, "posts", "comment_count", "INTEGER DEFAULT 0")
+    create_indexes(conn, ["ix_comments_post_top"])
+
+
+@migration(6, "user vote lookup index")
+def add_user_vote_index(conn: Connection):
+    create_indexes(conn, ["ix_votes_user_entity"])
+
+
+@migration(7, "hot ranking score", backfill=lambda engine: ranking.backfill_hot_scores(engine, BATCH_SIZE))
+def add_hot_score(conn: Connection):
+    add_column(conn, "posts", "hot_score", "DOUBLE PRECISION DEFAULT 0")
+    create_indexes(conn, ["ix_posts_hot", "ix_posts_top"])
+
+
+@migration(8, "vote notification actors")
+def add_notification_actors(conn: Connection):
+    add_column(conn, "notifications", "actors", "TEXT")
+
+
+@migration(9, "notification stream poll index")
+def add_notification_poll_index(conn: Connection):
+    create_indexes(conn, ["ix_notifications_release_time"])
+
+
+@migration(10, "trending load index")
+def add_search_history_index(conn: Connection):
+    create_indexes(conn, ["ix_search_history_last_searched"])
+
+
+@migration(11, "notification stream resync markers")
+def add_notification_resyncs(conn: Connection):
+    database.NotificationResync.__table__.create(conn, checkfirst=True)
+
+
+# --- Runner ---
+
+def head_version() -> int:
+    return max(step.version for step in MIGRATIONS)
+
+
+def current_version(conn: Connection) -> int:
+    if not inspect(conn).has_table(database.SchemaMigration.__tablename__):
+        return 0
+    return conn.scalar(select(func.max(database.SchemaMigration.version))) or 0
+
+
+@contextmanager
+def migration_lock(engine: Engine):
+    """Hold a lock that only one migrating process at a time can take."""
+    dialect = engine.dialect.name
+    if dialect == "mysql":
+        with engine.connect() as conn:
+            if conn.scalar(text("SELECT GET_LOCK(:name, :timeout)"), {"name": LOCK_NAME, "timeout": LOCK_TIMEOUT}) != 1:
+                raise RuntimeError("Timed out waiting for the migration lock")
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": LOCK_NAME})
+    elif dialect == "postgresql":
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(hashtext(:name))"), {"name": LOCK_NAME})
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(hashtext(:name))"), {"name": LOCK_NAME})
+    elif dialect == "sqlite" and fcntl and engine.url.database not in (None, "", ":memory:"):
+        # SQLite has no named locks; lock a file next to the database instead
+        with open(f"{engine.url.database}.migrate.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    else:
+        yield
+
+
+def migrate(engine: Engine = database.engine):
+    """Create missing tables and apply pending migrations."""
+    with migration_lock(engine):
+        database.Base.metadata.create_all(bind=engine)
+        with engine.connect() as conn:
+            applied = current_version(conn)
+        for step in sorted(MIGRATIONS, key=lambda m: m.version):
+            if step.version <= applied:
+                continue
+            with engine.begin() as conn:
+                step.apply(conn)
+            if step.backfill:
+                step.backfill(engine)
+            with engine.begin() as conn:
+                conn.execute(database.SchemaMigration.__table__.insert().values(
+                    version=step.version, name=step.name, applied_at=datetime.now()
+                ))
+            print(f"Applied migration {step.version}: {step.name}")
+
+
+def check_schema(engine: Engine = database.engine):
+    """Refuse to start on a database that is behind the code."""
+    with engine.connect() as conn:
+        version = current_version(conn)
+        search.detect_search_index(conn)
+    if version < head_version():
+        raise RuntimeError(
+            f"Database schema is at version {version}, this code needs {head_version()}. "
+            "Run `python init_db.py` (or set AUTO_MIGRATE=1) before starting the server."
+        )
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["status"]:
+        with database.engine.connect() as conn:
+            print(f"Schema version {current_version(conn)} (latest {head_version()})")
+    else:
+        migrate()
+        print("Database is up to date.")
@@ -0,0 +1,160 @@
+"""
+Coalesced vote notifications.
+
+Vote handlers queue a VoteEvent instead of inserting a notification row. A
+background job drains the queue every NOTIFICATION_DIGEST_INTERVAL seconds
+and folds the events into one unread row per (recipient, entity, vote type),
+e.g. "张三 等 42 人对你的帖子《...》点了赞". Once the recipient has read that
+row, the next vote starts a new one. The notifications table therefore
+grows with distinct events instead of raw votes.
+
+The row keeps its distinct actors (notifications.actors), so voting again,
+or voting, withdrawing and voting again, counts an actor once. Withdrawing
+or switching a vote takes the actor out of the row, and a row left without
+actors is deleted. Unread rows from before the actors column existed are
+left alone; the next vote starts a new row.
+
+A failed flush puts its events back in the queue. The queue holds at most
+NOTIFICATION_DIGEST_MAX_PENDING events; beyond that the oldest are dropped
+with a warning, so a database outage costs notifications, not memory.
+"""
+import json
+import logging
+import os
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from sqlalchemy import select, update
+import database
+import notification_hub
+from utils import create_notification
+
+logger = logging.getLogger(__name__)
+
+DIGEST_INTERVAL = float(os.getenv("NOTIFICATION_DIGEST_INTERVAL", "5"))
+MAX_PENDING = int(os.getenv("NOTIFICATION_DIGEST_MAX_PENDING", "50000"))
+VOTE_TYPES = ("upvote", "downvote")
+
+
+@dataclass
+class VoteEvent:
+    recipient_email: str
+    entity_type: str  # "post" / "comment"
+    entity_id: int
+    vote_type: str  # "upvote" / "downvote"
+    actor_email: str
+    actor_name: str
+    subject: str  # what was voted on, e.g. "你的帖子《标题》"
+    removed: bool = False  # the actor withdrew their vote on the entity
+
+    @property
+    def group_key(self) -> str:
+        return f"{self.entity_type}:{self.entity_id}:{self.vote_type}"
+
+
+def format_vote_message(actor_name: str, actor_count: int, subject: str, vote_type: str) -> str:
+    action = "赞" if vote_type == "upvote" else "反对"
+    if actor_count > 1:
+        return f"{actor_name} 等 {actor_count} 人对{subject}点了{action}"
+    return f"{actor_name} 对{subject}点了{action}"
+
+
+def group_row_statement(recipient_email: str, group_key: str):
+    """The unread coalesced row that new votes on group_key are folded into."""
+    return select(database.Notification).where(
+        database.Notification.user_email == recipient_email,
+        database.Notification.group_key == group_key,
+        database.Notification.is_read.is_(False),
+        database.Notification.actors.is_not(None)
+    ).limit(1)
+
+
+class NotificationDigest:
+    def __init__(self):
+        self.events: deque[VoteEvent] = deque()
+        self.dropped = 0
+
+    def record(self, event: VoteEvent):
+        self.events.append(event)
+        self._trim()
+
+    def _trim(self):
+        while len(self.events) > MAX_PENDING:
+            self.events.popleft()
+            self.dropped += 1
+
+    async def flush(self):
+        if self.dropped:
+            logger.warning("Notification digest queue full; dropped the %d oldest vote events", self.dropped)
+            self.dropped = 0
+        if not self.events:
+            return
+        events, self.events = list(self.events), deque()
+
+        # An actor's latest event on an entity is their current vote
+        latest: dict[tuple[str, str, int, str], VoteEvent] = {}
+        for event in events:
+            key = (event.recipient_email, event.entity_type, event.entity_id, event.actor_email)
+            latest.pop(key, None)
+            latest[key] = event
+
+        # Per group: actors joining it, in vote order, and actors leaving it
+        groups: dict[tuple[str, str], tuple[dict[str, VoteEvent], dict[str, VoteEvent]]] = {}
+        for event in latest.values():
+            for vote_type in VOTE_TYPES:
+                group_key = f"{event.entity_type}:{event.entity_id}:{vote_type}"
+                joined, left = groups.setdefault((event.recipient_email, group_key), ({}, {}))
+                if not event.removed and vote_type == event.vote_type:
+                    joined[event.actor_email] = event
+                else:
+                    left[event.actor_email] = event
+
+        try:
+            async with database.AsyncSessionLocal() as db:
+                for (recipient_email, group_key), (joined, left) in groups.items():
+                    row = await db.scalar(group_row_statement(recipient_email, group_key))
+                    actors = json.loads(row.actors) if row else {}
+                    before = list(actors.items())
+                    for actor_email in left:
+                        actors.pop(actor_email, None)
+                    for actor_email, event in joined.items():
+                        actors.pop(actor_email, None)
+                        actors[actor_email] = event.actor_name
+                    if list(actors.items()) == before:
+                        continue
+
+                    if row is not None and not actors:
+                        # Every actor withdrew: retract the notification
+                        await db.delete(row)
+                        await db.execute(
+                            update(database.User)
+                            .where(database.User.user_email == recipient_email)
+                            .values(unread_notifications=database.User.unread_notifications - 1)
+                        )
+                        await notification_hub.queue_resync(db, recipient_email)
+                        continue
+
+                    subject = (list(joined.values()) or list(left.values()))[-1].subject
+                    vote_type = group_key.rsplit(":", 1)[1]
+                    message = format_vote_message(list(actors.values())[-1], len(actors), subject, vote_type)
+                    if row is None:
+                        await create_notification(
+                            db, recipient_email, message, "vote",
+                            group_key=group_key, actor_count=len(actors),
+                            actors=json.dumps(actors, ensure_ascii=False)
+                        )
+                    else:
+                        row.actors = json.dumps(actors, ensure_ascii=False)
+                        row.actor_count = len(actors)
+                        row.message = message
+                        if joined:
+                            row.release_time = datetime.now()
+                            notification_hub.queue(db, row, updated=True)
+                await db.commit()
+        except Exception:
+            logger.exception("Notification digest failed; requeueing %d events", len(events))
+            self.events.extendleft(reversed(events))
+            self._trim()
+
+
+digest = NotificationDigest()
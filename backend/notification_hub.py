@@ -0,0 +1,210 @@
+"""
+Server push for notifications (GET /notifications/stream, Server-Sent Events).
+
+create_notification queues the new row on the session, and once the
+transaction commits the hub hands it to every open stream of the recipient.
+How an event reaches the hub depends on NOTIFICATION_STREAM_BACKEND:
+
+- "memory" (default): published in-process. Use with a single worker.
+- "database": every worker polls the notifications table once every
+  NOTIFICATION_STREAM_POLL_INTERVAL seconds and fans out what it finds, so
+  a notification created in one worker reaches streams held by any other.
+  It costs one query per worker per interval, however many clients are
+  connected.
+
+A new row is sent as a "notification" event, which adds one to the client's
+unread count. A coalesced vote row that gained actors (see
+notification_digest) is sent again as an "updated" event, which refreshes it
+without counting it twice. When every actor withdraws and the row is
+deleted, the client gets "resync" and reloads the count; the database
+backend finds those in notification_resyncs, which keeps a few minutes of
+markers.
+
+Each stream has a bounded queue. A client that falls behind gets a single
+"resync" event and should reload its unread count instead of receiving a
+backlog.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import delete, event, func, select
+from sqlalchemy.orm import Session
+import database
+
+logger = logging.getLogger(__name__)
+
+BACKEND = os.getenv("NOTIFICATION_STREAM_BACKEND", "memory")
+POLL_INTERVAL = float(os.getenv("NOTIFICATION_STREAM_POLL_INTERVAL", "2"))
+HEARTBEAT_INTERVAL = float(os.getenv("NOTIFICATION_STREAM_HEARTBEAT", "15"))
+QUEUE_SIZE = int(os.getenv("NOTIFICATION_STREAM_QUEUE_SIZE", "50"))
+MAX_CONNECTIONS = int(os.getenv("NOTIFICATION_STREAM_MAX_CONNECTIONS", "5000"))
+
+RESYNC = {"type": "resync"}
+# How long notification_resyncs rows are kept; far longer than a poll window
+RESYNC_RETENTION = timedelta(minutes=5)
+
+
+def serialize(notification: database.Notification, updated: bool = False) -> dict:
+    return {
+        "type": "updated" if updated else "notification",
+        "id": notification.id,
+        "message": notification.message,
+        "notification_type": notification.notification_type,
+        "actor_count": notification.actor_count or 1,
+        "release_time": notification.release_time.strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
+def poll_statement(since: datetime):
+    """Rows created or re-coalesced after since, for the database backend's poll."""
+    return (
+        select(database.Notification)
+        .where(database.Notification.release_time > since)
+        .order_by(database.Notification.release_time)
+    )
+
+
+def last_id_statement():
+    return select(func.max(database.Notification.id))
+
+
+def resync_poll_statement(since: datetime):
+    """Users whose unread count changed without a row to send, after since."""
+    return select(database.NotificationResync).where(database.NotificationResync.created_at > since)
+
+
+class Subscriber:
+    def __init__(self, user_email: str):
+        self.user_email = user_email
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+
+    def offer(self, payload: dict):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            # Drop the backlog and ask the client to reload instead
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+    async def next(self, timeout: float) -> dict | None:
+        """Wait for the next event; None when nothing arrived within timeout."""
+        try:
+            payload = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if payload is RESYNC:
+            self.overflowed = False
+        return payload
+
+
+class NotificationHub:
+    def __init__(self):
+        self.subscribers: dict[str, set[Subscriber]] = {}
+        self.connections = 0
+        # Watermarks and recently delivered rows for the database backend;
+        # rows up to last_id existed before, so seeing them again means an update
+        self.polled_until = datetime.now()
+        self.last_id: int | None = None
+        self.recent: dict[tuple[int, datetime], datetime] = {}
+        self.recent_resyncs: dict[int, datetime] = {}
+
+    def subscribe(self, user_email: str) -> Subscriber | None:
+        """Register a stream; None when this worker is at MAX_CONNECTIONS."""
+        if self.connections >= MAX_CONNECTIONS:
+            return None
+        subscriber = Subscriber(user_email)
+        self.subscribers.setdefault(user_email, set()).add(subscriber)
+        self.connections += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        streams = self.subscribers.get(subscriber.user_email)
+        if streams and subscriber in streams:
+            streams.discard(subscriber)
+            self.connections -= 1
+            if not streams:
+                del self.subscribers[subscriber.user_email]
+
+    def deliver(self, user_email: str, payload: dict):
+        for subscriber in self.subscribers.get(user_email, ()):
+            subscriber.offer(payload)
+
+    def publish(self, user_email: str, payload: dict):
+        """Called after commit; the database backend picks rows up by polling instead."""
+        if BACKEND == "memory":
+            self.deliver(user_email, payload)
+
+    async def poll(self):
+        """Database backend: fan out rows created or re-coalesced, and resync markers, since the last poll."""
+        # Overlap the window a little so rows committed late are not missed
+        since = self.polled_until - timedelta(seconds=POLL_INTERVAL)
+        self.polled_until = datetime.now()
+        if self.last_id is None:
+            # First poll: only record where new rows start
+            async with database.ReadSessionLocal() as db:
+                self.last_id = await db.scalar(last_id_statement()) or 0
+            return
+        if not self.subscribers:
+            self.recent.clear()
+            self.recent_resyncs.clear()
+            return
+        async with database.ReadSessionLocal() as db:
+            rows = (await db.scalars(poll_statement(since))).all()
+            resyncs = (await db.scalars(resync_poll_statement(since))).all()
+        last_id = self.last_id
+        for row in rows:
+            key = (row.id, row.release_time)
+            if key in self.recent:
+                continue
+            self.recent[key] = row.release_time
+            self.deliver(row.user_email, serialize(row, updated=row.id <= last_id))
+            self.last_id = max(self.last_id, row.id)
+        self.recent = {key: seen for key, seen in self.recent.items() if seen > since}
+        for resync in resyncs:
+            if resync.id not in self.recent_resyncs:
+                self.recent_resyncs[resync.id] = resync.created_at
+                self.deliver(resync.user_email, RESYNC)
+        self.recent_resyncs = {key: seen for key, seen in self.recent_resyncs.items() if seen > since}
+
+
+hub = NotificationHub()
+
+
+def queue(db, notification: database.Notification, updated: bool = False):
+    """Publish notification to the recipient's streams once db commits; updated for a re-coalesced row."""
+    db.info.setdefault("pending_notifications", []).append((notification, updated))
+
+
+async def queue_resync(db, user_email: str):
+    """Ask the user's streams to reload the unread count once db commits, e.g. after a row was deleted."""
+    db.info.setdefault("pending_resyncs", set()).add(user_email)
+    if BACKEND == "database":
+        # Other workers only learn about it from the table
+        now = datetime.now()
+        await db.execute(delete(database.NotificationResync).where(
+            database.NotificationResync.created_at < now - RESYNC_RETENTION
+        ))
+        db.add(database.NotificationResync(user_email=user_email, created_at=now))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending(session: Session):
+    for notification, updated in session.info.pop("pending_notifications", ()):
+        try:
+            hub.publish(notification.user_email, serialize(notification, updated))
+        except Exception:
+            logger.exception("Failed to publish notification %s", notification.id)
+    for user_email in session.info.pop("pending_resyncs", ()):
+        hub.publish(user_email, RESYNC)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending(session: Session):
+    session.info.pop("pending_notifications", None)
+    session.info.pop("pending_resyncs", None)
@@ -0,0 +1,120 @@
+"""
+Hot ranking of posts (sort=hot in /posts/).
+
+posts.hot_score follows Reddit's formula: the order of magnitude of a post's
+score (net votes plus HOT_COMMENT_WEIGHT per comment) plus its release time
+divided by HOT_TIME_SCALE, so a post needs ten times the score to rank level
+with one posted HOT_TIME_SCALE seconds later. The time term grows with the
+release time instead of shrinking with age, so stored scores never go stale
+as time passes and the hot feed is an index scan on (is_hidden, hot_score).
+
+Vote and comment writes call refresh_hot_scores for the posts they touch.
+recompute_hot_scores runs in the background every HOT_RECOMPUTE_INTERVAL
+seconds and rewrites any score that differs from the formula, e.g. after
+counters were edited outside the API or the HOT_* settings changed.
+"""
+import logging
+import math
+import os
+from datetime import datetime
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+import database
+import http_cache
+
+logger = logging.getLogger(__name__)
+
+HOT_EPOCH = datetime(2024, 1, 1)
+HOT_TIME_SCALE = float(os.getenv("HOT_TIME_SCALE", "45000"))
+HOT_COMMENT_WEIGHT = float(os.getenv("HOT_COMMENT_WEIGHT", "0.5"))
+HOT_RECOMPUTE_INTERVAL = float(os.getenv("HOT_RECOMPUTE_INTERVAL", "3600"))
+HOT_RECOMPUTE_BATCH = int(os.getenv("HOT_RECOMPUTE_BATCH", "1000"))
+
+SCORE_COLUMNS = (
+    database.Post.id,
+    database.Post.upvotes,
+    database.Post.downvotes,
+    database.Post.comment_count,
+    database.Post.release_time,
+    database.Post.hot_score,
+)
+
+
+def hot_score(upvotes: int, downvotes: int, comment_count: int, release_time: datetime | None) -> float:
+    score = (upvotes or 0) - (downvotes or 0) + HOT_COMMENT_WEIGHT * (comment_count or 0)
+    sign = 1 if score > 0 else -1 if score < 0 else 0
+    seconds = ((release_time or HOT_EPOCH) - HOT_EPOCH).total_seconds()
+    # Rounded so a recomputed score compares equal to the stored one
+    return round(sign * math.log10(max(abs(score), 1)) + seconds / HOT_TIME_SCALE, 7)
+
+
+def _changed_scores(rows) -> list[dict]:
+    changed = []
+    for row in rows:
+        score = hot_score(row.upvotes, row.downvotes, row.comment_count, row.release_time)
+        if score != row.hot_score:
+            changed.append({
+                "post_id": row.id, "score": score,
+                "seen_upvotes": row.upvotes or 0,
+                "seen_downvotes": row.downvotes or 0,
+                "seen_comments": row.comment_count or 0
+            })
+    return changed
+
+
+_posts = database.Post.__table__
+# Skips rows whose counters moved since they were read; that writer refreshes the score itself
+_update_score = update(_posts).where(
+    _posts.c.id == bindparam("post_id"),
+    func.coalesce(_posts.c.upvotes, 0) == bindparam("seen_upvotes"),
+    func.coalesce(_posts.c.downvotes, 0) == bindparam("seen_downvotes"),
+    func.coalesce(_posts.c.comment_count, 0) == bindparam("seen_comments"),
+).values(hot_score=bindparam("score"))
+
+
+def score_batch_statement(last_id: int, limit: int):
+    """The next limit posts after last_id, in id order, with the columns the score needs."""
+    return select(*SCORE_COLUMNS).where(database.Post.id > last_id).order_by(database.Post.id).limit(limit)
+
+
+async def refresh_hot_scores(db: AsyncSession, *post_ids: int):
+    """Recompute the scores of posts whose counters changed; call inside the writing transaction."""
+    rows = (await db.execute(select(*SCORE_COLUMNS).where(database.Post.id.in_(post_ids)))).all()
+    changed = _changed_scores(rows)
+    if changed:
+        await db.execute(_update_score, changed)
+
+
+async def recompute_hot_scores():
+    """Background job: rewrite stale scores, HOT_RECOMPUTE_BATCH posts per transaction."""
+    last_id = 0
+    updated = 0
+    while True:
+        async with database.ReadSessionLocal() as db:
+            rows = (await db.execute(score_batch_statement(last_id, HOT_RECOMPUTE_BATCH))).all()
+        if not rows:
+            break
+        changed = _changed_scores(rows)
+        if changed:
+            async with database.AsyncSessionLocal() as db:
+                await db.execute(_update_score, changed)
+                await http_cache.invalidate_post_counters(db)
+                await db.commit()
+            updated += len(changed)
+        last_id = rows[-1].id
+    if updated:
+        logger.info("Recomputed %d hot scores", updated)
+
+
+def backfill_hot_scores(engine, batch_size: int):
+    """Score existing posts, batch_size posts per transaction (used by the migration)."""
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(score_batch_statement(last_id, batch_size)).all()
+            if not rows:
+                return
+            changed = _changed_scores(rows)
+            if changed:
+                conn.execute(_update_score, changed)
+        last_id = rows[-1].id
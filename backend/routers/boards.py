@@ -1,24 +1,17 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 import auth
 import database
+import feed
+import http_cache
 
 router = APIRouter()
 
 
 @router.get("/boards")
-async def list_boards(db: Session = Depends(database.get_db)):
-    boards = db.query(database.Board).order_by(database.Board.sort_order.asc()).all()
-    result = []
-    for board in boards:
-        post_count = db.query(database.Post).filter(
-            database.Post.board_id == board.id,
-            database.Post.is_hidden.is_(False)
-        ).count()
-        result.append({
-            "id": board.id,
-            "name": board.name,
-            "description": board.description,
-            "post_count": post_count
-        })
-    return {"boards": result}
+async def list_boards(request: Request, db: AsyncSession = Depends(database.get_read_db)):
+    post_counts = await feed.board_post_counts(db)
+    # The counts come from a TTL cache rather than a stored version, so they go into the ETag directly
+    return await http_cache.respond(
+        request, db, ["boards"], lambda: feed.build_boards(db, post_counts), extra=repr(sorted(post_counts.items()))
+    )
@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+import bootstrap
+import database
+import http_cache
+
+router = APIRouter()
+
+
+@router.get("/bootstrap")
+async def get_bootstrap(request: Request, db: AsyncSession = Depends(database.get_read_db)):
+    """
+    Everything the home page needs in one response: boards, trending, tags and
+    feed, each shaped like /boards, /trending-searches, /tags and the first
+    page of /posts/. Served from bootstrap.snapshot with an ETag.
+    """
+    etag, body = await bootstrap.snapshot.get(db)
+    return http_cache.respond_prebuilt(request, etag, body)
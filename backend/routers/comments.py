@@ -1,10 +1,14 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
 from datetime import datetime
-from sqlalchemy.orm import Session
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
 import auth
 import database
+import http_cache
+import ranking
+import vote_buffer
 from models import CommentCreate, CommentUpdate
-from utils import create_notification, ensure_not_banned, validate_no_sensitive_words
+from utils import create_notification, ensure_not_banned, get_comment_page, serialize_comment, validate_no_sensitive_words
 
 router = APIRouter()
 
@@ -14,17 +18,15 @@ async def create_comment(
     post_id: int,
     request: CommentCreate,
     current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    user: auth.Principal = Depends(auth.get_current_principal),
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    post = db.query(database.Post).filter(database.Post.id == post_id).first()
+    post = await db.get(database.Post, post_id)
     if not post or post.is_hidden:
         raise HTTPException(status_code=404, detail="Post not found")
 
-    user = db.query(database.User).filter(database.User.user_email == current_user_email).first()
-    if not user:
-        raise HTTPException(status_code=400, detail="User not found")
     ensure_not_banned(user)
-    validate_no_sensitive_words(db, request.content)
+    await validate_no_sensitive_words(db, request.content)
 
     new_comment = database.Comment(
         post_id=post_id,
@@ -37,44 +39,53 @@ async def create_comment(
     )
 
     db.add(new_comment)
+    await db.execute(
+        update(database.Post).where(database.Post.id == post_id)
+        .values(comment_count=database.Post.comment_count + 1)
+    )
+    await ranking.refresh_hot_scores(db, post_id)
     if post.user_email != current_user_email:
-        create_notification(
+        await create_notification(
             db,
             post.user_email,
             f"{user.user_name} 回复了你的帖子《{post.title}》",
             "reply"
         )
-    db.commit()
-    db.refresh(new_comment)
+    # Post lists show comment_count
+    await http_cache.invalidate_post_counters(db, post_id)
+    await db.commit()
+    await db.refresh(new_comment)
 
     return {"message": "Comment created successfully", "comment_id": new_comment.id}
 
 
 @router.get("/posts/{post_id}/comments")
-async def get_comments(post_id: int, db: Session = Depends(database.get_db)):
-    post = db.query(database.Post).filter(database.Post.id == post_id).first()
-    if not post or post.is_hidden:
-        raise HTTPException(status_code=404, detail="Post not found")
-
-    comments = db.query(database.Comment).filter(
-        database.Comment.post_id == post_id
-    ).order_by(database.Comment.release_time.asc()).all()
-
-    result = []
-    for comment in comments:
-        result.append({
-            "id": comment.id,
-            "post_id": comment.post_id,
-            "content": comment.content,
-            "image_url": comment.image_url,
-            "user_email": comment.user_email,
-            "release_time": comment.release_time.strftime("%Y-%m-%d %H:%M:%S"),
-            "user_name": comment.author.user_name,
-            "upvotes": comment.upvotes,
-            "downvotes": comment.downvotes
-        })
-
-    return result
+async def get_comments(
+    post_id: int,
+    request: Request,
+    sort: str = Query(default="time", pattern="^(time|top)$"),
+    limit: int = Query(default=20, ge=1, le=100),
+    cursor: str | None = Query(default=None),
+    db: AsyncSession = Depends(database.get_read_db)
+):
+    """
+    A page of a post's comments: sort=time is oldest first, sort=top most
+    upvoted first. Pass next_cursor back as cursor for the following page;
+    total is the post's comment_count. Responses carry an ETag (see http_cache).
+    """
+    async def build():
+        post = await db.get(database.Post, post_id)
+        if not post or post.is_hidden:
+            raise HTTPException(status_code=404, detail="Post not found")
+
+        comments, next_cursor = await get_comment_page(db, post_id, cursor, limit, sort)
+        return {
+            "comments": [vote_buffer.buffer.overlay("comment", serialize_comment(comment)) for comment in comments],
+            "next_cursor": next_cursor,
+            "total": post.comment_count
+        }
+
+    return await http_cache.respond(request, db, [http_cache.post_version(post_id)], build)
 
 
 @router.put("/comments/{comment_id}")
@@ -82,21 +93,20 @@ async def update_comment(
     comment_id: int,
     request: CommentUpdate,
     current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    user: auth.Principal = Depends(auth.get_current_principal),
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    comment = db.query(database.Comment).filter(database.Comment.id == comment_id).first()
+    comment = await db.get(database.Comment, comment_id)
     if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
     if comment.user_email != current_user_email:
         raise HTTPException(status_code=403, detail="No permission to edit this comment")
-    user = db.query(database.User).filter(database.User.user_email == current_user_email).first()
-    if not user:
-        raise HTTPException(status_code=400, detail="User not found")
     ensure_not_banned(user)
-    validate_no_sensitive_words(db, request.content)
+    await validate_no_sensitive_words(db, request.content)
     comment.content = request.content
     comment.image_url = request.image_url
-    db.commit()
+    await http_cache.invalidate_comments(db, comment.post_id)
+    await db.commit()
     return {"message": "Comment updated successfully"}
 
 
@@ -104,13 +114,19 @@ async def update_comment(
 async def delete_comment(
     comment_id: int,
     current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    comment = db.query(database.Comment).filter(database.Comment.id == comment_id).first()
+    comment = await db.get(database.Comment, comment_id)
     if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
     if comment.user_email != current_user_email:
         raise HTTPException(status_code=403, detail="No permission to delete this comment")
-    db.delete(comment)
-    db.commit()
+    await db.delete(comment)
+    await db.execute(
+        update(database.Post).where(database.Post.id == comment.post_id)
+        .values(comment_count=database.Post.comment_count - 1)
+    )
+    await ranking.refresh_hot_scores(db, comment.post_id)
+    await http_cache.invalidate_post_counters(db, comment.post_id)
+    await db.commit()
     return {"message": "Comment deleted successfully"}
@@ -1,8 +1,8 @@
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import auth
 import database
-from utils import ensure_not_banned
+from utils import ensure_not_banned, favorite_statement
 
 router = APIRouter()
 
@@ -11,24 +11,19 @@ router = APIRouter()
 async def toggle_favorite(
     post_id: int,
     current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    user: auth.Principal = Depends(auth.get_current_principal),
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    post = db.query(database.Post).filter(database.Post.id == post_id).first()
+    post = await db.get(database.Post, post_id)
     if not post or post.is_hidden:
         raise HTTPException(status_code=404, detail="Post not found")
-    user = db.query(database.User).filter(database.User.user_email == current_user_email).first()
-    if not user:
-        raise HTTPException(status_code=400, detail="User not found")
     ensure_not_banned(user)
 
-    favorite = db.query(database.Favorite).filter(
-        database.Favorite.post_id == post_id,
-        database.Favorite.user_email == current_user_email
-    ).first()
+    favorite = await db.scalar(favorite_statement(post_id, current_user_email))
 
     if favorite:
-        db.delete(favorite)
-        db.commit()
+        await db.delete(favorite)
+        await db.commit()
         return {"message": "Removed from favorites", "is_favorited": False}
     else:
         new_favorite = database.Favorite(
@@ -36,7 +31,7 @@ async def toggle_favorite(
             user_email=current_user_email
         )
         db.add(new_favorite)
-        db.commit()
+        await db.commit()
         return {"message": "Added to favorites", "is_favorited": True}
 
 
@@ -44,15 +39,12 @@ async def toggle_favorite(
 async def check_favorite_status(
     post_id: int,
     current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_read_db)
 ):
-    post = db.query(database.Post).filter(database.Post.id == post_id).first()
+    post = await db.get(database.Post, post_id)
     if not post or post.is_hidden:
         raise HTTPException(status_code=404, detail="Post not found")
 
-    favorite = db.query(database.Favorite).filter(
-        database.Favorite.post_id == post_id,
-        database.Favorite.user_email == current_user_email
-    ).first()
+    favorite = await db.scalar(favorite_statement(post_id, current_user_email))
 
     return {"is_favorited": favorite is not None}
@@ -1,5 +1,6 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 import auth
 import database
@@ -9,15 +10,19 @@ from utils import ensure_not_banned
 router = APIRouter()
 
 
+def my_feedback_statement(user_email: str):
+    return select(database.Feedback).where(
+        database.Feedback.user_email == user_email
+    ).order_by(database.Feedback.created_at.desc())
+
+
 @router.post("/feedback", status_code=201)
 async def create_feedback(
     request: FeedbackCreate,
     current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    user: auth.Principal = Depends(auth.get_current_principal),
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    user = db.query(database.User).filter(database.User.user_email == current_user_email).first()
-    if not user:
-        raise HTTPException(status_code=400, detail="User not found")
     ensure_not_banned(user)
 
     fb = database.Feedback(
@@ -28,18 +33,16 @@ async def create_feedback(
         created_at=datetime.now()
     )
     db.add(fb)
-    db.commit()
+    await db.commit()
     return {"message": "反馈已提交，感谢你的意见！"}
 
 
 @router.get("/feedback/my")
 async def get_my_feedback(
     current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_read_db)
 ):
-    items = db.query(database.Feedback).filter(
-        database.Feedback.user_email == current_user_email
-    ).order_by(database.Feedback.created_at.desc()).all()
+    items = (await db.scalars(my_feedback_statement(current_user_email))).all()
     return {
         "feedback": [{
             "id": f.id,
@@ -0,0 +1,17 @@
+import os
+import secrets
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+import metrics
+
+router = APIRouter()
+
+# When set, scrapers must send "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(authorization: str = Header(default="")):
+    if METRICS_TOKEN and not secrets.compare_digest(authorization, f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -1,60 +1,191 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+import json
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, update, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
 import auth
 import database
+import notification_hub
+from utils import decode_cursor, encode_cursor
 
 router = APIRouter()
 
 
+async def decrement_unread(db: AsyncSession, user_email: str, count: int):
+    if count:
+        await db.execute(
+            update(database.User)
+            .where(database.User.user_email == user_email)
+            .values(unread_notifications=database.User.unread_notifications - count)
+        )
+
+
+def notifications_page_statement(
+    user_email: str,
+    limit: int,
+    cursor: str | None = None,
+    since: str | None = None,
+    unread_only: bool = False
+):
+    """
+    One page of get_notifications, one extra row to tell whether there is a
+    next page. Pages run newest first from cursor; with since they run
+    oldest first from since instead.
+    """
+    Notification = database.Notification
+    query = select(Notification).where(Notification.user_email == user_email)
+    if unread_only:
+        query = query.where(Notification.is_read.is_(False))
+    if since:
+        since_time, since_id = decode_cursor(since)
+        query = query.where(or_(
+            Notification.release_time > since_time,
+            and_(Notification.release_time == since_time, Notification.id > since_id)
+        ))
+        return query.order_by(Notification.release_time.asc(), Notification.id.asc()).limit(limit + 1)
+    if cursor:
+        cursor_time, cursor_id = decode_cursor(cursor)
+        query = query.where(or_(
+            Notification.release_time < cursor_time,
+            and_(Notification.release_time == cursor_time, Notification.id < cursor_id)
+        ))
+    return query.order_by(Notification.release_time.desc(), Notification.id.desc()).limit(limit + 1)
+
+
 @router.get("/notifications")
 async def get_notifications(
+    limit: int = Query(default=20, ge=1, le=100),
+    cursor: str | None = Query(default=None),
+    since: str | None = Query(default=None),
+    unread_only: bool = Query(default=False),
     current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_read_db)
 ):
-    items = db.query(database.Notification).filter(
-        database.Notification.user_email == current_user_email
-    ).order_by(database.Notification.release_time.desc()).all()
-    unread_count = db.query(database.Notification).filter(
-        database.Notification.user_email == current_user_email,
-        database.Notification.is_read.is_(False)
-    ).count()
+    """
+    Newest notifications first, limit per page.
+    cursor: next_cursor of the previous page, to page back through older items.
+    since: since_cursor of an earlier response, for incremental polling. Returns
+    items created or updated after it, oldest first, up to limit; poll again with
+    the new since_cursor while has_more is true.
+
+    A coalesced vote notification that gets a new vote moves to the top with a
+    later release_time, so since returns it again. While paging back with cursor
+    such a row is not seen on the older pages it left; the next since poll
+    returns it.
+    """
+    if cursor and since:
+        raise HTTPException(status_code=400, detail="cursor and since cannot be combined")
+    user = await db.get(database.User, current_user_email)
+    items = (await db.scalars(
+        notifications_page_statement(current_user_email, limit, cursor, since, unread_only)
+    )).all()
+    has_more = len(items) > limit
+    items = items[:limit]
+
+    next_cursor = None
+    if since:
+        # Items run oldest first; poll on from the newest one returned
+        since_cursor = encode_cursor(items[-1].release_time, items[-1].id) if items else since
+    else:
+        if has_more:
+            next_cursor = encode_cursor(items[-1].release_time, items[-1].id)
+        # Start polling from the newest item; only the first page knows it
+        since_cursor = encode_cursor(items[0].release_time, items[0].id) if items and not cursor else None
+
     return {
-        "unread_count": unread_count,
+        "unread_count": max(user.unread_notifications or 0, 0) if user else 0,
+        "next_cursor": next_cursor,
+        "since_cursor": since_cursor,
+        "has_more": has_more,
         "notifications": [{
             "id": item.id,
             "message": item.message,
             "notification_type": item.notification_type,
+            "actor_count": item.actor_count or 1,
             "is_read": item.is_read,
             "release_time": item.release_time.strftime("%Y-%m-%d %H:%M:%S")
         } for item in items]
     }
 
 
+@router.get("/notifications/unread-count")
+async def get_unread_count(
+    current_user_email: str = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(database.get_read_db)
+):
+    unread_count = await db.scalar(
+        select(database.User.unread_notifications).where(database.User.user_email == current_user_email)
+    )
+    return {"unread_count": max(unread_count or 0, 0)}
+
+
+@router.get("/notifications/stream")
+async def stream_notifications(token: str = Query(...)):
+    """
+    Server-Sent Events stream of the current user's new notifications.
+    The token is passed as a query parameter because EventSource cannot set headers.
+    The first event carries unread_count; a "resync" event means events were
+    dropped and the client should reload the count.
+    """
+    current_user_email = auth.decode_access_token(token)
+    async with database.ReadSessionLocal() as db:
+        unread_count = await db.scalar(
+            select(database.User.unread_notifications).where(database.User.user_email == current_user_email)
+        )
+    subscriber = notification_hub.hub.subscribe(current_user_email)
+    if subscriber is None:
+        raise HTTPException(status_code=503, detail="通知连接数已满，请稍后重试", headers={"Retry-After": "30"})
+
+    async def events():
+        try:
+            payload = {"type": "unread", "unread_count": max(unread_count or 0, 0)}
+            yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+            while True:
+                payload = await subscriber.next(notification_hub.HEARTBEAT_INTERVAL)
+                if payload is None:
+                    yield ": ping\n\n"
+                else:
+                    yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+        finally:
+            notification_hub.hub.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.put("/notifications/{notification_id}/read")
 async def mark_notification_read(
     notification_id: int,
     current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    notification = db.query(database.Notification).filter(
+    notification = await db.scalar(select(database.Notification).where(
         database.Notification.id == notification_id,
         database.Notification.user_email == current_user_email
-    ).first()
+    ))
     if not notification:
         raise HTTPException(status_code=404, detail="Notification not found")
-    notification.is_read = True
-    db.commit()
+    result = await db.execute(update(database.Notification).where(
+        database.Notification.id == notification_id,
+        database.Notification.is_read.is_(False)
+    ).values(is_read=True))
+    await decrement_unread(db, current_user_email, result.rowcount)
+    await db.commit()
     return {"message": "Notification marked as read"}
 
 
 @router.put("/notifications/read-all")
 async def mark_all_notifications_read(
     current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    db.query(database.Notification).filter(
+    result = await db.execute(update(database.Notification).where(
         database.Notification.user_email == current_user_email,
         database.Notification.is_read.is_(False)
-    ).update({"is_read": True})
-    db.commit()
+    ).values(is_read=True))
+    await decrement_unread(db, current_user_email, result.rowcount)
+    await db.commit()
     return {"message": "All notifications marked as read"}
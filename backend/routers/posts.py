@@ -1,27 +1,33 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
 from datetime import datetime
-from sqlalchemy.orm import Session
-import math
+from sqlalchemy import select, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 import auth
+import cache
 import database
+import feed
+import http_cache
+import ranking
+import search
+import trending
+import vote_buffer
 from models import PostCreate, PostUpdate
-from utils import ensure_admin, ensure_not_banned, validate_no_sensitive_words
+from utils import ensure_admin, ensure_not_banned, favorite_statement, get_comment_page, serialize_comment, validate_no_sensitive_words
 
 router = APIRouter()
 
-
 @router.post("/posts/")
 async def create_post(
     request: PostCreate,
     current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    user: auth.Principal = Depends(auth.get_current_principal),
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    user = db.query(database.User).filter(database.User.user_email == current_user_email).first()
-    if not user:
-        raise HTTPException(status_code=400, detail="User not found")
     ensure_not_banned(user)
-    validate_no_sensitive_words(db, request.title, request.content)
+    await validate_no_sensitive_words(db, request.title, request.content)
 
+    release_time = datetime.now()
     new_post = database.Post(
         title=request.title,
         content=request.content,
@@ -29,86 +35,74 @@ async def create_post(
         tag=request.tag,
         board_id=request.board_id,
         user_email=current_user_email,
-        release_time=datetime.now(),
+        release_time=release_time,
         upvotes=0,
-        downvotes=0
+        downvotes=0,
+        hot_score=ranking.hot_score(0, 0, 0, release_time)
     )
 
     db.add(new_post)
-    db.commit()
-    db.refresh(new_post)
+    await db.flush()
+    await search.index_post(db, new_post)
+    await http_cache.invalidate_posts(db)
+    await http_cache.invalidate_post_set(db)
+    await db.commit()
+    cache.board_post_counts.clear()
+    await db.refresh(new_post)
 
     return {"message": "Post created successfully", "post_id": new_post.id}
 
 
 @router.get("/posts/")
 async def list_posts(
+    request: Request,
     tag: str | None = Query(default=None),
     keyword: str | None = Query(default=None),
     board_id: int | None = Query(default=None),
     page: int = Query(default=1, ge=1),
     page_size: int = Query(default=20, ge=1, le=100),
-    db: Session = Depends(database.get_db)
+    sort: str = Query(default="new", pattern="^(new|hot|top)$"),
+    pagination: str = Query(default="page", pattern="^(page|cursor)$"),
+    cursor: str | None = Query(default=None),
+    with_total: bool = Query(default=False),
+    db: AsyncSession = Depends(database.get_read_db)
 ):
-    query = db.query(database.Post)
-    query = query.filter(database.Post.is_hidden.is_(False))
+    """
+    List visible posts. sort=new (default) is newest first, sort=hot orders by
+    the stored hot_score (see ranking.py) and sort=top by upvotes.
+    pagination=page (default) uses page/page_size and always returns totals.
+    pagination=cursor pages on (release_time, id), or (score, id) for hot/top,
+    with the opaque next_cursor of the previous response; the total is only
+    counted when with_total is set.
+    With sort=new, keyword results are ranked by relevance in page mode and by
+    time in cursor mode.
+    Responses carry an ETag (see http_cache).
+    """
+    query = feed.visible_posts()
     if tag and tag != "全部":
-        query = query.filter(database.Post.tag == tag)
+        query = query.where(database.Post.tag == tag)
     if board_id is not None:
-        query = query.filter(database.Post.board_id == board_id)
+        query = query.where(database.Post.board_id == board_id)
+    rank = None
     if keyword:
-        like_keyword = f"%{keyword}%"
-        query = query.filter(
-            (database.Post.title.ilike(like_keyword)) | (database.Post.content.ilike(like_keyword))
-        )
-        
-        # Record search history
-        existing_search = db.query(database.SearchHistory).filter(database.SearchHistory.keyword == keyword).first()
-        if existing_search:
-            existing_search.count += 1
-            existing_search.last_searched = datetime.now()
-        else:
-            new_search = database.SearchHistory(keyword=keyword, count=1, last_searched=datetime.now())
-            db.add(new_search)
-        db.commit()
-
-    total = query.count()
-    posts = query.order_by(database.Post.release_time.desc()).offset((page - 1) * page_size).limit(page_size).all()
-
-    result = []
-    for post in posts:
-        result.append({
-            "id": post.id,
-            "title": post.title,
-            "content": post.content,
-            "image_url": post.image_url,
-            "tag": post.tag,
-            "board_id": post.board_id,
-            "board_name": post.board.name if post.board else None,
-            "release_time": post.release_time.strftime("%Y-%m-%d %H:%M:%S"),
-            "user_name": post.author.user_name,
-            "upvotes": post.upvotes,
-            "downvotes": post.downvotes
-        })
-
-    total_pages = math.ceil(total / page_size) if total > 0 else 1
-
-    return {
-        "posts": result,
-        "total": total,
-        "page": page,
-        "page_size": page_size,
-        "total_pages": total_pages
-    }
+        query, rank = search.apply_keyword_filter(db, query, database.Post, keyword)
+        trending.searches.record(keyword)
 
+    async def build():
+        return await feed.build_feed_page(db, query, sort, pagination, page, page_size, cursor, with_total, rank)
 
-@router.get("/posts/{post_id}")
-async def get_post(post_id: int, db: Session = Depends(database.get_db)):
-    post = db.query(database.Post).filter(database.Post.id == post_id).first()
+    return await http_cache.respond(request, db, ["posts", "boards"], build)
+
+
+async def get_visible_post(db: AsyncSession, post_id: int) -> database.Post:
+    post = await db.get(database.Post, post_id, options=[joinedload(database.Post.author)])
     if not post or post.is_hidden:
         raise HTTPException(status_code=404, detail="Post not found")
+    return post
+
 
-    return {
+def serialize_post_detail(post: database.Post) -> dict:
+    return vote_buffer.buffer.overlay("post", {
         "id": post.id,
         "title": post.title,
         "content": post.content,
@@ -120,8 +114,85 @@ async def get_post(post_id: int, db: Session = Depends(database.get_db)):
         "release_time": post.release_time.strftime("%Y-%m-%d %H:%M:%S"),
         "user_name": post.author.user_name,
         "upvotes": post.upvotes,
-        "downvotes": post.downvotes
+        "downvotes": post.downvotes,
+        "comment_count": post.comment_count
+    })
+
+
+@router.get("/posts/{post_id}")
+async def get_post(post_id: int, request: Request, db: AsyncSession = Depends(database.get_read_db)):
+    async def build():
+        return serialize_post_detail(await get_visible_post(db, post_id))
+
+    return await http_cache.respond(request, db, [http_cache.post_version(post_id), "boards"], build)
+
+
+def viewer_votes_statement(user_email: str, post_id: int, comment_ids: list[int]):
+    """The viewer's vote on the post and on every comment of the page in one query."""
+    return select(database.Vote.entity_type, database.Vote.entity_id, database.Vote.vote_type).where(
+        database.Vote.user_email == user_email,
+        or_(
+            and_(database.Vote.entity_type == "post", database.Vote.entity_id == post_id),
+            and_(database.Vote.entity_type == "comment", database.Vote.entity_id.in_(comment_ids))
+        )
+    )
+
+
+@router.get("/posts/{post_id}/view")
+async def view_post(
+    post_id: int,
+    request: Request,
+    comment_limit: int = Query(default=20, ge=1, le=100),
+    comment_cursor: str | None = Query(default=None),
+    comment_sort: str = Query(default="time", pattern="^(time|top)$"),
+    current_user_email: str | None = Depends(auth.get_optional_user),
+    db: AsyncSession = Depends(database.get_read_db)
+):
+    """
+    Everything the post detail page needs in one response: the post, a page of
+    comments (see comments.get_comments for comment_sort, continue with
+    comments.next_cursor) and, for a
+    signed-in viewer, their votes, favorite and admin flag.
+    Anonymous responses carry an ETag (see http_cache).
+    """
+    async def build_public():
+        post = await get_visible_post(db, post_id)
+        comments, next_cursor = await get_comment_page(db, post_id, comment_cursor, comment_limit, comment_sort)
+        return {
+            "post": serialize_post_detail(post),
+            "comments": {
+                "items": [vote_buffer.buffer.overlay("comment", serialize_comment(comment)) for comment in comments],
+                "next_cursor": next_cursor
+            },
+            "viewer": None
+        }
+
+    if current_user_email is None:
+        return await http_cache.respond(request, db, [http_cache.post_version(post_id), "boards"], build_public)
+
+    result = await build_public()
+    principal = await auth.load_principal(db, current_user_email)
+    comment_ids = [comment["id"] for comment in result["comments"]["items"]]
+
+    rows = (await db.execute(viewer_votes_statement(current_user_email, post_id, comment_ids))).all()
+    votes = {(row.entity_type, row.entity_id): row.vote_type for row in rows}
+    for entity in [("post", post_id), *(("comment", comment_id) for comment_id in comment_ids)]:
+        buffered, vote_type = vote_buffer.buffer.vote_type(*entity, current_user_email)
+        if buffered:
+            votes[entity] = vote_type
+
+    is_favorited = await db.scalar(favorite_statement(post_id, current_user_email).limit(1)) is not None
+
+    result["viewer"] = {
+        "vote_type": votes.get(("post", post_id)) or "none",
+        "comment_votes": {
+            str(comment_id): votes[("comment", comment_id)]
+            for comment_id in comment_ids if votes.get(("comment", comment_id))
+        },
+        "is_favorited": is_favorited,
+        "is_admin": principal.is_admin
     }
+    return result
 
 
 @router.put("/posts/{post_id}")
@@ -129,25 +200,27 @@ async def update_post(
     post_id: int,
     request: PostUpdate,
     current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    user: auth.Principal = Depends(auth.get_current_principal),
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    post = db.query(database.Post).filter(database.Post.id == post_id).first()
+    post = await db.get(database.Post, post_id)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     if post.user_email != current_user_email:
         raise HTTPException(status_code=403, detail="No permission to edit this post")
-    user = db.query(database.User).filter(database.User.user_email == current_user_email).first()
-    if not user:
-        raise HTTPException(status_code=400, detail="User not found")
     ensure_not_banned(user)
-    validate_no_sensitive_words(db, request.title, request.content)
+    await validate_no_sensitive_words(db, request.title, request.content)
 
     post.title = request.title
     post.content = request.content
     post.image_url = request.image_url
     post.tag = request.tag
     post.board_id = request.board_id
-    db.commit()
+    await search.index_post(db, post)
+    await http_cache.invalidate_posts(db, post_id)
+    await http_cache.invalidate_post_set(db)
+    await db.commit()
+    cache.board_post_counts.clear()
     return {"message": "Post updated successfully"}
 
 
@@ -155,63 +228,67 @@ async def update_post(
 async def delete_post(
     post_id: int,
     current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    post = db.query(database.Post).filter(database.Post.id == post_id).first()
+    post = await db.get(database.Post, post_id)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     if post.user_email != current_user_email:
         raise HTTPException(status_code=403, detail="No permission to delete this post")
-    db.delete(post)
-    db.commit()
+    await db.delete(post)
+    await search.remove_post(db, post_id)
+    await http_cache.invalidate_posts(db, post_id)
+    await http_cache.invalidate_post_set(db)
+    await db.commit()
+    cache.board_post_counts.clear()
     return {"message": "Post deleted successfully"}
 
 
 @router.post("/admin/posts/{post_id}/hide")
 async def hide_post(
     post_id: int,
-    current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    current_user: auth.Principal = Depends(auth.get_current_principal),
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    current_user = db.query(database.User).filter(database.User.user_email == current_user_email).first()
-    if not current_user:
-        raise HTTPException(status_code=400, detail="User not found")
     ensure_admin(current_user)
 
-    post = db.query(database.Post).filter(database.Post.id == post_id).first()
+    post = await db.get(database.Post, post_id)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     post.is_hidden = True
-    db.commit()
+    await search.remove_post(db, post_id)
+    await http_cache.invalidate_posts(db, post_id)
+    await http_cache.invalidate_post_set(db)
+    await db.commit()
+    cache.board_post_counts.clear()
     return {"message": "Post hidden successfully"}
 
 
 @router.post("/admin/posts/{post_id}/unhide")
 async def unhide_post(
     post_id: int,
-    current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    current_user: auth.Principal = Depends(auth.get_current_principal),
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    current_user = db.query(database.User).filter(database.User.user_email == current_user_email).first()
-    if not current_user:
-        raise HTTPException(status_code=400, detail="User not found")
     ensure_admin(current_user)
 
-    post = db.query(database.Post).filter(database.Post.id == post_id).first()
+    post = await db.get(database.Post, post_id)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     post.is_hidden = False
-    db.commit()
+    await search.index_post(db, post)
+    await http_cache.invalidate_posts(db, post_id)
+    await http_cache.invalidate_post_set(db)
+    await db.commit()
+    cache.board_post_counts.clear()
     return {"message": "Post unhidden successfully"}
 
 
 @router.get("/tags")
-async def list_tags(db: Session = Depends(database.get_db)):
-    tags = db.query(database.Post.tag).distinct().all()
-    return {"tags": sorted([t[0] for t in tags if t and t[0]])}
+async def list_tags(request: Request, db: AsyncSession = Depends(database.get_read_db)):
+    return await http_cache.respond(request, db, ["post_set"], lambda: feed.build_tags(db))
 
 
 @router.get("/trending-searches")
-async def get_trending_searches(db: Session = Depends(database.get_db)):
-    searches = db.query(database.SearchHistory).order_by(database.SearchHistory.count.desc()).limit(10).all()
-    return {"trending": [s.keyword for s in searches]}
+async def get_trending_searches(request: Request):
+    return http_cache.respond_unversioned(request, {"trending": trending.searches.top(10)})
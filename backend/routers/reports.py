@@ -1,5 +1,6 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 import auth
 import database
@@ -9,32 +10,40 @@ from utils import ensure_not_banned
 router = APIRouter()
 
 
+def pending_report_statement(reporter_email: str, target_type: str, target_id: int):
+    return select(database.Report).where(
+        database.Report.reporter_email == reporter_email,
+        database.Report.target_type == target_type,
+        database.Report.target_id == target_id,
+        database.Report.status == "pending"
+    )
+
+
+def my_reports_statement(reporter_email: str):
+    return select(database.Report).where(
+        database.Report.reporter_email == reporter_email
+    ).order_by(database.Report.created_at.desc())
+
+
 @router.post("/reports", status_code=201)
 async def create_report(
     request: ReportCreate,
     current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    user: auth.Principal = Depends(auth.get_current_principal),
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    user = db.query(database.User).filter(database.User.user_email == current_user_email).first()
-    if not user:
-        raise HTTPException(status_code=400, detail="User not found")
     ensure_not_banned(user)
 
     if request.target_type == "post":
-        target = db.query(database.Post).filter(database.Post.id == request.target_id).first()
+        target = await db.get(database.Post, request.target_id)
         if not target:
             raise HTTPException(status_code=404, detail="帖子不存在")
     elif request.target_type == "comment":
-        target = db.query(database.Comment).filter(database.Comment.id == request.target_id).first()
+        target = await db.get(database.Comment, request.target_id)
         if not target:
             raise HTTPException(status_code=404, detail="评论不存在")
 
-    existing = db.query(database.Report).filter(
-        database.Report.reporter_email == current_user_email,
-        database.Report.target_type == request.target_type,
-        database.Report.target_id == request.target_id,
-        database.Report.status == "pending"
-    ).first()
+    existing = await db.scalar(pending_report_statement(current_user_email, request.target_type, request.target_id))
     if existing:
         raise HTTPException(status_code=400, detail="你已经举报过该内容，请等待管理员处理")
 
@@ -47,18 +56,16 @@ async def create_report(
         created_at=datetime.now()
     )
     db.add(report)
-    db.commit()
+    await db.commit()
     return {"message": "举报已提交，管理员会尽快处理"}
 
 
 @router.get("/reports/my")
 async def get_my_reports(
     current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_read_db)
 ):
-    reports = db.query(database.Report).filter(
-        database.Report.reporter_email == current_user_email
-    ).order_by(database.Report.created_at.desc()).all()
+    reports = (await db.scalars(my_reports_statement(current_user_email))).all()
     return {
         "reports": [{
             "id": r.id,
@@ -1,7 +1,5 @@
 from fastapi import APIRouter, HTTPException, Depends, UploadFile, File
-from sqlalchemy.orm import Session
 import auth
-import database
 import os
 import shutil
 from pathlib import Path
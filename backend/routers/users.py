@@ -1,7 +1,9 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Query
 from fastapi.security import OAuth2PasswordRequestForm
 from datetime import timedelta
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 import auth
 import database
 from models import UserCreate, Token, UserProfile, UserProfileUpdate
@@ -10,14 +12,41 @@ from utils import ensure_admin
 router = APIRouter()
 
 
+def first_admin_statement():
+    return select(database.User).where(database.User.is_admin.is_(True)).limit(1)
+
+
+def my_posts_statement(user_email: str):
+    return select(database.Post).where(
+        database.Post.user_email == user_email,
+        database.Post.is_hidden.is_(False)
+    ).order_by(database.Post.release_time.desc())
+
+
+def my_favorites_statement(user_email: str, page: int, page_size: int):
+    return (
+        select(database.Post)
+        .join(database.Favorite, database.Favorite.post_id == database.Post.id)
+        .where(
+            database.Favorite.user_email == user_email,
+            database.Post.is_hidden.is_(False)
+        )
+        .options(joinedload(database.Post.author))
+        .order_by(database.Post.release_time.desc(), database.Post.id.desc())
+        .offset((page - 1) * page_size)
+        .limit(page_size)
+    )
+
+
 @router.post("/register", status_code=status.HTTP_201_CREATED)
-async def create_user(request: UserCreate, db: Session = Depends(database.get_db)):
-    existing_user = db.query(database.User).filter(database.User.user_email == request.user_email).first()
+async def create_user(request: UserCreate, db: AsyncSession = Depends(database.get_async_db)):
+    # Hash before touching the database so the write connection is not held while bcrypt runs
+    hashed_password = await auth.get_hashed_password(request.password)
+    existing_user = await db.get(database.User, request.user_email)
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    existing_admin = db.query(database.User).filter(database.User.is_admin.is_(True)).first()
+    existing_admin = await db.scalar(first_admin_statement())
 
-    hashed_password = auth.get_hashed_password(request.password)
     new_user = database.User(
         user_email=request.user_email,
         user_name=request.user_name,
@@ -27,21 +56,24 @@ async def create_user(request: UserCreate, db: Session = Depends(database.get_db
         is_admin=existing_admin is None
     )
     db.add(new_user)
-    db.commit()
+    await db.commit()
 
     return {"message": "User created successfully"}
 
 
 @router.post("/token", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
-    user = db.query(database.User).filter(database.User.user_email == form_data.username).first()
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(database.get_read_db)):
+    user = await db.get(database.User, form_data.username)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    if not auth.verify_password(form_data.password, user.hashed_password):
+    # End the read transaction so the connection is free while bcrypt runs
+    await db.commit()
+    valid, new_hash = await auth.verify_password(form_data.password, user.hashed_password)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -49,6 +81,15 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
         )
     if user.is_banned:
         raise HTTPException(status_code=403, detail="User is banned")
+    if new_hash:
+        # Only a rehash needs the writer; the lookup above stays off the write lock
+        async with database.AsyncSessionLocal() as write_db:
+            await write_db.execute(
+                update(database.User)
+                .where(database.User.user_email == user.user_email)
+                .values(hashed_password=new_hash)
+            )
+            await write_db.commit()
 
     access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth.create_access_token(
@@ -62,9 +103,9 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
 @router.get("/users/me", response_model=UserProfile)
 async def get_current_user_profile(
     current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_read_db)
 ):
-    user = db.query(database.User).filter(database.User.user_email == current_user_email).first()
+    user = await db.get(database.User, current_user_email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -82,9 +123,9 @@ async def get_current_user_profile(
 @router.get("/users/me/settings")
 async def get_current_user_settings(
     current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_read_db)
 ):
-    user = db.query(database.User).filter(database.User.user_email == current_user_email).first()
+    user = await db.get(database.User, current_user_email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return {
@@ -100,9 +141,9 @@ async def get_current_user_settings(
 async def update_current_user_profile(
     request: UserProfileUpdate,
     current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    user = db.query(database.User).filter(database.User.user_email == current_user_email).first()
+    user = await db.get(database.User, current_user_email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -110,7 +151,8 @@ async def update_current_user_profile(
     user.signature = request.signature
     user.preferred_tags = request.preferred_tags
 
-    db.commit()
+    await db.commit()
+    auth.invalidate_principal(current_user_email)
 
     return {"message": "Profile updated successfully"}
 
@@ -118,16 +160,13 @@ async def update_current_user_profile(
 @router.get("/users/me/posts")
 async def get_user_posts(
     current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_read_db)
 ):
-    user = db.query(database.User).filter(database.User.user_email == current_user_email).first()
+    user = await db.get(database.User, current_user_email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    posts = db.query(database.Post).filter(
-        database.Post.user_email == current_user_email,
-        database.Post.is_hidden.is_(False)
-    ).order_by(database.Post.release_time.desc()).all()
+    posts = (await db.scalars(my_posts_statement(current_user_email))).all()
 
     result = []
     for post in posts:
@@ -140,7 +179,7 @@ async def get_user_posts(
             "board_id": post.board_id,
             "board_name": post.board.name if post.board else None,
             "release_time": post.release_time.strftime("%Y-%m-%d %H:%M:%S"),
-            "user_name": post.author.user_name,
+            "user_name": user.user_name,
             "upvotes": post.upvotes,
             "downvotes": post.downvotes
         })
@@ -151,63 +190,63 @@ async def get_user_posts(
 @router.post("/admin/users/{target_user_email}/ban")
 async def ban_user(
     target_user_email: str,
-    current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    current_user: auth.Principal = Depends(auth.get_current_principal),
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    current_user = db.query(database.User).filter(database.User.user_email == current_user_email).first()
-    if not current_user:
-        raise HTTPException(status_code=400, detail="User not found")
     ensure_admin(current_user)
 
-    target_user = db.query(database.User).filter(database.User.user_email == target_user_email).first()
+    target_user = await db.get(database.User, target_user_email)
     if not target_user:
         raise HTTPException(status_code=404, detail="Target user not found")
     if target_user.is_admin:
         raise HTTPException(status_code=400, detail="Admin user cannot be banned")
 
     target_user.is_banned = True
-    db.commit()
+    await db.commit()
+    auth.invalidate_principal(target_user_email)
     return {"message": "User banned successfully"}
 
 
 @router.post("/admin/users/{target_user_email}/unban")
 async def unban_user(
     target_user_email: str,
-    current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    current_user: auth.Principal = Depends(auth.get_current_principal),
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    current_user = db.query(database.User).filter(database.User.user_email == current_user_email).first()
-    if not current_user:
-        raise HTTPException(status_code=400, detail="User not found")
     ensure_admin(current_user)
 
-    target_user = db.query(database.User).filter(database.User.user_email == target_user_email).first()
+    target_user = await db.get(database.User, target_user_email)
     if not target_user:
         raise HTTPException(status_code=404, detail="Target user not found")
 
     target_user.is_banned = False
-    db.commit()
+    await db.commit()
+    auth.invalidate_principal(target_user_email)
     return {"message": "User unbanned successfully"}
 
 
+@router.get("/admin/password-hashing")
+async def get_password_hashing_stats(current_user: auth.Principal = Depends(auth.get_current_principal)):
+    ensure_admin(current_user)
+    return auth.get_hash_stats()
+
+
 @router.get("/users/me/favorites")
 async def get_user_favorites(
+    page: int = Query(default=1, ge=1),
+    page_size: int = Query(default=100, ge=1, le=100),
     current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_read_db)
 ):
-    user = db.query(database.User).filter(database.User.user_email == current_user_email).first()
+    """Favorited posts, newest first, one page at a time; a page shorter than page_size is the last."""
+    user = await db.get(database.User, current_user_email)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    favorites = db.query(database.Favorite).filter(
-        database.Favorite.user_email == current_user_email
-    ).all()
+    posts = (await db.scalars(my_favorites_statement(current_user_email, page, page_size))).all()
 
     result = []
-    for favorite in favorites:
-        post = favorite.post
-        if post.is_hidden:
-            continue
+    for post in posts:
         result.append({
             "id": post.id,
             "title": post.title,
@@ -222,6 +261,4 @@ async def get_user_favorites(
             "downvotes": post.downvotes
         })
 
-    result.sort(key=lambda x: x["release_time"], reverse=True)
-
     return result
@@ -1,107 +1,100 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Depends, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import auth
 import database
+import http_cache
+import notification_digest
+import vote_buffer
 from models import VoteCreate
-from utils import create_notification, ensure_not_banned
+from utils import apply_vote, ensure_not_banned, vote_type_statement
 
 router = APIRouter()
 
 
+VOTE_MESSAGES = {
+    "removed": "Vote removed successfully",
+    "updated": "Vote updated successfully",
+    "recorded": "Vote recorded successfully",
+}
+
+
+async def get_vote_db(read_db: AsyncSession = Depends(database.get_read_db)):
+    """
+    Session of the vote handlers. Buffered votes only read (the existence
+    checks, counters and the base vote in vote_buffer.toggle), so they use the
+    request's read session, the one get_current_principal already holds, and
+    leave the single writer connection to the flush.
+    """
+    if vote_buffer.ENABLED:
+        yield read_db
+        return
+    async with database.AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_vote_counts(db: AsyncSession, model, entity_id: int) -> dict:
+    counts = (await db.execute(select(model.upvotes, model.downvotes).where(model.id == entity_id))).one()
+    return {"upvotes": counts.upvotes, "downvotes": counts.downvotes}
+
+
 @router.post("/posts/{post_id}/vote")
 async def vote(
     post_id: int,
     request: VoteCreate,
     current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    user: auth.Principal = Depends(auth.get_current_principal),
+    db: AsyncSession = Depends(get_vote_db)
 ):
-    post = db.query(database.Post).filter(database.Post.id == post_id).first()
+    post = await db.get(database.Post, post_id)
     if not post or post.is_hidden:
         raise HTTPException(status_code=404, detail="Post not found")
 
-    user = db.query(database.User).filter(database.User.user_email == current_user_email).first()
-    if not user:
-        raise HTTPException(status_code=400, detail="User not found")
     ensure_not_banned(user)
 
-    existing_vote = db.query(database.Vote).filter(
-        database.Vote.entity_type == "post",
-        database.Vote.entity_id == post_id,
-        database.Vote.user_email == current_user_email
-    ).first()
-
-    if existing_vote:
-        if existing_vote.vote_type == request.vote_type:
-            if existing_vote.vote_type == "upvote":
-                post.upvotes -= 1
-            else:
-                post.downvotes -= 1
-            db.delete(existing_vote)
-            db.commit()
-            return {"message": "Vote removed successfully", "upvotes": post.upvotes, "downvotes": post.downvotes}
-        else:
-            if existing_vote.vote_type == "upvote":
-                post.upvotes -= 1
-            else:
-                post.downvotes -= 1
-
-            existing_vote.vote_type = request.vote_type
-
-            if request.vote_type == "upvote":
-                post.upvotes += 1
-            else:
-                post.downvotes += 1
-
-            if post.user_email != current_user_email:
-                create_notification(
-                    db,
-                    post.user_email,
-                    f"{user.user_name} 对你的帖子《{post.title}》点了{'赞' if request.vote_type == 'upvote' else '反对'}",
-                    "vote"
-                )
-            db.commit()
-            return {"message": "Vote updated successfully", "upvotes": post.upvotes, "downvotes": post.downvotes}
-    else:
-        if request.vote_type == "upvote":
-            post.upvotes += 1
-        else:
-            post.downvotes += 1
-
-        new_vote = database.Vote(
+    notification = None
+    if post.user_email != current_user_email:
+        notification = notification_digest.VoteEvent(
+            recipient_email=post.user_email,
             entity_type="post",
             entity_id=post_id,
-            user_email=current_user_email,
-            vote_type=request.vote_type
+            vote_type=request.vote_type,
+            actor_email=current_user_email,
+            actor_name=user.user_name,
+            subject=f"你的帖子《{post.title}》"
         )
-        db.add(new_vote)
-        if post.user_email != current_user_email:
-            create_notification(
-                db,
-                post.user_email,
-                f"{user.user_name} 对你的帖子《{post.title}》点了{'赞' if request.vote_type == 'upvote' else '反对'}",
-                "vote"
-            )
-        db.commit()
-        return {"message": "Vote recorded successfully", "upvotes": post.upvotes, "downvotes": post.downvotes}
+
+    if vote_buffer.ENABLED:
+        outcome = await vote_buffer.buffer.toggle(db, "post", post_id, current_user_email, request.vote_type, notification)
+        counts = vote_buffer.buffer.overlay("post", await get_vote_counts(db, database.Post, post_id), post_id)
+        return {"message": VOTE_MESSAGES[outcome], **counts}
+
+    outcome = await apply_vote(db, "post", post_id, current_user_email, request.vote_type)
+    counts = await get_vote_counts(db, database.Post, post_id)
+    await http_cache.invalidate_post_counters(db, post_id)
+    await db.commit()
+    if notification:
+        notification.removed = outcome == "removed"
+        notification_digest.digest.record(notification)
+    return {"message": VOTE_MESSAGES[outcome], **counts}
 
 
 @router.get("/posts/{post_id}/vote")
 async def get_vote_status(
     post_id: int,
     current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_read_db)
 ):
-    post = db.query(database.Post).filter(database.Post.id == post_id).first()
+    post = await db.get(database.Post, post_id)
     if not post or post.is_hidden:
         raise HTTPException(status_code=404, detail="Post not found")
 
-    vote = db.query(database.Vote).filter(
-        database.Vote.entity_type == "post",
-        database.Vote.entity_id == post_id,
-        database.Vote.user_email == current_user_email
-    ).first()
+    buffered, vote_type = vote_buffer.buffer.vote_type("post", post_id, current_user_email)
+    if buffered:
+        return {"vote_type": vote_type or "none"}
 
-    return {"vote_type": vote.vote_type if vote else "none"}
+    vote_type = await db.scalar(vote_type_statement("post", post_id, current_user_email))
+    return {"vote_type": vote_type or "none"}
 
 
 @router.post("/comments/{comment_id}/vote")
@@ -109,99 +102,91 @@ async def vote_comment(
     comment_id: int,
     request: VoteCreate,
     current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    user: auth.Principal = Depends(auth.get_current_principal),
+    db: AsyncSession = Depends(get_vote_db)
 ):
-    comment = db.query(database.Comment).filter(database.Comment.id == comment_id).first()
+    comment = await db.get(database.Comment, comment_id)
     if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
-    post = db.query(database.Post).filter(database.Post.id == comment.post_id).first()
+    post = await db.get(database.Post, comment.post_id)
     if not post or post.is_hidden:
         raise HTTPException(status_code=404, detail="Post not found")
 
-    user = db.query(database.User).filter(database.User.user_email == current_user_email).first()
-    if not user:
-        raise HTTPException(status_code=400, detail="User not found")
     ensure_not_banned(user)
 
-    existing_vote = db.query(database.Vote).filter(
-        database.Vote.entity_type == "comment",
-        database.Vote.entity_id == comment_id,
-        database.Vote.user_email == current_user_email
-    ).first()
-
-    if existing_vote:
-        if existing_vote.vote_type == request.vote_type:
-            if existing_vote.vote_type == "upvote":
-                comment.upvotes -= 1
-            else:
-                comment.downvotes -= 1
-            db.delete(existing_vote)
-            db.commit()
-            return {"message": "Vote removed successfully", "upvotes": comment.upvotes, "downvotes": comment.downvotes}
-        else:
-            if existing_vote.vote_type == "upvote":
-                comment.upvotes -= 1
-            else:
-                comment.downvotes -= 1
-
-            existing_vote.vote_type = request.vote_type
-
-            if request.vote_type == "upvote":
-                comment.upvotes += 1
-            else:
-                comment.downvotes += 1
-
-            if comment.user_email != current_user_email:
-                create_notification(
-                    db,
-                    comment.user_email,
-                    f"{user.user_name} 对你的评论点了{'赞' if request.vote_type == 'upvote' else '反对'}",
-                    "vote"
-                )
-            db.commit()
-            return {"message": "Vote updated successfully", "upvotes": comment.upvotes, "downvotes": comment.downvotes}
-    else:
-        if request.vote_type == "upvote":
-            comment.upvotes += 1
-        else:
-            comment.downvotes += 1
-
-        new_vote = database.Vote(
+    notification = None
+    if comment.user_email != current_user_email:
+        notification = notification_digest.VoteEvent(
+            recipient_email=comment.user_email,
             entity_type="comment",
             entity_id=comment_id,
-            user_email=current_user_email,
-            vote_type=request.vote_type
+            vote_type=request.vote_type,
+            actor_email=current_user_email,
+            actor_name=user.user_name,
+            subject="你的评论"
         )
-        db.add(new_vote)
-        if comment.user_email != current_user_email:
-            create_notification(
-                db,
-                comment.user_email,
-                f"{user.user_name} 对你的评论点了{'赞' if request.vote_type == 'upvote' else '反对'}",
-                "vote"
-            )
-        db.commit()
-        return {"message": "Vote recorded successfully", "upvotes": comment.upvotes, "downvotes": comment.downvotes}
+
+    if vote_buffer.ENABLED:
+        outcome = await vote_buffer.buffer.toggle(db, "comment", comment_id, current_user_email, request.vote_type, notification)
+        counts = vote_buffer.buffer.overlay("comment", await get_vote_counts(db, database.Comment, comment_id), comment_id)
+        return {"message": VOTE_MESSAGES[outcome], **counts}
+
+    outcome = await apply_vote(db, "comment", comment_id, current_user_email, request.vote_type)
+    counts = await get_vote_counts(db, database.Comment, comment_id)
+    await http_cache.invalidate_comments(db, comment.post_id)
+    await db.commit()
+    if notification:
+        notification.removed = outcome == "removed"
+        notification_digest.digest.record(notification)
+    return {"message": VOTE_MESSAGES[outcome], **counts}
+
+
+def comment_votes_statement(user_email: str, post_id: int, comment_ids: list[int] | None = None):
+    # Joined to comments so votes in other threads are never reported
+    query = select(database.Vote.entity_id, database.Vote.vote_type).join(
+        database.Comment, database.Comment.id == database.Vote.entity_id
+    ).where(
+        database.Vote.user_email == user_email,
+        database.Vote.entity_type == "comment",
+        database.Comment.post_id == post_id
+    )
+    if comment_ids is not None:
+        query = query.where(database.Vote.entity_id.in_(comment_ids))
+    return query
 
 
 @router.get("/posts/{post_id}/comments/vote")
 async def get_comment_vote_status(
     post_id: int,
+    comment_ids: list[int] | None = Query(default=None, max_length=100),
     current_user_email: str = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_read_db)
 ):
-    post = db.query(database.Post).filter(database.Post.id == post_id).first()
+    """
+    The user's votes on the post's comments as {comment_id: vote_type}.
+    Pass the ids of the comments on screen (comment_ids=1&comment_ids=2, at
+    most one page) to look up only those; without them the whole thread is checked.
+    """
+    post = await db.get(database.Post, post_id)
     if not post or post.is_hidden:
         raise HTTPException(status_code=404, detail="Post not found")
 
-    comments = db.query(database.Comment).filter(database.Comment.post_id == post_id).all()
-    comment_ids = [c.id for c in comments]
-
-    votes = db.query(database.Vote).filter(
-        database.Vote.entity_type == "comment",
-        database.Vote.entity_id.in_(comment_ids),
-        database.Vote.user_email == current_user_email
-    ).all()
-    result = {str(v.entity_id): v.vote_type for v in votes}
+    rows = (await db.execute(comment_votes_statement(current_user_email, post_id, comment_ids))).all()
+    result = {str(entity_id): vote_type for entity_id, vote_type in rows}
+
+    buffered = vote_buffer.buffer.user_votes("comment", current_user_email)
+    if comment_ids is not None:
+        buffered = {comment_id: buffered[comment_id] for comment_id in comment_ids if comment_id in buffered}
+    if buffered:
+        in_post = set((await db.scalars(select(database.Comment.id).where(
+            database.Comment.id.in_(list(buffered)),
+            database.Comment.post_id == post_id
+        ))).all())
+        buffered = {comment_id: vote_type for comment_id, vote_type in buffered.items() if comment_id in in_post}
+    for comment_id, vote_type in buffered.items():
+        if vote_type:
+            result[str(comment_id)] = vote_type
+        else:
+            result.pop(str(comment_id), None)
 
     return {"vote_type": result}
@@ -0,0 +1,163 @@
+"""
+Full-text search over posts.
+
+SQLite: an FTS5 table (posts_fts) fed with pre-tokenized text. CJK runs are
+split into overlapping bigrams, the same scheme MySQL's ngram parser uses,
+so Chinese keywords match without a dictionary.
+MySQL: a FULLTEXT index on posts(title, content) WITH PARSER ngram, which
+InnoDB keeps up to date by itself.
+Any other backend, or keywords too short to tokenize, fall back to LIKE.
+"""
+import re
+from sqlalchemy import Float, Integer, inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+FTS_TABLE = "posts_fts"
+MYSQL_FULLTEXT_INDEX = "ft_posts_title_content"
+# bm25 column weights: a hit in the title counts more than one in the content
+TITLE_WEIGHT = 10.0
+CONTENT_WEIGHT = 1.0
+
+CJK_CHARS = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+TOKEN_RE = re.compile(f"[{CJK_CHARS}]+|[0-9a-z]+")
+CJK_RE = re.compile(f"[{CJK_CHARS}]+")
+MYSQL_OPERATORS_RE = re.compile(r'[+\-<>()~*"@]')
+
+# Set by detect_search_index once the FTS5 table is known to exist
+fts_enabled = False
+
+
+def tokenize(content: str) -> list[str]:
+    """Split text into search tokens: lowercase words and CJK bigrams."""
+    tokens = []
+    for chunk in TOKEN_RE.findall((content or "").lower()):
+        if CJK_RE.fullmatch(chunk) and len(chunk) > 1:
+            tokens.extend(chunk[i:i + 2] for i in range(len(chunk) - 1))
+        else:
+            tokens.append(chunk)
+    return tokens
+
+
+def _index_row(post_id: int, title: str, content: str) -> dict:
+    return {"id": post_id, "title": " ".join(tokenize(title)), "content": " ".join(tokenize(content))}
+
+
+def build_fts_query(keyword: str) -> str | None:
+    """
+    Build an FTS5 MATCH expression for a user keyword.
+    CJK runs become bigram phrases (substring match), words become prefix
+    queries. Returns None when the keyword cannot be served by the index.
+    """
+    parts = []
+    for chunk in TOKEN_RE.findall(keyword.lower()):
+        if CJK_RE.fullmatch(chunk):
+            if len(chunk) < 2:
+                return None
+            parts.append('"' + " ".join(tokenize(chunk)) + '"')
+        else:
+            parts.append(f'"{chunk}"*')
+    return " ".join(parts) if parts else None
+
+
+def build_mysql_query(keyword: str) -> str | None:
+    """Build a boolean-mode AGAINST string; every term is required."""
+    terms = MYSQL_OPERATORS_RE.sub(" ", keyword).split()
+    return " ".join(f'+"{term}"' for term in terms) if terms else None
+
+
+def _dialect(db: AsyncSession) -> str:
+    return db.get_bind().dialect.name
+
+
+def apply_keyword_filter(db: AsyncSession, query, post_model, keyword: str):
+    """
+    Restrict a Post select to rows matching keyword.
+    Returns (query, rank) where rank is an ascending relevance sort key,
+    or None when the LIKE fallback was used.
+    """
+    dialect = _dialect(db)
+    if dialect == "sqlite" and fts_enabled:
+        match = build_fts_query(keyword)
+        if match:
+            hits = text(
+                f"SELECT rowid AS post_id, bm25({FTS_TABLE}, {TITLE_WEIGHT}, {CONTENT_WEIGHT}) AS rank "
+                f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match"
+            ).bindparams(match=match).columns(post_id=Integer, rank=Float).subquery("search_hits")
+            return query.join(hits, hits.c.post_id == post_model.id), hits.c.rank
+    elif dialect == "mysql":
+        against = build_mysql_query(keyword)
+        if against:
+            from sqlalchemy.dialects.mysql import match
+            score = match(post_model.title, post_model.content, against=against).in_boolean_mode()
+            return query.where(score > 0), -score
+
+    like_keyword = f"%{keyword}%"
+    query = query.where(post_model.title.ilike(like_keyword) | post_model.content.ilike(like_keyword))
+    return query, None
+
+
+async def index_post(db: AsyncSession, post):
+    """Add or refresh a post in the search index; hidden posts are removed."""
+    if _dialect(db) != "sqlite" or not fts_enabled:
+        return
+    await remove_post(db, post.id)
+    if post.is_hidden:
+        return
+    await db.execute(
+        text(f"INSERT INTO {FTS_TABLE} (rowid, title, content) VALUES (:id, :title, :content)"),
+        _index_row(post.id, post.title, post.content)
+    )
+
+
+async def remove_post(db: AsyncSession, post_id: int):
+    if _dialect(db) != "sqlite" or not fts_enabled:
+        return
+    await db.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {"id": post_id})
+
+
+def create_search_index(conn):
+    """Create the search index for the connected backend (run by migrations)."""
+    if conn.dialect.name == "sqlite":
+        try:
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(title, content, tokenize='unicode61')"
+            ))
+        except Exception:
+            # SQLite built without FTS5: keyword search keeps using LIKE
+            return
+    elif conn.dialect.name == "mysql":
+        indexes = {index["name"] for index in inspect(conn).get_indexes("posts")}
+        if MYSQL_FULLTEXT_INDEX not in indexes:
+            conn.execute(text(
+                f"ALTER TABLE posts ADD FULLTEXT INDEX {MYSQL_FULLTEXT_INDEX} (title, content) WITH PARSER ngram"
+            ))
+
+
+def backfill_search_index(engine, batch_size: int):
+    """Index existing posts into an empty FTS5 table, batch_size posts per transaction."""
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.connect() as conn:
+        if not detect_search_index(conn) or conn.execute(text(f"SELECT COUNT(*) FROM {FTS_TABLE}")).scalar():
+            return
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text(
+                "SELECT id, title, content FROM posts WHERE id > :last_id AND (is_hidden = 0 OR is_hidden IS NULL) "
+                "ORDER BY id LIMIT :limit"
+            ), {"last_id": last_id, "limit": batch_size}).all()
+            if not rows:
+                return
+            conn.execute(
+                text(f"INSERT INTO {FTS_TABLE} (rowid, title, content) VALUES (:id, :title, :content)"),
+                [_index_row(row.id, row.title, row.content) for row in rows]
+            )
+        last_id = rows[-1].id
+
+
+def detect_search_index(conn) -> bool:
+    """Check whether the FTS5 table exists and enable it for this process."""
+    global fts_enabled
+    fts_enabled = conn.dialect.name == "sqlite" and inspect(conn).has_table(FTS_TABLE)
+    return fts_enabled
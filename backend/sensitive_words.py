@@ -0,0 +1,98 @@
+"""
+Sensitive-word matching.
+
+The word list is compiled into an Aho-Corasick automaton, which finds every
+listed word in a single pass over the text. The compiled matcher is cached
+per process and rebuilt only when the "sensitive_words" cache version
+changes, which the admin endpoints bump on every add/delete.
+"""
+import os
+import time
+from collections import deque
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+import cache
+import database
+
+FALLBACK_SENSITIVE_WORDS = ("色情", "赌博", "毒品", "暴恐", "极端主义", "政治敏感")
+CACHE_NAME = "sensitive_words"
+# Seconds between version checks; bounds how long other workers serve an old list
+CHECK_INTERVAL = float(os.getenv("SENSITIVE_WORDS_CHECK_INTERVAL", "5"))
+
+
+class AhoCorasick:
+    def __init__(self, words):
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail: list[int] = [0]
+        self.output: list[list[str]] = [[]]
+        for word in dict.fromkeys(w for w in words if w):
+            node = 0
+            for char in word:
+                child = self.goto[node].get(char)
+                if child is None:
+                    child = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[node][char] = child
+                node = child
+            self.output[node].append(word)
+
+        # Breadth-first pass: link each node to its longest proper suffix in the trie
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                suffix = self.fail[node]
+                while suffix and char not in self.goto[suffix]:
+                    suffix = self.fail[suffix]
+                self.fail[child] = self.goto[suffix].get(char, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def find_all(self, content: str) -> list[str]:
+        """Return every distinct word found in content, in order of appearance."""
+        found = {}
+        node = 0
+        for char in content:
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            for word in self.output[node]:
+                found.setdefault(word, None)
+        return list(found)
+
+
+async def get_sensitive_words(db: AsyncSession) -> list[str]:
+    """Fetch sensitive words from database, fallback to hardcoded list."""
+    try:
+        words = (await db.scalars(select(database.SensitiveWord.word))).all()
+        if words:
+            return list(words)
+    except Exception:
+        pass
+    return list(FALLBACK_SENSITIVE_WORDS)
+
+
+class SensitiveWordCache:
+    def __init__(self):
+        self.matcher: AhoCorasick | None = None
+        self.version: int | None = None
+        self.checked_at = 0.0
+
+    async def get_matcher(self, db: AsyncSession) -> AhoCorasick:
+        now = time.monotonic()
+        if self.matcher is not None and now - self.checked_at < CHECK_INTERVAL:
+            return self.matcher
+        version = await cache.get_version(db, CACHE_NAME)
+        if self.matcher is None or version != self.version:
+            self.matcher = AhoCorasick(await get_sensitive_words(db))
+            self.version = version
+        self.checked_at = now
+        return self.matcher
+
+    def invalidate(self):
+        self.matcher = None
+
+
+word_cache = SensitiveWordCache()
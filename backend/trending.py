@@ -0,0 +1,141 @@
+"""
+Search keyword tracking for /trending-searches.
+
+list_posts calls searches.record(keyword), which only touches memory. Counts
+are aggregated per keyword and flushed to search_history every
+SEARCH_FLUSH_INTERVAL seconds as one batch of upserts, so searching no longer
+writes to the database on the request path.
+
+Trending keywords come from a Space-Saving top-K summary with exponential
+time decay: a search counts half as much after TRENDING_HALF_LIFE hours, so
+the list follows what is being searched now rather than all-time totals.
+Each worker keeps its own summary, seeded from search_history at startup.
+"""
+import logging
+import math
+import os
+import time
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+import database
+
+logger = logging.getLogger(__name__)
+
+SEARCH_FLUSH_INTERVAL = float(os.getenv("SEARCH_FLUSH_INTERVAL", "10"))
+TRENDING_HALF_LIFE = float(os.getenv("TRENDING_HALF_LIFE", "24")) * 3600
+TRENDING_CAPACITY = int(os.getenv("TRENDING_CAPACITY", "200"))
+KEYWORD_MAX_LENGTH = 100  # search_history.keyword
+
+
+class DecayingTopK:
+    """
+    Space-Saving heavy hitters over exponentially decayed counts.
+
+    Weights use forward decay: an event at time t adds exp(rate * (t - origin)),
+    so existing scores never need rescaling until the exponent grows large.
+    """
+
+    def __init__(self, capacity: int, half_life: float):
+        self.capacity = capacity
+        self.rate = math.log(2) / half_life
+        self.origin = time.time()
+        self.scores: dict[str, float] = {}
+
+    def _weight(self, at: float) -> float:
+        exponent = self.rate * (at - self.origin)
+        if exponent > 50:
+            # Rebase before the weights overflow
+            scale = math.exp(-exponent)
+            self.scores = {key: score * scale for key, score in self.scores.items()}
+            self.origin = at
+            exponent = 0.0
+        return math.exp(exponent)
+
+    def add(self, key: str, count: float = 1, at: float | None = None):
+        weight = count * self._weight(time.time() if at is None else at)
+        if key in self.scores:
+            self.scores[key] += weight
+        elif len(self.scores) < self.capacity:
+            self.scores[key] = weight
+        else:
+            # Replace the smallest counter; the newcomer inherits its score as error bound
+            smallest = min(self.scores, key=self.scores.get)
+            self.scores[key] = self.scores.pop(smallest) + weight
+
+    def top(self, n: int) -> list[str]:
+        return sorted(self.scores, key=self.scores.get, reverse=True)[:n]
+
+
+def _upsert_search(db: AsyncSession, keyword: str, count: int, last_searched: datetime):
+    dialect = db.get_bind().dialect.name
+    values = {"keyword": keyword, "count": count, "last_searched": last_searched}
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        return insert(database.SearchHistory).values(**values).on_conflict_do_update(
+            index_elements=["keyword"],
+            set_={"count": database.SearchHistory.count + count, "last_searched": last_searched}
+        )
+    from sqlalchemy.dialects.mysql import insert
+    return insert(database.SearchHistory).values(**values).on_duplicate_key_update(
+        count=database.SearchHistory.count + count, last_searched=last_searched
+    )
+
+
+def load_statement():
+    """The most recently searched keywords that seed the trending summary."""
+    return (
+        select(database.SearchHistory)
+        .order_by(database.SearchHistory.last_searched.desc())
+        .limit(TRENDING_CAPACITY)
+    )
+
+
+class SearchTracker:
+    def __init__(self):
+        self.pending: Counter = Counter()
+        self.last_searched: dict[str, datetime] = {}
+        self.trending = DecayingTopK(TRENDING_CAPACITY, TRENDING_HALF_LIFE)
+
+    def record(self, keyword: str):
+        keyword = keyword.strip()[:KEYWORD_MAX_LENGTH]
+        if not keyword:
+            return
+        self.pending[keyword] += 1
+        self.last_searched[keyword] = datetime.now()
+        self.trending.add(keyword)
+
+    def top(self, n: int = 10) -> list[str]:
+        return self.trending.top(n)
+
+    async def load(self):
+        """Seed the trending summary from search_history, decayed by last search time."""
+        async with database.ReadSessionLocal() as db:
+            rows = (await db.scalars(load_statement())).all()
+        for row in rows:
+            searched_at = row.last_searched.timestamp() if row.last_searched else self.trending.origin
+            self.trending.add(row.keyword, row.count or 1, at=searched_at)
+
+    async def flush(self):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, Counter()
+        last_searched, self.last_searched = self.last_searched, {}
+        try:
+            async with database.AsyncSessionLocal() as db:
+                # Sorted so concurrent flushes from other workers lock rows in the same order
+                for keyword in sorted(pending):
+                    await db.execute(_upsert_search(db, keyword, pending[keyword], last_searched[keyword]))
+                await db.commit()
+        except Exception:
+            logger.exception("Search history flush failed; keeping %d keywords for the next flush", len(pending))
+            self.pending.update(pending)
+            for keyword, searched_at in last_searched.items():
+                self.last_searched.setdefault(keyword, searched_at)
+
+
+searches = SearchTracker()
@@ -1,56 +1,274 @@
+import base64
+import binascii
+import json
 from datetime import datetime
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+import auth
 import database
+import notification_hub
+import ranking
+import sensitive_words
 
-FALLBACK_SENSITIVE_WORDS = ("色情", "赌博", "毒品", "暴恐", "极端主义", "政治敏感")
 
-
-def create_notification(db: Session, user_email: str, message: str, notification_type: str):
+async def create_notification(
+    db: AsyncSession,
+    user_email: str,
+    message: str,
+    notification_type: str,
+    group_key: str | None = None,
+    actor_count: int = 1,
+    actors: str | None = None
+):
     """
-    Add a notification record to the session for the given user.
-    The caller is responsible for committing the transaction.
+    Add a notification record to the session for the given user and bump
+    their unread counter. The caller is responsible for committing the transaction.
     """
     notification = database.Notification(
         user_email=user_email,
         message=message,
         notification_type=notification_type,
         is_read=False,
-        release_time=datetime.now()
+        release_time=datetime.now(),
+        group_key=group_key,
+        actor_count=actor_count,
+        actors=actors
     )
     db.add(notification)
+    notification_hub.queue(db, notification)
+    await db.execute(
+        update(database.User)
+        .where(database.User.user_email == user_email)
+        .values(unread_notifications=database.User.unread_notifications + 1)
+    )
+
+
+def encode_cursor(release_time: datetime, entity_id: int) -> str:
+    """Encode a (release_time, id) keyset position as an opaque URL-safe token."""
+    raw = json.dumps([release_time.isoformat(), entity_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        release_time, entity_id = json.loads(raw)
+        return datetime.fromisoformat(release_time), int(entity_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def encode_score_cursor(score: float, entity_id: int) -> str:
+    """Encode a (score, id) keyset position, for orders other than release time."""
+    raw = json.dumps([score, entity_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_score_cursor(cursor: str) -> tuple[float, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        score, entity_id = json.loads(raw)
+        if not isinstance(score, (int, float)):
+            raise TypeError(score)
+        return score, int(entity_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def serialize_post_summary(post: database.Post) -> dict:
+    """A post as post lists return it; post.author must already be loaded."""
+    return {
+        "id": post.id,
+        "title": post.title,
+        "content": post.content,
+        "image_url": post.image_url,
+        "tag": post.tag,
+        "board_id": post.board_id,
+        "board_name": post.board.name if post.board else None,
+        "release_time": post.release_time.strftime("%Y-%m-%d %H:%M:%S"),
+        "user_name": post.author.user_name,
+        "upvotes": post.upvotes,
+        "downvotes": post.downvotes,
+        "comment_count": post.comment_count
+    }
+
+
+def serialize_comment(comment: database.Comment) -> dict:
+    """A comment as the API returns it; comment.author must already be loaded."""
+    return {
+        "id": comment.id,
+        "post_id": comment.post_id,
+        "content": comment.content,
+        "image_url": comment.image_url,
+        "user_email": comment.user_email,
+        "release_time": comment.release_time.strftime("%Y-%m-%d %H:%M:%S"),
+        "user_name": comment.author.user_name,
+        "upvotes": comment.upvotes,
+        "downvotes": comment.downvotes
+    }
+
+
+def comment_page_statement(post_id: int, cursor: str | None, limit: int, sort: str = "time"):
+    """The SELECT of get_comment_page, one extra row to tell whether there is a next page."""
+    Comment = database.Comment
+    query = select(Comment).options(joinedload(Comment.author)).where(Comment.post_id == post_id)
+    if sort == "top":
+        if cursor:
+            cursor_upvotes, cursor_id = decode_score_cursor(cursor)
+            query = query.where(or_(
+                Comment.upvotes < cursor_upvotes,
+                and_(Comment.upvotes == cursor_upvotes, Comment.id < cursor_id)
+            ))
+        query = query.order_by(Comment.upvotes.desc(), Comment.id.desc())
+    else:
+        if cursor:
+            cursor_time, cursor_id = decode_cursor(cursor)
+            query = query.where(or_(
+                Comment.release_time > cursor_time,
+                and_(Comment.release_time == cursor_time, Comment.id > cursor_id)
+            ))
+        query = query.order_by(Comment.release_time.asc(), Comment.id.asc())
+    return query.limit(limit + 1)
+
+
+async def get_comment_page(
+    db: AsyncSession,
+    post_id: int,
+    cursor: str | None,
+    limit: int,
+    sort: str = "time"
+) -> tuple[list[database.Comment], str | None]:
+    """
+    A page of comments with their authors.
+    sort=time: oldest first, keyset-paged on (release_time, id).
+    sort=top: most upvoted first, keyset-paged on (upvotes, id); a comment
+    whose votes change while the client pages may be skipped or repeated.
+    """
+    comments = (await db.scalars(comment_page_statement(post_id, cursor, limit, sort))).all()
+    next_cursor = None
+    if len(comments) > limit:
+        comments = comments[:limit]
+        last = comments[-1]
+        if sort == "top":
+            next_cursor = encode_score_cursor(last.upvotes, last.id)
+        else:
+            next_cursor = encode_cursor(last.release_time, last.id)
+    return list(comments), next_cursor
+
+
+VOTE_COUNTER_COLUMNS = {"upvote": "upvotes", "downvote": "downvotes"}
+VOTE_RETRIES = 3
+
+
+def vote_type_statement(entity_type: str, entity_id: int, user_email: str):
+    """The user's stored vote_type on an entity, if any."""
+    return select(database.Vote.vote_type).where(
+        database.Vote.entity_type == entity_type,
+        database.Vote.entity_id == entity_id,
+        database.Vote.user_email == user_email
+    )
 
 
-def ensure_not_banned(user: database.User):
+def _insert_vote_if_absent(db: AsyncSession, values: dict):
+    """INSERT that silently skips rows violating the uq_vote constraint."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        return insert(database.Vote).values(**values).on_conflict_do_nothing(
+            index_elements=["entity_type", "entity_id", "user_email"]
+        )
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(database.Vote).values(**values).on_conflict_do_nothing(constraint="uq_vote")
+    from sqlalchemy.dialects.mysql import insert
+    return insert(database.Vote).values(**values).prefix_with("IGNORE")
+
+
+async def adjust_vote_counters(db: AsyncSession, entity_type: str, entity_id: int, deltas: dict[str, int]):
+    """Apply counter deltas with UPDATE ... SET col = col + n, so concurrent voters never lose updates."""
+    model = database.Post if entity_type == "post" else database.Comment
+    values = {
+        VOTE_COUNTER_COLUMNS[vote_type]: getattr(model, VOTE_COUNTER_COLUMNS[vote_type]) + delta
+        for vote_type, delta in deltas.items() if delta
+    }
+    if values:
+        await db.execute(update(model).where(model.id == entity_id).values(**values))
+        if entity_type == "post":
+            await ranking.refresh_hot_scores(db, entity_id)
+
+
+async def apply_vote(db: AsyncSession, entity_type: str, entity_id: int, user_email: str, vote_type: str) -> str:
+    """
+    Toggle a user's vote on an entity and adjust its counters atomically.
+    Voting the same type again removes the vote, a different type switches it.
+    Every vote-row change is conditional on the state it was read in, and the
+    counters only move when that change actually hit a row.
+    Returns "removed", "updated" or "recorded". The caller commits.
+    """
+    vote_filter = (
+        database.Vote.entity_type == entity_type,
+        database.Vote.entity_id == entity_id,
+        database.Vote.user_email == user_email,
+    )
+    for _ in range(VOTE_RETRIES):
+        existing = await db.scalar(vote_type_statement(entity_type, entity_id, user_email).with_for_update())
+        if existing == vote_type:
+            result = await db.execute(delete(database.Vote).where(*vote_filter, database.Vote.vote_type == existing))
+            if result.rowcount:
+                await adjust_vote_counters(db, entity_type, entity_id, {existing: -1})
+                return "removed"
+        elif existing is not None:
+            result = await db.execute(
+                update(database.Vote).where(*vote_filter, database.Vote.vote_type == existing).values(vote_type=vote_type)
+            )
+            if result.rowcount:
+                await adjust_vote_counters(db, entity_type, entity_id, {existing: -1, vote_type: 1})
+                return "updated"
+        else:
+            result = await db.execute(_insert_vote_if_absent(db, {
+                "entity_type": entity_type,
+                "entity_id": entity_id,
+                "user_email": user_email,
+                "vote_type": vote_type,
+            }))
+            if result.rowcount:
+                await adjust_vote_counters(db, entity_type, entity_id, {vote_type: 1})
+                return "recorded"
+        # A concurrent request by the same user changed the vote row first: re-read and retry
+    raise HTTPException(status_code=409, detail="Vote conflict, please retry")
+
+
+def favorite_statement(post_id: int, user_email: str):
+    return select(database.Favorite).where(
+        database.Favorite.post_id == post_id,
+        database.Favorite.user_email == user_email
+    )
+
+
+def ensure_not_banned(user: database.User | auth.Principal):
     if user.is_banned:
         raise HTTPException(status_code=403, detail="User is banned")
 
 
-def ensure_admin(user: database.User):
+def ensure_admin(user: database.User | auth.Principal):
     if not user.is_admin:
         raise HTTPException(status_code=403, detail="Admin permission required")
 
 
-def get_sensitive_words(db: Session) -> list[str]:
-    """Fetch sensitive words from database, fallback to hardcoded list."""
-    try:
-        words = db.query(database.SensitiveWord.word).all()
-        if words:
-            return [w[0] for w in words]
-    except Exception:
-        pass
-    return list(FALLBACK_SENSITIVE_WORDS)
-
-
-def validate_no_sensitive_words(db: Session, *texts: str):
-    """Check texts against sensitive words from database."""
-    words = get_sensitive_words(db)
+async def validate_no_sensitive_words(db: AsyncSession, *texts: str):
+    """Check texts against sensitive words and report every word found."""
+    matcher = await sensitive_words.word_cache.get_matcher(db)
+    found = []
     for text_content in texts:
         if not text_content:
             continue
-        for word in words:
-            if word and word in text_content:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"内容包含敏感词「{word}」，请修改后再提交"
-                )
+        for word in matcher.find_all(text_content):
+            if word not in found:
+                found.append(word)
+    if found:
+        raise HTTPException(
+            status_code=400,
+            detail=f"内容包含敏感词{''.join(f'「{word}」' for word in found)}，请修改后再提交"
+        )
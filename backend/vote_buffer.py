@@ -0,0 +1,159 @@
+"""
+Optional write-behind buffering for votes (VOTE_WRITE_BEHIND=1).
+
+Instead of committing a vote row, a counter update and a notification per
+request, votes are recorded in an in-process buffer keyed by
+(entity_type, entity_id, user_email). Repeated toggles by the same user
+collapse into a single final state, and a background job flushes the buffer
+every VOTE_FLUSH_INTERVAL seconds in one transaction, through the same
+atomic apply_vote path used in direct mode, and hands the resulting vote
+notifications to the notification digest.
+
+Reads stay consistent with the buffer: counters and vote status returned by
+this worker include the votes that are still waiting to be flushed.
+Buffered votes live only in this worker's memory until the next flush, so a
+crash loses at most one interval of votes.
+"""
+import logging
+import os
+from collections import Counter
+from dataclasses import dataclass
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+import database
+import http_cache
+import notification_digest
+from utils import apply_vote, vote_type_statement
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("VOTE_WRITE_BEHIND", "0") == "1"
+FLUSH_INTERVAL = float(os.getenv("VOTE_FLUSH_INTERVAL", "1"))
+
+
+@dataclass
+class PendingVote:
+    base: str | None  # vote_type in the database when buffering started
+    current: str | None  # vote_type after all buffered toggles
+    notification: notification_digest.VoteEvent | None = None  # event of the latest toggle
+
+
+class VoteBuffer:
+    def __init__(self):
+        self.pending: dict[tuple[str, int, str], PendingVote] = {}
+        self.flushing: dict[tuple[str, int, str], PendingVote] = {}
+        # Net counter change per (entity_type, entity_id) not yet visible in the database
+        self.deltas: dict[tuple[str, int], Counter] = {}
+
+    def _move(self, entity: tuple[str, int], old: str | None, new: str | None):
+        delta = self.deltas.setdefault(entity, Counter())
+        if old:
+            delta[old] -= 1
+        if new:
+            delta[new] += 1
+        http_cache.invalidate_local()
+
+    async def toggle(
+        self,
+        db: AsyncSession,
+        entity_type: str,
+        entity_id: int,
+        user_email: str,
+        vote_type: str,
+        notification: notification_digest.VoteEvent | None = None
+    ) -> str:
+        """Buffer a vote toggle; returns "removed", "updated" or "recorded" like apply_vote."""
+        key = (entity_type, entity_id, user_email)
+        entry = self.pending.get(key)
+        if entry is None:
+            if key in self.flushing:
+                base = self.flushing[key].current
+            else:
+                base = await db.scalar(vote_type_statement(entity_type, entity_id, user_email))
+            entry = self.pending.setdefault(key, PendingVote(base=base, current=base))
+
+        old = entry.current
+        entry.notification = notification
+        if old == vote_type:
+            entry.current = None
+            outcome = "removed"
+        else:
+            entry.current = vote_type
+            outcome = "updated" if old else "recorded"
+        self._move((entity_type, entity_id), old, entry.current)
+        return outcome
+
+    def vote_type(self, entity_type: str, entity_id: int, user_email: str) -> tuple[bool, str | None]:
+        """Return (True, vote_type) when the user's vote on the entity is still buffered."""
+        key = (entity_type, entity_id, user_email)
+        entry = self.pending.get(key) or self.flushing.get(key)
+        if entry is None:
+            return False, None
+        return True, entry.current
+
+    def user_votes(self, entity_type: str, user_email: str) -> dict[int, str | None]:
+        """The user's still buffered votes on entities of one type, by entity id."""
+        votes = {}
+        for entries in (self.flushing, self.pending):
+            for (kind, entity_id, email), entry in entries.items():
+                if kind == entity_type and email == user_email:
+                    votes[entity_id] = entry.current
+        return votes
+
+    def overlay(self, entity_type: str, item: dict, entity_id: int | None = None) -> dict:
+        """Add buffered counter changes to a serialized post/comment dict."""
+        delta = self.deltas.get((entity_type, item["id"] if entity_id is None else entity_id))
+        if delta:
+            item["upvotes"] += delta["upvote"]
+            item["downvotes"] += delta["downvote"]
+        return item
+
+    async def _invalidate_responses(self, db: AsyncSession):
+        post_ids = {entity_id for entity_type, entity_id, _ in self.flushing if entity_type == "post"}
+        comment_ids = {entity_id for entity_type, entity_id, _ in self.flushing if entity_type == "comment"}
+        if post_ids:
+            await http_cache.invalidate_post_counters(db, *sorted(post_ids))
+        if comment_ids:
+            comment_post_ids = set((await db.scalars(
+                select(database.Comment.post_id).where(database.Comment.id.in_(comment_ids))
+            )).all())
+            for post_id in sorted(comment_post_ids - post_ids):
+                await http_cache.invalidate_comments(db, post_id)
+
+    async def flush(self):
+        if not self.pending or self.flushing:
+            return
+        self.flushing, self.pending = self.pending, {}
+        notifications = []
+        try:
+            async with database.AsyncSessionLocal() as db:
+                for (entity_type, entity_id, user_email), entry in self.flushing.items():
+                    if entry.current == entry.base:
+                        continue
+                    outcome = await apply_vote(db, entity_type, entity_id, user_email, entry.current or entry.base)
+                    if entry.notification:
+                        entry.notification.removed = outcome == "removed"
+                        notifications.append(entry.notification)
+                await self._invalidate_responses(db)
+                await db.commit()
+        except Exception:
+            logger.exception("Vote buffer flush failed; keeping %d votes for the next flush", len(self.flushing))
+            for key, entry in self.flushing.items():
+                newer = self.pending.get(key)
+                if newer is None:
+                    self.pending[key] = entry
+                else:
+                    newer.base = entry.base
+                    newer.notification = newer.notification or entry.notification
+            self.flushing = {}
+            return
+
+        for event in notifications:
+            notification_digest.digest.record(event)
+        for (entity_type, entity_id, _), entry in self.flushing.items():
+            self._move((entity_type, entity_id), entry.current, entry.base)
+        self.flushing = {}
+        self.deltas = {entity: delta for entity, delta in self.deltas.items() if any(delta.values())}
+
+
+buffer = VoteBuffer()
@@ -82,7 +82,7 @@ async function updateNavbar() {
             <a href="profile.html" class="btn btn-sm btn-secondary">我的主页</a>
             <button onclick="logout()" class="btn btn-sm" style="background:#dc3545">退出</button>
         `;
-        updateNotificationBadge();
+        startNotificationStream();
     } else {
         authContainer.innerHTML = `
             <a href="login.html" class="btn btn-sm">登录</a>
@@ -91,21 +91,63 @@ async function updateNavbar() {
     }
 }
 
-async function updateNotificationBadge() {
+let unreadNotifications = 0;
+let notificationStream = null;
+
+function renderNotificationBadge() {
     const link = document.getElementById('notification-link');
     if (!link) return;
-    const response = await authFetch('/notifications');
+    link.textContent = unreadNotifications > 0 ? `🔔 通知(${unreadNotifications})` : '🔔 通知';
+}
+
+async function updateNotificationBadge() {
+    const response = await authFetch('/notifications/unread-count');
     if (response && response.ok) {
         const data = await response.json();
-        const unread = data.unread_count || 0;
-        if (unread > 0) {
-            link.textContent = `🔔 通知(${unread})`;
-        }
+        unreadNotifications = data.unread_count || 0;
+        renderNotificationBadge();
+    }
+}
+
+// 通过 SSE 接收新通知，替代轮询；浏览器不支持时退回一次性查询
+function startNotificationStream() {
+    if (notificationStream || typeof EventSource === 'undefined') {
+        updateNotificationBadge();
+        return;
     }
+    const url = `${API_BASE_URL}/notifications/stream?token=${encodeURIComponent(getToken())}`;
+    notificationStream = new EventSource(url);
+    notificationStream.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        if (data.type === 'unread') {
+            unreadNotifications = data.unread_count || 0;
+            renderNotificationBadge();
+        } else if (data.type === 'notification') {
+            unreadNotifications += 1;
+            renderNotificationBadge();
+            window.dispatchEvent(new CustomEvent('forum-notification', { detail: data }));
+        } else if (data.type === 'updated') {
+            // 已计入未读数的合并通知有了新的点赞人，只刷新内容
+            window.dispatchEvent(new CustomEvent('forum-notification', { detail: data }));
+        } else if (data.type === 'resync') {
+            updateNotificationBadge();
+            window.dispatchEvent(new CustomEvent('forum-notification', { detail: data }));
+        }
+    };
+    notificationStream.onerror = () => {
+        // 令牌失效时服务器返回 401，停止自动重连
+        if (notificationStream.readyState === EventSource.CLOSED) {
+            notificationStream = null;
+        }
+    };
 }
 
 // 全局退出函数
 function logout() {
+    if (notificationStream) {
+        notificationStream.close();
+        notificationStream = null;
+    }
     removeToken();
     localStorage.removeItem('user_email');
     window.location.href = "index.html";
@@ -1,6 +1,7 @@
 let currentTag = '全部';
 let currentKeyword = '';
 let currentBoardId = null;
+let currentSort = 'new';
 let tagsCollapsed = false;
 let currentPage = 1;
 const PAGE_SIZE = 20;
@@ -11,12 +12,25 @@ let hasPreferredTags = false;
 
 document.addEventListener('DOMContentLoaded', async () => {
     await loadUserPreferences();
-    await loadBoards();
-    await loadTrendingSearches();
-    await loadTagFilters();
-    await loadPosts();
+    // 首页数据一次取回；取不到时各部分再单独请求
+    const snapshot = await fetchBootstrap();
+    await loadBoards(snapshot && snapshot.boards);
+    await loadTrendingSearches(snapshot && snapshot.trending);
+    await loadTagFilters(snapshot && snapshot.tags);
+    await loadPosts(false, snapshot && snapshot.feed);
 });
 
+async function fetchBootstrap() {
+    try {
+        const response = await fetch(`${API_BASE_URL}/bootstrap`);
+        if (!response.ok) return null;
+        return await response.json();
+    } catch (e) {
+        console.error('加载首页数据失败:', e);
+        return null;
+    }
+}
+
 async function loadUserPreferences() {
     if (!isLoggedIn()) return;
     try {
@@ -36,13 +50,15 @@ async function loadUserPreferences() {
     }
 }
 
-async function loadBoards() {
+async function loadBoards(data = null) {
     const container = document.getElementById('boards-nav');
     if (!container) return;
     try {
-        const response = await fetch(`${API_BASE_URL}/boards`);
-        if (!response.ok) return;
-        const data = await response.json();
+        if (!data) {
+            const response = await fetch(`${API_BASE_URL}/boards`);
+            if (!response.ok) return;
+            data = await response.json();
+        }
         const boards = data.boards || [];
         if (boards.length === 0) return;
 
@@ -79,13 +95,15 @@ function selectBoard(boardId, boardName) {
     loadPosts(false);
 }
 
-async function loadTrendingSearches() {
+async function loadTrendingSearches(data = null) {
     const container = document.getElementById('trending-container');
     if (!container) return;
     try {
-        const response = await fetch(`${API_BASE_URL}/trending-searches`);
-        if (!response.ok) return;
-        const data = await response.json();
+        if (!data) {
+            const response = await fetch(`${API_BASE_URL}/trending-searches`);
+            if (!response.ok) return;
+            data = await response.json();
+        }
         const trending = data.trending || [];
         if (trending.length === 0) {
             container.style.display = 'none';
@@ -106,7 +124,7 @@ async function loadTrendingSearches() {
     }
 }
 
-async function loadTagFilters() {
+async function loadTagFilters(data = null) {
     const container = document.getElementById('tag-filter-container');
     if (!container) return;
     container.innerHTML = '';
@@ -118,9 +136,11 @@ async function loadTagFilters() {
     container.appendChild(defaultBtn);
 
     try {
-        const response = await fetch(`${API_BASE_URL}/tags`);
-        if (!response.ok) return;
-        const data = await response.json();
+        if (!data) {
+            const response = await fetch(`${API_BASE_URL}/tags`);
+            if (!response.ok) return;
+            data = await response.json();
+        }
         (data.tags || []).forEach(tag => {
             if (tag === '全部') return;
             const tagBtn = document.createElement('button');
@@ -142,6 +162,12 @@ function toggleTags() {
     }
 }
 
+function selectSort(sort) {
+    currentSort = sort;
+    currentPage = 1;
+    loadPosts(false);
+}
+
 function selectTag(tag) {
     currentTag = tag;
     currentPage = 1;
@@ -172,7 +198,7 @@ function isPreferredTag(tag) {
     return userPreferredTags.includes(tag);
 }
 
-async function loadPosts(append = false) {
+async function loadPosts(append = false, data = null) {
     if (isLoadingPosts) return;
     isLoadingPosts = true;
     const container = document.getElementById('posts-container');
@@ -181,19 +207,22 @@ async function loadPosts(append = false) {
     }
 
     try {
-        const query = new URLSearchParams();
-        if (currentTag && currentTag !== '全部') query.append('tag', currentTag);
-        if (currentKeyword) query.append('keyword', currentKeyword);
-        if (currentBoardId !== null) query.append('board_id', currentBoardId);
-        query.append('page', currentPage);
-        query.append('page_size', PAGE_SIZE);
-        const response = await fetch(`${API_BASE_URL}/posts/?${query.toString()}`);
-
-        if (!response.ok) {
-            throw new Error('获取帖子失败');
-        }
+        if (!data) {
+            const query = new URLSearchParams();
+            if (currentTag && currentTag !== '全部') query.append('tag', currentTag);
+            if (currentKeyword) query.append('keyword', currentKeyword);
+            if (currentBoardId !== null) query.append('board_id', currentBoardId);
+            if (currentSort !== 'new') query.append('sort', currentSort);
+            query.append('page', currentPage);
+            query.append('page_size', PAGE_SIZE);
+            const response = await fetch(`${API_BASE_URL}/posts/?${query.toString()}`);
+
+            if (!response.ok) {
+                throw new Error('获取帖子失败');
+            }
 
-        const data = await response.json();
+            data = await response.json();
+        }
         const posts = data.posts || [];
         const total = data.total || 0;
         totalPages = data.total_pages || 1;
@@ -281,7 +310,7 @@ async function loadPosts(append = false) {
                 const left = document.createElement('span');
                 left.textContent = `作者: ${post.user_name} | 时间: ${post.release_time}`;
                 const right = document.createElement('span');
-                right.textContent = `👍 ${post.upvotes} 👎 ${post.downvotes}`;
+                right.textContent = `👍 ${post.upvotes} 👎 ${post.downvotes} 💬 ${post.comment_count || 0}`;
                 metaEl.appendChild(left);
                 metaEl.appendChild(right);
 
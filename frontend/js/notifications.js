@@ -3,11 +3,15 @@ if (!isLoggedIn()) {
     window.location.href = "login.html";
 }
 
-document.addEventListener('DOMContentLoaded', loadNotifications);
+document.addEventListener('DOMContentLoaded', () => loadNotifications());
+window.addEventListener('forum-notification', () => loadNotifications());
 
-async function loadNotifications() {
+let nextCursor = null;
+
+async function loadNotifications(append = false) {
     const container = document.getElementById('notifications-list');
-    const response = await authFetch('/notifications');
+    const url = append && nextCursor ? `/notifications?cursor=${encodeURIComponent(nextCursor)}` : '/notifications';
+    const response = await authFetch(url);
     if (!(response && response.ok)) {
         container.innerHTML = '<p style="color:red;">加载通知失败</p>';
         return;
@@ -15,12 +19,18 @@ async function loadNotifications() {
 
     const data = await response.json();
     const notifications = data.notifications || [];
-    if (notifications.length === 0) {
+    nextCursor = data.next_cursor;
+    if (!append && notifications.length === 0) {
         container.innerHTML = '<p style="text-align:center; color:#888;">暂无通知</p>';
         return;
     }
 
-    container.innerHTML = '';
+    if (append) {
+        const oldMore = document.getElementById('load-more-notifications');
+        if (oldMore) oldMore.remove();
+    } else {
+        container.innerHTML = '';
+    }
     notifications.forEach(item => {
         const card = document.createElement('div');
         card.className = 'post-card';
@@ -50,12 +60,22 @@ async function loadNotifications() {
         }
         container.appendChild(card);
     });
+
+    if (nextCursor) {
+        const more = document.createElement('button');
+        more.id = 'load-more-notifications';
+        more.className = 'btn btn-sm btn-secondary';
+        more.textContent = '加载更多';
+        more.onclick = () => loadNotifications(true);
+        container.appendChild(more);
+    }
 }
 
 async function markRead(id) {
     const response = await authFetch(`/notifications/${id}/read`, { method: 'PUT' });
     if (response && response.ok) {
         loadNotifications();
+        updateNotificationBadge();
     }
 }
 
@@ -63,5 +83,6 @@ async function markAllRead() {
     const response = await authFetch('/notifications/read-all', { method: 'PUT' });
     if (response && response.ok) {
         loadNotifications();
+        updateNotificationBadge();
     }
 }
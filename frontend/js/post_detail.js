@@ -2,6 +2,9 @@
 const urlParams = new URLSearchParams(window.location.search);
 const postId = urlParams.get('id');
 let isCurrentUserAdmin = false;
+let nextCommentCursor = null;
+let commentSort = 'time';
+let isLoadingComments = false;
 
 // 获取用户邮箱的辅助函数
 function getUserEmail() {
@@ -22,41 +25,33 @@ document.addEventListener('DOMContentLoaded', async () => {
         return;
     }
     await loadPostDetail();
-    await loadComments();
 });
 
+// 帖子、评论第一页和当前用户的投票/收藏状态由 /posts/{id}/view 一次返回
+async function fetchPostView(commentCursor = null) {
+    const params = new URLSearchParams();
+    if (commentCursor) params.set('comment_cursor', commentCursor);
+    if (commentSort !== 'time') params.set('comment_sort', commentSort);
+    const query = params.toString();
+    return authFetch(`/posts/${postId}/view${query ? `?${query}` : ''}`);
+}
+
 async function loadPostDetail() {
     const container = document.getElementById('post-container');
     container.innerHTML = '<p>加载中...</p>';
 
     try {
-        const response = await fetch(`${API_BASE_URL}/posts/${postId}`);
+        const response = await fetchPostView();
         
-        if (response.ok) {
-            const post = await response.json();
+        if (response && response.ok) {
+            const data = await response.json();
+            const post = data.post;
+            const viewer = data.viewer;
             
-            // 获取用户投票状态（如果已登录）
-            let userVote = null;
-            let isFavorited = false;
-            if (isLoggedIn()) {
-                const meResponse = await authFetch('/users/me');
-                if (meResponse && meResponse.ok) {
-                    const me = await meResponse.json();
-                    isCurrentUserAdmin = !!me.is_admin;
-                }
-                const voteResponse = await authFetch(`/posts/${postId}/vote`);
-                if (voteResponse && voteResponse.ok) {
-                    const voteData = await voteResponse.json();
-                    userVote = voteData.vote_type;
-                }
-                
-                // 获取收藏状态
-                const favoriteResponse = await authFetch(`/posts/${postId}/favorite`);
-                if (favoriteResponse && favoriteResponse.ok) {
-                    const favoriteData = await favoriteResponse.json();
-                    isFavorited = favoriteData.is_favorited;
-                }
-            }
+            // 当前用户的投票、收藏状态（已登录时由接口一并返回）
+            const userVote = viewer ? viewer.vote_type : null;
+            const isFavorited = viewer ? viewer.is_favorited : false;
+            isCurrentUserAdmin = viewer ? !!viewer.is_admin : false;
             
             // 渲染帖子内容 - Use DOM API to prevent XSS
             container.innerHTML = '';
@@ -233,8 +228,25 @@ async function loadPostDetail() {
             const commentsSection = document.createElement('div');
             commentsSection.className = 'comments-section';
             const commentsTitle = document.createElement('h3');
-            commentsTitle.textContent = '评论区';
+            commentsTitle.textContent = `评论区 (${post.comment_count || 0})`;
             commentsSection.appendChild(commentsTitle);
+
+            // 评论排序：最早 / 最热
+            const sortSelect = document.createElement('select');
+            sortSelect.id = 'comment-sort';
+            sortSelect.style.marginBottom = '15px';
+            [['time', '按时间'], ['top', '按热度']].forEach(([value, label]) => {
+                const option = document.createElement('option');
+                option.value = value;
+                option.textContent = label;
+                sortSelect.appendChild(option);
+            });
+            sortSelect.value = commentSort;
+            sortSelect.onchange = () => {
+                commentSort = sortSelect.value;
+                loadComments(false);
+            };
+            commentsSection.appendChild(sortSelect);
             
             // Comment form (if logged in)
             if (isLoggedIn()) {
@@ -311,6 +323,8 @@ async function loadPostDetail() {
             backBtn.textContent = '返回列表';
             backBtn.onclick = () => history.back();
             container.appendChild(backBtn);
+
+            renderComments(data.comments, viewer, false);
         } else {
             container.innerHTML = '<h2>帖子不存在或已被删除</h2><br><a href="index.html">返回首页</a>';
         }
@@ -367,119 +381,157 @@ async function votePost(voteType) {
     }
 }
 
-async function loadComments() {
+async function loadComments(append = false) {
     const container = document.getElementById('comments-container');
-    if (!container) return;
+    if (!container || isLoadingComments) return;
+    isLoadingComments = true;
 
     try {
-        const response = await fetch(`${API_BASE_URL}/posts/${postId}/comments`);
+        const response = await fetchPostView(append ? nextCommentCursor : null);
         
-        if (response.ok) {
-            const comments = await response.json();
-            
-            if (comments.length === 0) {
-                container.innerHTML = '<p style="text-align: center; color: #888;">暂无评论，快来抢沙发吧！</p>';
-                return;
-            }
-            
-            container.innerHTML = '';
-            comments.forEach(comment => {
-                const commentDiv = document.createElement('div');
-                commentDiv.className = 'comment-item';
-                
-                // Comment header
-                const headerDiv = document.createElement('div');
-                headerDiv.className = 'comment-header';
-                
-                const authorStrong = document.createElement('strong');
-                authorStrong.textContent = comment.user_name;
-                headerDiv.appendChild(authorStrong);
-                
-                const timeSpan = document.createElement('span');
-                timeSpan.style.color = '#888';
-                timeSpan.style.fontSize = '0.9em';
-                timeSpan.style.marginLeft = '10px';
-                timeSpan.textContent = comment.release_time;
-                headerDiv.appendChild(timeSpan);
-                
-                commentDiv.appendChild(headerDiv);
-                
-                // Comment content
-                const contentDiv = document.createElement('div');
-                contentDiv.className = 'comment-content';
-                contentDiv.textContent = comment.content;
-                commentDiv.appendChild(contentDiv);
-                
-                // Comment image (if exists)
-                if (comment.image_url && comment.image_url.trim() !== '') {
-                    const imageEl = document.createElement('img');
-                    imageEl.src = comment.image_url;
-                    imageEl.alt = 'Comment image';
-                    imageEl.style.maxWidth = '100%';
-                    imageEl.style.maxHeight = '300px';
-                    imageEl.style.objectFit = 'contain';
-                    imageEl.style.borderRadius = '8px';
-                    imageEl.style.marginTop = '10px';
-                    imageEl.style.display = 'block';
-                    commentDiv.appendChild(imageEl);
-                }
-                
-                // Comment actions
-                const actionsDiv = document.createElement('div');
-                actionsDiv.className = 'comment-actions';
-                actionsDiv.style.marginTop = '10px';
-                actionsDiv.style.display = 'flex';
-                actionsDiv.style.gap = '10px';
-                
-                const upvoteBtn = document.createElement('button');
-                upvoteBtn.className = 'vote-btn-small';
-                upvoteBtn.id = `comment-upvote-${comment.id}`;
-                upvoteBtn.onclick = () => voteComment(comment.id, 'upvote');
-                upvoteBtn.innerHTML = `👍 <span id="comment-upvote-count-${comment.id}">${comment.upvotes}</span>`;
-                actionsDiv.appendChild(upvoteBtn);
-                
-                const downvoteBtn = document.createElement('button');
-                downvoteBtn.className = 'vote-btn-small';
-                downvoteBtn.id = `comment-downvote-${comment.id}`;
-                downvoteBtn.onclick = () => voteComment(comment.id, 'downvote');
-                downvoteBtn.innerHTML = `👎 <span id="comment-downvote-count-${comment.id}">${comment.downvotes}</span>`;
-                actionsDiv.appendChild(downvoteBtn);
-
-                if (isLoggedIn()) {
-                    // Report button for all logged in users
-                    const reportBtn = document.createElement('button');
-                    reportBtn.className = 'btn btn-secondary btn-sm';
-                    reportBtn.textContent = '举报';
-                    reportBtn.onclick = () => reportComment(comment.id);
-                    actionsDiv.appendChild(reportBtn);
-
-                    // Edit and delete buttons for comment author
-                    if (getUserEmail() === comment.user_email) {
-                        const editBtn = document.createElement('button');
-                        editBtn.className = 'btn btn-secondary btn-sm';
-                        editBtn.textContent = '编辑';
-                        editBtn.onclick = () => editComment(comment);
-                        actionsDiv.appendChild(editBtn);
-
-                        const deleteBtn = document.createElement('button');
-                        deleteBtn.className = 'btn btn-sm';
-                        deleteBtn.style.backgroundColor = '#dc3545';
-                        deleteBtn.textContent = '删除';
-                        deleteBtn.onclick = () => deleteComment(comment.id);
-                        actionsDiv.appendChild(deleteBtn);
-                    }
-                }
-                
-                commentDiv.appendChild(actionsDiv);
-                
-                container.appendChild(commentDiv);
-            });
+        if (response && response.ok) {
+            const data = await response.json();
+            renderComments(data.comments, data.viewer, append);
         } else {
             container.innerHTML = '<p style="color: red;">加载评论失败</p>';
         }
     } catch (error) {
         console.error("加载评论失败:", error);
         container.innerHTML = '<p style="color: red;">加载评论失败</p>';
+    } finally {
+        isLoadingComments = false;
+    }
+}
+
+// 滚动到"加载更多"按钮附近时自动加载下一页评论
+const commentsObserver = 'IntersectionObserver' in window
+    ? new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) loadComments(true);
+    }, { rootMargin: '200px' })
+    : null;
+
+function renderComments(page, viewer, append) {
+    const container = document.getElementById('comments-container');
+    if (!container) return;
+
+    const comments = page.items;
+    const commentVotes = viewer ? viewer.comment_votes : {};
+    nextCommentCursor = page.next_cursor;
+
+    if (!append && comments.length === 0) {
+        container.innerHTML = '<p style="text-align: center; color: #888;">暂无评论，快来抢沙发吧！</p>';
+        return;
+    }
+
+    if (append) {
+        const oldMore = document.getElementById('load-more-comments');
+        if (oldMore) oldMore.remove();
+    } else {
+        container.innerHTML = '';
+    }
+    comments.forEach(comment => {
+        const commentDiv = document.createElement('div');
+        commentDiv.className = 'comment-item';
+        
+        // Comment header
+        const headerDiv = document.createElement('div');
+        headerDiv.className = 'comment-header';
+        
+        const authorStrong = document.createElement('strong');
+        authorStrong.textContent = comment.user_name;
+        headerDiv.appendChild(authorStrong);
+        
+        const timeSpan = document.createElement('span');
+        timeSpan.style.color = '#888';
+        timeSpan.style.fontSize = '0.9em';
+        timeSpan.style.marginLeft = '10px';
+        timeSpan.textContent = comment.release_time;
+        headerDiv.appendChild(timeSpan);
+        
+        commentDiv.appendChild(headerDiv);
+        
+        // Comment content
+        const contentDiv = document.createElement('div');
+        contentDiv.className = 'comment-content';
+        contentDiv.textContent = comment.content;
+        commentDiv.appendChild(contentDiv);
+        
+        // Comment image (if exists)
+        if (comment.image_url && comment.image_url.trim() !== '') {
+            const imageEl = document.createElement('img');
+            imageEl.src = comment.image_url;
+            imageEl.alt = 'Comment image';
+            imageEl.style.maxWidth = '100%';
+            imageEl.style.maxHeight = '300px';
+            imageEl.style.objectFit = 'contain';
+            imageEl.style.borderRadius = '8px';
+            imageEl.style.marginTop = '10px';
+            imageEl.style.display = 'block';
+            commentDiv.appendChild(imageEl);
+        }
+        
+        // Comment actions
+        const actionsDiv = document.createElement('div');
+        actionsDiv.className = 'comment-actions';
+        actionsDiv.style.marginTop = '10px';
+        actionsDiv.style.display = 'flex';
+        actionsDiv.style.gap = '10px';
+        
+        const upvoteBtn = document.createElement('button');
+        upvoteBtn.className = `vote-btn-small ${commentVotes[comment.id] === 'upvote' ? 'active-upvote' : ''}`;
+        upvoteBtn.id = `comment-upvote-${comment.id}`;
+        upvoteBtn.onclick = () => voteComment(comment.id, 'upvote');
+        upvoteBtn.innerHTML = `👍 <span id="comment-upvote-count-${comment.id}">${comment.upvotes}</span>`;
+        actionsDiv.appendChild(upvoteBtn);
+        
+        const downvoteBtn = document.createElement('button');
+        downvoteBtn.className = `vote-btn-small ${commentVotes[comment.id] === 'downvote' ? 'active-downvote' : ''}`;
+        downvoteBtn.id = `comment-downvote-${comment.id}`;
+        downvoteBtn.onclick = () => voteComment(comment.id, 'downvote');
+        downvoteBtn.innerHTML = `👎 <span id="comment-downvote-count-${comment.id}">${comment.downvotes}</span>`;
+        actionsDiv.appendChild(downvoteBtn);
+
+        if (isLoggedIn()) {
+            // Report button for all logged in users
+            const reportBtn = document.createElement('button');
+            reportBtn.className = 'btn btn-secondary btn-sm';
+            reportBtn.textContent = '举报';
+            reportBtn.onclick = () => reportComment(comment.id);
+            actionsDiv.appendChild(reportBtn);
+
+            // Edit and delete buttons for comment author
+            if (getUserEmail() === comment.user_email) {
+                const editBtn = document.createElement('button');
+                editBtn.className = 'btn btn-secondary btn-sm';
+                editBtn.textContent = '编辑';
+                editBtn.onclick = () => editComment(comment);
+                actionsDiv.appendChild(editBtn);
+
+                const deleteBtn = document.createElement('button');
+                deleteBtn.className = 'btn btn-sm';
+                deleteBtn.style.backgroundColor = '#dc3545';
+                deleteBtn.textContent = '删除';
+                deleteBtn.onclick = () => deleteComment(comment.id);
+                actionsDiv.appendChild(deleteBtn);
+            }
+        }
+        
+        commentDiv.appendChild(actionsDiv);
+        
+        container.appendChild(commentDiv);
+    });
+
+    if (nextCommentCursor) {
+        const more = document.createElement('button');
+        more.id = 'load-more-comments';
+        more.className = 'btn btn-sm btn-secondary';
+        more.textContent = '加载更多评论';
+        more.onclick = () => loadComments(true);
+        container.appendChild(more);
+        if (commentsObserver) {
+            commentsObserver.disconnect();
+            commentsObserver.observe(more);
+        }
     }
 }
 
@@ -6,8 +6,10 @@ if (!isLoggedIn()) {
 
 // Constants
 const MAX_PREVIEW_LENGTH = 150;
+const FAVORITES_PAGE_SIZE = 20;
 
 let currentUser = null;
+let favoritesPage = 1;
 
 document.addEventListener('DOMContentLoaded', async () => {
     await loadProfile();
@@ -178,31 +180,50 @@ async function loadUserPosts() {
     }
 }
 
-async function loadUserFavorites() {
+async function loadUserFavorites(append = false) {
     const container = document.getElementById('my-favorites-list');
+    const page = append ? favoritesPage + 1 : 1;
     
     try {
-        const response = await authFetch('/users/me/favorites');
+        const response = await authFetch(`/users/me/favorites?page=${page}&page_size=${FAVORITES_PAGE_SIZE}`);
         
         if (response && response.ok) {
             const posts = await response.json();
+            favoritesPage = page;
             
-            if (posts.length === 0) {
+            if (!append && posts.length === 0) {
                 container.innerHTML = '<p style="text-align:center; color:#888; padding: 40px 0;">还没有收藏任何帖子</p>';
                 return;
             }
             
-            container.innerHTML = '';
+            if (append) {
+                const oldMore = document.getElementById('load-more-favorites');
+                if (oldMore) oldMore.remove();
+            } else {
+                container.innerHTML = '';
+            }
             posts.forEach(post => {
                 const postCard = createPostCard(post);
                 container.appendChild(postCard);
             });
-        } else {
+
+            // 整页说明后面可能还有收藏
+            if (posts.length === FAVORITES_PAGE_SIZE) {
+                const more = document.createElement('button');
+                more.id = 'load-more-favorites';
+                more.className = 'btn btn-sm btn-secondary';
+                more.textContent = '加载更多';
+                more.onclick = () => loadUserFavorites(true);
+                container.appendChild(more);
+            }
+        } else if (!append) {
             container.innerHTML = '<p style="text-align:center; color:red; padding: 40px 0;">加载失败</p>';
         }
     } catch (error) {
         console.error('加载收藏失败:', error);
-        container.innerHTML = '<p style="text-align:center; color:red; padding: 40px 0;">加载失败</p>';
+        if (!append) {
+            container.innerHTML = '<p style="text-align:center; color:red; padding: 40px 0;">加载失败</p>';
+        }
     }
 }
 